@@ -1,7 +1,25 @@
-import toml
+"""FastAPI backend template.
 
-app_info = toml.load("pyproject.toml")["tool"]["poetry"]
+Version metadata comes from the installed package metadata. When running from a source
+checkout without installing the package, it is read from the ``pyproject.toml`` next to
+the package instead, independent of the working directory.
+"""
+from importlib import metadata
+from pathlib import Path
+from typing import Tuple
 
-__version__ = app_info["version"]
-__description__ = app_info["description"]
-__api_title__ = app_info["name"]
+DISTRIBUTION_NAME = "FastAPI Backend Template"
+
+
+def _get_app_info() -> Tuple[str, str, str]:
+    try:
+        info = metadata.metadata(DISTRIBUTION_NAME)
+        return info["Name"], info["Version"], info["Summary"]
+    except metadata.PackageNotFoundError:
+        import toml
+
+        app_info = toml.load(Path(__file__).parent.parent / "pyproject.toml")["tool"]["poetry"]
+        return app_info["name"], app_info["version"], app_info["description"]
+
+
+__api_title__, __version__, __description__ = _get_app_info()
@@ -1,45 +1,155 @@
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.auth.auth_schema import Token, TokenData
-from app.api.auth.auth_utils import create_access_token
+from app.api.auth.auth_schema import RefreshToken, Token, TokenData, TokenRefresh
+from app.api.auth.auth_utils import (
+    create_access_token,
+    create_refresh_token,
+    hash_refresh_token,
+    revoke_refresh_tokens
+)
+from app.api.auth.password_hasher import PasswordHasher
 from app.api.dependencies import get_pwd_context, get_db_session
+from app.api.rate_limits import RateLimit, login_key
+from app.api.users.users_schema import User
 from app.api.users.users_utils import get_user_by_email
-from app.config import settings
+from app.config import get_settings
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 logger = logging.getLogger(__name__)
 
 
-@router.post("/token", response_model=Token, description="Login with username and password.")
+def issue_tokens(db: AsyncSession, user: User, family_id: str | None = None) -> Token:
+    """Create an access token and a refresh token, which is added to the session."""
+    settings = get_settings()
+    secret_key = settings.auth.secret_key.get_secret_value()
+    access_token = create_access_token(
+        data=TokenData(sub=user.email).model_dump(mode="json"),
+        secret_key=secret_key,
+        algorithm=settings.auth.algorithm,
+        expires_delta=timedelta(minutes=settings.auth.access_token_expire_minutes)
+    )
+    refresh_token, stored_token = create_refresh_token(
+        user_id=user.id,  # type: ignore[arg-type]
+        secret_key=secret_key,
+        expires_delta=timedelta(days=settings.auth.refresh_token_expire_days),
+        family_id=family_id
+    )
+    db.add(stored_token)
+    return Token(
+        access_token=access_token,
+        token_type="bearer",  # nosec
+        refresh_token=refresh_token
+    )
+
+
+@router.post(
+    "/token",
+    response_model=Token,
+    description="Login with username and password.",
+    dependencies=[Depends(RateLimit("login", key=login_key))]
+)
 async def login(
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-        db: Session = Depends(get_db_session),
-        pwd_context: CryptContext = Depends(get_pwd_context)
+        db: AsyncSession = Depends(get_db_session),
+        pwd_context: PasswordHasher = Depends(get_pwd_context)
 ) -> Token:
-    user = get_user_by_email(db, email=form_data.username)
+    user = await get_user_by_email(db, email=form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    if not pwd_context.verify(form_data.password, user.password_hash):
+    verified, new_password_hash = await pwd_context.verify_and_update(
+        form_data.password, user.password_hash
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(
-        data=TokenData(sub=user.email).model_dump(mode="json"),
-        secret_key=settings.auth.secret_key.get_secret_value(),
-        algorithm=settings.auth.algorithm,
-        expires_delta=timedelta(minutes=settings.auth.access_token_expire_minutes)
+    if new_password_hash:
+        user.password_hash = new_password_hash
+        db.add(user)
+        logger.info("Rehashed outdated password hash for user with id: %s", user.id)
+    token = issue_tokens(db, user)
+    await db.commit()
+    return token
+
+
+@router.post(
+    "/refresh",
+    response_model=Token,
+    description="Exchange a refresh token for a new access token and refresh token."
+)
+async def refresh(
+        token_data: TokenRefresh,
+        db: AsyncSession = Depends(get_db_session)
+) -> Token:
+    """Rotate a refresh token, without verifying the password again.
+
+    Every refresh token is valid once. Presenting a used one again means that it was
+    copied, so all tokens of its family are revoked, logging out both copies.
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    token_hash = hash_refresh_token(
+        token_data.refresh_token, get_settings().auth.secret_key.get_secret_value()
+    )
+    row = (await db.exec(
+        select(RefreshToken, User)
+        .join(User, col(User.id) == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == token_hash)
+        .with_for_update(of=RefreshToken)
+    )).first()
+    if row is None:
+        raise invalid_token
+    refresh_token, user = row
+    if refresh_token.revoked_at is not None:
+        raise invalid_token
+    if refresh_token.used_at is not None:
+        await revoke_refresh_tokens(db, RefreshToken.family_id == refresh_token.family_id)
+        await db.commit()
+        logger.warning("Reuse of refresh token detected for user with id: %s", user.id)
+        raise invalid_token
+    if refresh_token.expires_at <= datetime.utcnow() or user.deleted_at is not None:
+        raise invalid_token
+    refresh_token.used_at = datetime.utcnow()
+    db.add(refresh_token)
+    token = issue_tokens(db, user, family_id=refresh_token.family_id)
+    await db.commit()
+    return token
+
+
+@router.post(
+    "/revoke",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+    description="Revoke a refresh token and the tokens it was rotated from or into."
+)
+async def revoke(
+        token_data: TokenRefresh,
+        db: AsyncSession = Depends(get_db_session)
+) -> Response:
+    # Unknown tokens are accepted as well, like RFC 7009 recommends.
+    token_hash = hash_refresh_token(
+        token_data.refresh_token, get_settings().auth.secret_key.get_secret_value()
     )
-    return Token(access_token=access_token, token_type="bearer")  # nosec
+    refresh_token = (await db.exec(
+        select(RefreshToken).where(RefreshToken.token_hash == token_hash)
+    )).first()
+    if refresh_token is not None:
+        await revoke_refresh_tokens(db, RefreshToken.family_id == refresh_token.family_id)
+        await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
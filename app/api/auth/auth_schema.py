@@ -1,10 +1,52 @@
+from datetime import datetime
+
 from pydantic import BaseModel
+from sqlalchemy import ForeignKey
+from sqlalchemy.types import BigInteger, DateTime, Integer, String
+from sqlmodel import SQLModel, Field as SQLField
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 
 class TokenData(BaseModel):
     sub: str
+
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
+class RefreshToken(SQLModel, table=True):  # type: ignore
+    """A refresh token, stored as its keyed hash.
+
+    Every refresh replaces the token by a new one of the same family. Presenting a
+    replaced token again revokes the family, see ``auth_router.refresh``.
+    """
+
+    __tablename__ = "refresh_token"
+
+    id: int | None = SQLField(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger().with_variant(Integer, "sqlite")
+    )
+    user_id: int = SQLField(
+        index=True,
+        nullable=False,
+        sa_type=BigInteger,
+        sa_column_args=[ForeignKey("users.id", ondelete="CASCADE")]
+    )
+    family_id: str = SQLField(index=True, nullable=False, sa_type=String)
+    token_hash: str = SQLField(index=True, unique=True, nullable=False, sa_type=String)
+    created_at: datetime = SQLField(
+        default_factory=datetime.utcnow,
+        nullable=False,
+        sa_type=DateTime
+    )
+    expires_at: datetime = SQLField(nullable=False, sa_type=DateTime)
+    used_at: datetime | None = SQLField(default=None, nullable=True, sa_type=DateTime)
+    revoked_at: datetime | None = SQLField(default=None, nullable=True, sa_type=DateTime)
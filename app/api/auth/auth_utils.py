@@ -1,6 +1,17 @@
+import hashlib
+import hmac
+import secrets
+import uuid
 from datetime import datetime, timedelta, timezone
+from typing import Any, Tuple
 
-from jose import jwt
+from sqlalchemy import update
+from sqlmodel import col
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.auth.auth_schema import RefreshToken
+
+REFRESH_TOKEN_BYTES = 32
 
 
 def create_access_token(
@@ -9,6 +20,9 @@ def create_access_token(
         algorithm: str,
         expires_delta: timedelta | None = None
 ) -> str:
+    # Imported on first use, it is one of the slower imports of the app.
+    from jose import jwt
+
     claims = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -16,3 +30,41 @@ def create_access_token(
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     claims.update({"exp": expire})
     return jwt.encode(claims=claims, key=secret_key, algorithm=algorithm)
+
+
+def hash_refresh_token(token: str, secret_key: str) -> str:
+    """Keyed hash of a refresh token as stored.
+
+    Refresh tokens are random rather than chosen by users, so unlike passwords they need
+    no slow hash: an HMAC cannot be reversed, and cannot be computed without the key.
+    """
+    return hmac.new(secret_key.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+
+def create_refresh_token(
+        user_id: int,
+        secret_key: str,
+        expires_delta: timedelta,
+        family_id: str | None = None
+) -> Tuple[str, RefreshToken]:
+    """Create a refresh token, of a new family unless ``family_id`` is given.
+
+    Returns the token for the client and the row to store.
+    """
+    token = secrets.token_urlsafe(REFRESH_TOKEN_BYTES)
+    refresh_token = RefreshToken(
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4().hex,
+        token_hash=hash_refresh_token(token, secret_key),
+        expires_at=datetime.utcnow() + expires_delta
+    )
+    return token, refresh_token
+
+
+async def revoke_refresh_tokens(db: AsyncSession, *criteria: Any) -> None:
+    """Revoke the refresh tokens matching ``criteria``, e.g. of a user or a family."""
+    await db.exec(  # type: ignore[call-overload]
+        update(RefreshToken)
+        .where(col(RefreshToken.revoked_at).is_(None), *criteria)
+        .values(revoked_at=datetime.utcnow())
+    )
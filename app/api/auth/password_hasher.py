@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Tuple, TypeVar
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The pool is started from a threaded worker, and a forked child may deadlock on locks held
+# by the other threads, so hashing processes are started by a fork server instead.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+@functools.cache
+def get_crypt_context() -> Any:
+    """Get the passlib context, imported on first use in the process hashing passwords."""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_password(password: str) -> str:
+    return get_crypt_context().hash(password)
+
+
+def verify_and_update_password(password: str, password_hash: str) -> Tuple[bool, str | None]:
+    return get_crypt_context().verify_and_update(password, password_hash)
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool.
+
+    At most ``max_concurrency`` hashes are in flight and at most ``max_queue`` callers wait
+    for a slot; further callers are rejected with a 503 so a burst of logins cannot stall
+    the event loop or queue up unboundedly. With ``workers=0`` hashing runs in the
+    threadpool instead of a process pool.
+    """
+
+    def __init__(
+            self,
+            workers: int,
+            max_concurrency: int,
+            max_queue: int,
+            retry_after: int
+    ) -> None:
+        self._workers = workers
+        self._max_queue = max_queue
+        self._retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._executor_pid: int | None = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(
+            self,
+            password: str,
+            password_hash: str
+    ) -> Tuple[bool, str | None]:
+        """Verify a password and return a new hash if the stored one is outdated."""
+        return await self._run(verify_and_update_password, password, password_hash)
+
+    def shutdown(self) -> None:
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._semaphore.locked() and self._waiting >= self._max_queue:
+            logger.warning("Password hashing saturated, rejecting request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Service busy, please retry later",
+                headers={"Retry-After": str(self._retry_after)},
+            )
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            if self._workers <= 0:
+                return await run_in_threadpool(func, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._semaphore.release()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # The pool is created lazily and per process, so a forked worker never reuses the
+        # executor (and its pipes) of the process it was forked from.
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers, mp_context=multiprocessing.get_context(START_METHOD)
+            )
+            self._executor_pid = os.getpid()
+        return self._executor
@@ -0,0 +1,139 @@
+"""Archive of the messages of idle chats.
+
+The messages of a chat without new messages for ``ChatSettings.archive_after_days`` are
+moved out of ``chat_message`` into one compressed row of ``chat_message_archive`` (see
+``app.jobs.chat_storage``). Messages appended later are stored in ``chat_message`` again,
+until the chat is idle once more. Reads combine both, so archiving is invisible to clients.
+
+Appends take timestamps after the chat's last message, so archived messages precede the
+messages in ``chat_message`` by (created_at, id). Reads only load the archive if they reach
+back to the archived messages.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import Any, List, Sequence, cast
+
+from fastapi import Response
+from sqlalchemy import tuple_
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.chats.chats_schema import Chat, ChatMessage, ChatMessageArchive, Role
+from app.api.pagination import PageParams, decode_cursor, fetch_page, page_items
+
+ARCHIVE_COMPRESSION_LEVEL = 9
+MESSAGE_KEYS: List[Any] = [ChatMessage.created_at, ChatMessage.id]
+
+
+def encode_messages(messages: Sequence[ChatMessage]) -> bytes:
+    rows = [
+        [message.id, message.role.value, message.content, message.created_at.isoformat()]
+        for message in messages
+    ]
+    return zlib.compress(
+        json.dumps(rows, separators=(",", ":")).encode(), ARCHIVE_COMPRESSION_LEVEL
+    )
+
+
+def decode_messages(chat_id: int, data: bytes) -> List[ChatMessage]:
+    return [
+        ChatMessage(
+            id=message_id,
+            chat_id=chat_id,
+            role=Role(role),
+            content=content,
+            created_at=datetime.fromisoformat(created_at)
+        )
+        for message_id, role, content, created_at in json.loads(zlib.decompress(data))
+    ]
+
+
+async def get_last_archived_id(db: AsyncSession, chat: Chat) -> int | None:
+    """Return the id of the last archived message of a chat, ``None`` if it has none.
+
+    The archive stays when messages are appended again, the later messages have larger ids.
+    """
+    if chat.archived_at is None:
+        return None
+    return (await db.exec(
+        select(ChatMessageArchive.last_message_id).where(ChatMessageArchive.chat_id == chat.id)
+    )).first()
+
+
+async def load_archived_messages(
+        db: AsyncSession,
+        chat_id: int,
+        after_id: int | None = None
+) -> List[ChatMessage]:
+    return _merge_archive(chat_id, await db.get(ChatMessageArchive, chat_id), [], after_id)
+
+
+async def load_chat_messages(
+        db: AsyncSession,
+        chat_id: int,
+        after_id: int | None = None
+) -> List[ChatMessage]:
+    """Load all messages of a chat with archived messages, ordered by creation.
+
+    Messages are read from ``chat_message`` before the archive, so messages archived in
+    between are found in the archive rather than missed.
+    """
+    statement = select(ChatMessage).where(ChatMessage.chat_id == chat_id)
+    if after_id is not None:
+        statement = statement.where(col(ChatMessage.id) > after_id)
+    live = (await db.exec(
+        statement.order_by(col(ChatMessage.created_at), col(ChatMessage.id))
+    )).all()
+    return _merge_archive(chat_id, await db.get(ChatMessageArchive, chat_id), live, after_id)
+
+
+async def fetch_messages_page(
+        db: AsyncSession,
+        chat: Chat,
+        page: PageParams,
+        response: Response
+) -> List[ChatMessage]:
+    """Fetch one page of the messages of a chat, like ``fetch_page``.
+
+    Pages after the last archived message are read from ``chat_message`` alone. Other pages
+    read at most one page of messages from it, and the archive.
+    """
+    statement = select(ChatMessage).where(ChatMessage.chat_id == chat.id)
+    last_archived_id = await get_last_archived_id(db, chat)
+    if last_archived_id is None or (
+        page.after is not None and decode_cursor(page.after, MESSAGE_KEYS)[1] >= last_archived_id
+    ):
+        return await fetch_page(db, statement, MESSAGE_KEYS, page, response)
+    if page.before is not None:
+        statement = statement.where(
+            tuple_(*MESSAGE_KEYS) < decode_cursor(page.before, MESSAGE_KEYS)
+        ).order_by(*(key.desc() for key in MESSAGE_KEYS))
+    else:
+        statement = statement.order_by(*MESSAGE_KEYS)
+    live = list((await db.exec(statement.limit(page.limit + 1))).all())
+    if page.before is not None:
+        live.reverse()
+        if len(live) > page.limit:
+            # The page and the one before it are after the archived messages.
+            return page_items(live, MESSAGE_KEYS, page, response)
+    messages = _merge_archive(
+        cast(int, chat.id), await db.get(ChatMessageArchive, chat.id), live
+    )
+    return page_items(messages, MESSAGE_KEYS, page, response)
+
+
+def _merge_archive(
+        chat_id: int,
+        archive: ChatMessageArchive | None,
+        live: Sequence[ChatMessage],
+        after_id: int | None = None
+) -> List[ChatMessage]:
+    """Combine the archive with messages of ``chat_message`` read before it."""
+    if archive is None:
+        return list(live)
+    archived = [
+        message for message in decode_messages(chat_id, archive.data)
+        if after_id is None or (message.id or 0) > after_id
+    ]
+    return archived + [message for message in live if (message.id or 0) > archive.last_message_id]
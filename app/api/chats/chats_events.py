@@ -0,0 +1,261 @@
+"""Live chat message events, sent to clients as Server-Sent Events."""
+import asyncio
+import functools
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Sequence, Set, Tuple, cast
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import ColumnElement, FromClause, String, func
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.chats.chats_archive import load_archived_messages
+from app.api.chats.chats_schema import ChatMessage, ChatMessageRead
+from app.api.serialization import dump_json
+from app.api.streaming import STREAM_YIELD_PER
+from app.config import get_settings
+from app.database import get_serving_engine, open_session
+from app.utils.channels import Channel, create_channel
+
+SSE_MEDIA_TYPE = "text/event-stream"
+CHANNEL_NAME = "chat_messages"
+RECONNECT_DELAY_MS = 3000
+
+SSE_RESPONSES: Dict[int | str, Dict[str, Any]] = {
+    200: {"content": {SSE_MEDIA_TYPE: {}}, "description": "Stream of Server-Sent Events."}
+}
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[int, bytes]
+
+
+def format_event(message: ChatMessage) -> Event:
+    message_id = cast(int, message.id)
+    data = dump_json(ChatMessageRead, message)
+    return message_id, b"id: %d\nevent: message\ndata: %s\n\n" % (message_id, data)
+
+
+class Subscription:
+    """Events of one chat for one client.
+
+    Events are queued in batches, at most ``maxsize`` of them. A client not keeping up
+    ends its subscription once it received the queued batches, and resumes from the
+    backlog when it reconnects.
+    """
+
+    def __init__(self, chat_id: int, maxsize: int) -> None:
+        self.chat_id = chat_id
+        self.queue: asyncio.Queue[List[Event] | None] = asyncio.Queue(maxsize)
+        self.ended = False
+
+    def put(self, events: List[Event]) -> None:
+        if self.ended:
+            return
+        try:
+            self.queue.put_nowait(events)
+        except asyncio.QueueFull:
+            self.ended = True
+
+    def end(self) -> None:
+        if not self.ended:
+            self.ended = True
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+
+class ChatMessageBroadcaster:
+    """Fans out appended chat messages to the subscriptions of this process.
+
+    Publishers notify every process through the channel with the range of appended
+    message ids. A process with subscriptions to the chat reads the messages once and
+    queues them for every subscription. If listening fails, notifications may be lost, so
+    all subscriptions end and their clients resume from the backlog.
+    """
+
+    def __init__(self, channel: Channel, queue_size: int) -> None:
+        self.channel = channel
+        self.queue_size = queue_size
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._listener: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+
+    async def publish(
+            self,
+            db: AsyncSession,
+            chat_id: int,
+            messages: Sequence[ChatMessage]
+    ) -> None:
+        """Notify subscribers of messages appended in the current transaction."""
+        if messages:
+            await self.channel.publish(
+                db, json.dumps([chat_id, messages[0].id, messages[-1].id])
+            )
+
+    def notification(self, messages: FromClause) -> ColumnElement[Any] | None:
+        """An aggregate over rows of appended ``messages`` notifying subscribers of them.
+
+        Evaluated in the statement appending the messages, it saves publishing them
+        separately. ``None`` if the channel cannot publish from SQL.
+        """
+        payload = func.json_build_array(
+            func.min(messages.c.chat_id), func.min(messages.c.id), func.max(messages.c.id)
+        ).cast(String)
+        return self.channel.notification(payload)
+
+    async def subscribe(self, chat_id: int) -> Subscription:
+        """Subscribe to the messages of a chat committed from now on."""
+        if self._listener is None or self._listener.done():
+            self._ready = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen(self._ready))
+        subscription = Subscription(chat_id, self.queue_size)
+        self._subscriptions.setdefault(chat_id, set()).add(subscription)
+        if not self._ready.is_set():
+            ready = asyncio.create_task(self._ready.wait())
+            await asyncio.wait((ready, self._listener), return_when=asyncio.FIRST_COMPLETED)
+            ready.cancel()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.chat_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self._subscriptions.pop(subscription.chat_id, None)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        self._end_all()
+
+    async def _listen(self, ready: asyncio.Event) -> None:
+        try:
+            async for payload in self.channel.listen(ready):
+                await self._dispatch(payload)
+        except Exception:
+            logger.exception("Listening for chat messages failed")
+        self._end_all()
+
+    async def _dispatch(self, payload: str) -> None:
+        chat_id, first_id, last_id = json.loads(payload)
+        if not self._subscriptions.get(chat_id):
+            return
+        try:
+            # Read from the primary, a replica may not have the messages yet.
+            async with open_session(replica=False) as session:
+                messages = (await session.exec(
+                    select(ChatMessage)
+                    .where(
+                        ChatMessage.chat_id == chat_id,
+                        col(ChatMessage.id).between(first_id, last_id)
+                    )
+                    .order_by(col(ChatMessage.id))
+                )).all()
+        except Exception:
+            logger.exception("Reading messages of chat %s failed", chat_id)
+            for subscription in self._subscriptions.get(chat_id, ()):
+                subscription.end()
+            return
+        events = [format_event(message) for message in messages]
+        if events:
+            for subscription in self._subscriptions.get(chat_id, ()):
+                subscription.put(events)
+
+    def _end_all(self) -> None:
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.end()
+
+
+@functools.cache
+def get_broadcaster() -> ChatMessageBroadcaster:
+    settings = get_settings()
+    listen_url = settings.database.listen_url
+    return ChatMessageBroadcaster(
+        create_channel(
+            CHANNEL_NAME,
+            get_serving_engine(),
+            listen_url=listen_url.get_secret_value() if listen_url else None
+        ),
+        queue_size=settings.chat.stream_queue_size
+    )
+
+
+async def close_broadcaster() -> None:
+    if get_broadcaster.cache_info().currsize:
+        await get_broadcaster().close()
+
+
+def stream_chat_events(
+        chat_id: int,
+        last_event_id: int | None,
+        last_archived_id: int | None = None
+) -> StreamingResponse:
+    """Stream the messages of a chat as Server-Sent Events.
+
+    Messages after ``last_event_id`` are sent first, then new messages as they are
+    committed. A comment is sent as heartbeat when no message was sent for a while, which
+    keeps proxies from closing the connection and detects clients that went away. The
+    archive is read if the backlog starts before ``last_archived_id``.
+    """
+    heartbeat_interval = get_settings().chat.stream_heartbeat_interval
+
+    async def content() -> AsyncIterator[bytes]:
+        broadcaster = get_broadcaster()
+        # Subscribe before reading the backlog, so no message falls in between. Messages
+        # in both are sent once, by id.
+        subscription = await broadcaster.subscribe(chat_id)
+        try:
+            yield b"retry: %d\n\n" % RECONNECT_DELAY_MS
+            sent_id = last_event_id
+            if sent_id is not None and last_archived_id is not None and sent_id < last_archived_id:
+                async with open_session(replica=False) as session:
+                    messages = await load_archived_messages(session, chat_id, sent_id)
+                # Later messages are in chat_message.
+                sent_id = last_archived_id
+                if messages:
+                    yield b"".join(format_event(message)[1] for message in messages)
+                    sent_id = max(sent_id, messages[-1].id or 0)
+            # In batches by id, each read in a session of its own, so a slow client does
+            # not hold a pooled connection while the batch is sent.
+            backlog = sent_id is not None
+            while backlog:
+                async with open_session(replica=False) as session:
+                    rows = (await session.exec(
+                        select(ChatMessage)
+                        .where(ChatMessage.chat_id == chat_id, col(ChatMessage.id) > sent_id)
+                        .order_by(col(ChatMessage.id))
+                        .limit(STREAM_YIELD_PER)
+                    )).all()
+                backlog = len(rows) == STREAM_YIELD_PER
+                if rows:
+                    yield b"".join(format_event(row)[1] for row in rows)
+                    sent_id = rows[-1].id
+            while True:
+                try:
+                    events = await asyncio.wait_for(
+                        subscription.queue.get(), heartbeat_interval
+                    )
+                except asyncio.TimeoutError:
+                    if subscription.ended:
+                        return
+                    yield b": heartbeat\n\n"
+                    continue
+                if events is None:
+                    return
+                frames = [frame for id_, frame in events if sent_id is None or id_ > sent_id]
+                if frames:
+                    yield b"".join(frames)
+                    sent_id = events[-1][0]
+                if subscription.ended and subscription.queue.empty():
+                    return
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        content(),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
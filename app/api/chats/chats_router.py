@@ -1,27 +1,67 @@
 import logging
-from typing import List
+from typing import List, Sequence
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select, col
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+from sqlmodel import select, col
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.api.chats.chats_archive import (
+    fetch_messages_page, get_last_archived_id, load_archived_messages
+)
+from app.api.chats.chats_events import SSE_RESPONSES, get_broadcaster, stream_chat_events
+from app.api.chats.chats_search import (
+    MAX_QUERY_LENGTH, ChatMessageSearchHit, search_messages
+)
 from app.api.chats.chats_schema import (
     Chat, ChatCreate, ChatRead, ChatMessage, ChatMessageCreate, ChatMessageRead
 )
+from app.api.chats.chats_utils import append_chat_messages
+from app.api.conditional import check_not_modified, make_etag
 from app.api.dependencies import get_db_session, get_current_user
+from app.api.pagination import PageParams, fetch_page, get_page_params
+from app.api.rate_limits import RateLimit
+from app.api.serialization import serialize
+from app.api.streaming import NDJSON_RESPONSES, accepts_ndjson, stream_ndjson
 from app.api.users.users_schema import User
+from app.config import get_settings
 
 router = APIRouter(prefix="/users/{user_id}/chats", tags=["chats"])
 
 logger = logging.getLogger(__name__)
 
 
+async def append_messages(
+        db: AsyncSession,
+        user_id: int,
+        chat_id: int,
+        messages_data: Sequence[ChatMessageCreate]
+) -> List[ChatMessage]:
+    chat_messages = await append_chat_messages(
+        db, user_id, chat_id, messages_data, get_broadcaster()
+    )
+    if chat_messages is not None:
+        return chat_messages
+    # Only failed appends look up why.
+    chat_ids = await db.exec(select(Chat.id).where(Chat.id == chat_id, Chat.user_id == user_id))
+    if chat_ids.first() is None:
+        logger.error("Chat not found")
+        raise HTTPException(status_code=404, detail="Chat not found")
+    logger.error("Message roles need to alternate between user and assistant")
+    raise HTTPException(
+        status_code=400,
+        detail="Message roles need to alternate between user and assistant"
+    )
+
+
 @router.post("", response_model=ChatRead)
-def create_chat(
+async def create_chat(
         user_id: int,
         chat_data: ChatCreate,
-        db: Session = Depends(get_db_session),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> ChatRead:
+) -> Response:
     if not current_user.is_admin and user_id != current_user.id:
         logger.error("User not authorized to create chat for another user")
         raise HTTPException(
@@ -30,102 +70,226 @@ def create_chat(
         )
     chat = Chat(**chat_data.model_dump(), user_id=user_id)
     db.add(chat)
-    db.commit()
-    db.refresh(chat)
-    return ChatRead(**chat.model_dump())
+    await db.commit()
+    await db.refresh(chat)
+    return serialize(ChatRead, chat)
 
 
 @router.get("", response_model=List[ChatRead])
-def get_chats(
+async def get_chats(
         user_id: int,
-        db: Session = Depends(get_db_session),
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(get_page_params),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> List[ChatRead]:
+) -> Response:
     if not current_user.is_admin and user_id != current_user.id:
         logger.error("User not authorized to list chats for another user")
         raise HTTPException(status_code=403, detail="Not authorized to list chats for another user")
-    chats = db.exec(select(Chat).where(Chat.user_id == user_id)).all()
-    return [ChatRead(**chat.model_dump()) for chat in chats]
+    # Creating or deleting a chat changes the count or maximum id, appending messages the
+    # summary columns, so the aggregate changes with every change to the listed chats.
+    summary = (await db.exec(
+        select(
+            func.count(),
+            func.max(Chat.id),
+            func.max(Chat.last_message_at),
+            func.sum(Chat.message_count)
+        ).where(Chat.user_id == user_id)
+    )).one()
+    etag = make_etag("chats", user_id, *summary, str(request.query_params))
+    not_modified = check_not_modified(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    chats = await fetch_page(
+        db, select(Chat).where(Chat.user_id == user_id), [Chat.id], page, response
+    )
+    return serialize(List[ChatRead], chats, response)
+
+
+@router.get(
+    "/search",
+    response_model=List[ChatMessageSearchHit],
+    dependencies=[Depends(RateLimit("chat_search"))]
+)
+async def search_chat_messages(
+        user_id: int,
+        response: Response,
+        q: str = Query(min_length=1, max_length=MAX_QUERY_LENGTH, description="Search terms."),
+        page: PageParams = Depends(get_page_params),
+        db: AsyncSession = Depends(get_db_session),
+        current_user: User = Depends(get_current_user)
+) -> Response:
+    """Search the messages of the user's chats, most relevant first."""
+    if not current_user.is_admin and user_id != current_user.id:
+        logger.error("User not authorized to search chats of another user")
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to search chats of another user"
+        )
+    hits = await search_messages(db, user_id, q, page, response)
+    return serialize(List[ChatMessageSearchHit], hits, response)
 
 
 @router.delete("/{chat_id}", response_model=ChatRead)
-def delete_chat(
+async def delete_chat(
         user_id: int,
         chat_id: int,
-        db: Session = Depends(get_db_session),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> ChatRead:
+) -> Response:
     if not current_user.is_admin and user_id != current_user.id:
         logger.error("User not authorized to delete chat for another user")
         raise HTTPException(
             status_code=403,
             detail="Not authorized to delete chat for another user"
         )
-    chat = db.exec(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id)).first()
+    chat = (await db.exec(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id))).first()
     if not chat:
         logger.error("Chat not found")
         raise HTTPException(status_code=404, detail="Chat not found")
-    db.delete(chat)
-    db.commit()
-    return ChatRead(**chat.model_dump())
+    await db.delete(chat)
+    await db.commit()
+    return serialize(ChatRead, chat)
 
 
-@router.post("/{chat_id}/messages", response_model=ChatMessageRead)
-def create_chat_message(
+@router.post(
+    "/{chat_id}/messages",
+    response_model=ChatMessageRead,
+    dependencies=[Depends(RateLimit("chat_messages"))]
+)
+async def create_chat_message(
         user_id: int,
         chat_id: int,
         message_data: ChatMessageCreate,
-        db: Session = Depends(get_db_session),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> ChatMessageRead:
+) -> Response:
     if not current_user.is_admin and user_id != current_user.id:
         logger.error("User not authorized to create chat message for another user")
         raise HTTPException(
             status_code=403,
             detail="Not authorized to create chat message for another user"
         )
-    chat = db.exec(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id)).first()
-    if not chat:
-        logger.error("Chat not found")
-        raise HTTPException(status_code=404, detail="Chat not found")
-    last_message = db.exec(
-        (
-            select(ChatMessage)
-            .where(ChatMessage.chat_id == chat_id)
-            .order_by(col(ChatMessage.created_at).desc())
+    [chat_message] = await append_messages(db, user_id, chat_id, [message_data])
+    await db.commit()
+    return serialize(ChatMessageRead, chat_message)
+
+
+@router.post(
+    "/{chat_id}/messages:batch",
+    response_model=List[ChatMessageRead],
+    dependencies=[Depends(RateLimit("chat_messages"))]
+)
+async def create_chat_messages(
+        user_id: int,
+        chat_id: int,
+        messages_data: List[ChatMessageCreate],
+        db: AsyncSession = Depends(get_db_session),
+        current_user: User = Depends(get_current_user)
+) -> Response:
+    if not current_user.is_admin and user_id != current_user.id:
+        logger.error("User not authorized to create chat messages for another user")
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to create chat messages for another user"
         )
-    ).first()
-    if last_message and last_message.role == message_data.role:
-        logger.error("Message roles need to alternate between user and assistant")
+    if not messages_data:
+        raise HTTPException(status_code=400, detail="At least one message is required")
+    settings = get_settings()
+    if len(messages_data) > settings.chat.batch_max_messages:
+        logger.error("Too many messages in batch: %s", len(messages_data))
         raise HTTPException(
-            status_code=400,
-            detail="Message roles need to alternate between user and assistant"
+            status_code=413,
+            detail=f"At most {settings.chat.batch_max_messages} messages are allowed per batch"
         )
-    chat_message = ChatMessage(**message_data.model_dump(), chat_id=chat.id)
-    db.add(chat_message)
-    db.commit()
-    db.refresh(chat_message)
-    return ChatMessageRead(**chat_message.model_dump())
+    content_length = sum(len(message_data.content) for message_data in messages_data)
+    if content_length > settings.chat.batch_max_content_length:
+        logger.error("Batch content too large")
+        raise HTTPException(status_code=413, detail="Batch content too large")
+    last_role = messages_data[0].role
+    for message_data in messages_data[1:]:
+        if message_data.role == last_role:
+            logger.error("Message roles need to alternate between user and assistant")
+            raise HTTPException(
+                status_code=400,
+                detail="Message roles need to alternate between user and assistant"
+            )
+        last_role = message_data.role
+    chat_messages = await append_messages(db, user_id, chat_id, messages_data)
+    await db.commit()
+    logger.info("Created %s messages in chat with id: %s", len(chat_messages), chat_id)
+    return serialize(List[ChatMessageRead], chat_messages)
 
 
-@router.get("/{chat_id}/messages", response_model=List[ChatMessageRead])
-def get_chat_messages(
+@router.get(
+    "/{chat_id}/messages",
+    response_model=List[ChatMessageRead],
+    responses=NDJSON_RESPONSES
+)
+async def get_chat_messages(
         user_id: int,
         chat_id: int,
-        db: Session = Depends(get_db_session),
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(get_page_params),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> List[ChatMessageRead]:
+) -> Response:
     if not current_user.is_admin and user_id != current_user.id:
         logger.error("User not authorized to list chat messages for another user")
         raise HTTPException(
             status_code=403,
             detail="Not authorized to list chat messages for another user"
         )
-    chat = db.exec(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id)).first()
+    chat = (await db.exec(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id))).first()
+    if not chat:
+        logger.error("Chat not found")
+        raise HTTPException(status_code=404, detail="Chat not found")
+    # Messages are only appended, which updates the summary columns of the chat. Archiving
+    # moves messages without changing them, so it keeps the ETag.
+    ndjson = accepts_ndjson(request)
+    etag = make_etag(
+        "messages", chat.id, chat.message_count, chat.last_message_at, ndjson,
+        str(request.query_params)
+    )
+    # Without Last-Modified, as HTTP dates cannot tell apart messages within one second.
+    not_modified = check_not_modified(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    if ndjson:
+        statement = select(ChatMessage).where(ChatMessage.chat_id == chat_id)
+        # Only the archived messages are loaded, the others are streamed after them.
+        archived = await load_archived_messages(db, chat_id) if chat.archived_at else []
+        if archived:
+            statement = statement.where(col(ChatMessage.id) > archived[-1].id)
+        return stream_ndjson(
+            statement.order_by(col(ChatMessage.created_at), col(ChatMessage.id)),
+            ChatMessageRead,
+            response,
+            head=archived
+        )
+    chat_messages = await fetch_messages_page(db, chat, page, response)
+    return serialize(List[ChatMessageRead], chat_messages, response)
+
+
+@router.get("/{chat_id}/messages/stream", response_class=StreamingResponse, responses=SSE_RESPONSES)
+async def stream_chat_messages(
+        user_id: int,
+        chat_id: int,
+        last_event_id: int | None = Header(default=None),
+        db: AsyncSession = Depends(get_db_session),
+        current_user: User = Depends(get_current_user)
+) -> Response:
+    """Stream the messages after ``Last-Event-ID`` and new messages as Server-Sent Events."""
+    if not current_user.is_admin and user_id != current_user.id:
+        logger.error("User not authorized to stream chat messages for another user")
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to stream chat messages for another user"
+        )
+    chat = (await db.exec(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id))).first()
     if not chat:
         logger.error("Chat not found")
         raise HTTPException(status_code=404, detail="Chat not found")
-    chat_messages = db.exec(
-        select(ChatMessage).where(ChatMessage.chat_id == chat_id).order_by(ChatMessage.created_at)
-    ).all()
-    return [ChatMessageRead(**chat_message.model_dump()) for chat_message in chat_messages]
+    return stream_chat_events(chat_id, last_event_id, await get_last_archived_id(db, chat))
@@ -1,17 +1,32 @@
 import enum
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
-from sqlalchemy.types import String, BigInteger, Enum, DateTime
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import DDL, ForeignKey, Index, event
+from sqlalchemy.types import String, BigInteger, Enum, DateTime, Integer, LargeBinary
 from sqlmodel import SQLModel, Field as SQLField, Relationship
 
 
+class Role(str, enum.Enum):
+    user = "user"
+    assistant = "assistant"
+
+
 class Chat(SQLModel, table=True):  # type: ignore
     __tablename__ = "chat"
+    __table_args__ = (Index("ix_chat_user_id_id", "user_id", "id"),)
 
-    id: int | None = SQLField(default=None, primary_key=True, sa_type=BigInteger)
-    user_id: int = SQLField(nullable=False, sa_type=BigInteger, foreign_key="users.id")
+    id: int | None = SQLField(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger().with_variant(Integer, "sqlite")
+    )
+    user_id: int = SQLField(
+        nullable=False,
+        sa_type=BigInteger,
+        sa_column_args=[ForeignKey("users.id", ondelete="CASCADE")]
+    )
     name: str = SQLField(nullable=False, sa_type=String)
     description: str | None = SQLField(default=None, nullable=True, sa_type=String)
     created_at: datetime = SQLField(
@@ -19,8 +34,24 @@ class Chat(SQLModel, table=True):  # type: ignore
         nullable=False,
         sa_type=DateTime
     )
-
-    messages: List["ChatMessage"] = Relationship(sa_relationship_kwargs=dict(cascade="all, delete"))
+    message_count: int = SQLField(
+        default=0,
+        nullable=False,
+        sa_type=Integer,
+        sa_column_kwargs=dict(server_default="0")
+    )
+    last_message_at: datetime | None = SQLField(default=None, nullable=True, sa_type=DateTime)
+    last_role: Role | None = SQLField(default=None, nullable=True, sa_type=Enum(Role))  # type: ignore
+    archived_at: datetime | None = SQLField(default=None, nullable=True, sa_type=DateTime)
+
+    # Messages and the archive are deleted by the database, see the ``ON DELETE CASCADE``
+    # foreign keys, instead of being loaded and deleted one by one.
+    messages: List["ChatMessage"] = Relationship(
+        sa_relationship_kwargs=dict(cascade="all, delete", passive_deletes=True)
+    )
+    archive: Optional["ChatMessageArchive"] = Relationship(
+        sa_relationship_kwargs=dict(cascade="all, delete", uselist=False, passive_deletes=True)
+    )
 
 
 class ChatCreate(BaseModel):
@@ -29,22 +60,42 @@ class ChatCreate(BaseModel):
 
 
 class ChatRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     description: str | None
     created_at: datetime
+    message_count: int
+    last_message_at: datetime | None
+    last_role: Role | None
 
 
-class Role(str, enum.Enum):
-    user = "user"
-    assistant = "assistant"
+class ChatMessage(SQLModel, table=True):  # type: ignore
+    """A message of a chat.
 
+    On Postgres the table is partitioned by ``created_at``, with ``(id, created_at)`` as
+    primary key, see migration ``c5d8f1a3b7e2``. Ids are unique on their own, as they are
+    drawn from one sequence. They are never reused, also on SQLite, so messages appended
+    after archiving have larger ids than the archived ones.
+    """
 
-class ChatMessage(SQLModel, table=True):  # type: ignore
     __tablename__ = "chat_message"
+    __table_args__ = (
+        Index("ix_chat_message_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        {"sqlite_autoincrement": True},
+    )
 
-    id: int | None = SQLField(default=None, primary_key=True, sa_type=BigInteger)
-    chat_id: int = SQLField(nullable=False, sa_type=BigInteger, foreign_key="chat.id")
+    id: int | None = SQLField(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger().with_variant(Integer, "sqlite")
+    )
+    chat_id: int = SQLField(
+        nullable=False,
+        sa_type=BigInteger,
+        sa_column_args=[ForeignKey("chat.id", ondelete="CASCADE")]
+    )
     role: Role = SQLField(nullable=False, sa_type=Enum(Role))  # type: ignore
     content: str = SQLField(nullable=False, sa_type=String)
     created_at: datetime = SQLField(
@@ -54,12 +105,54 @@ class ChatMessage(SQLModel, table=True):  # type: ignore
     )
 
 
+# On Postgres, messages are searched by the generated ``content_tsv`` column and its GIN
+# index, see migration ``d4a1f7c9e2b3``. On SQLite, e.g. in tests, an FTS5 table kept in
+# sync by triggers stands in for them. Messages are never updated, only inserted and deleted.
+CHAT_MESSAGE_FTS = "chat_message_fts"
+
+for _statement in (
+    f"CREATE VIRTUAL TABLE {CHAT_MESSAGE_FTS} USING fts5("
+    f"content, content='chat_message', content_rowid='id', tokenize='porter unicode61')",
+    f"CREATE TRIGGER {CHAT_MESSAGE_FTS}_insert AFTER INSERT ON chat_message BEGIN "
+    f"INSERT INTO {CHAT_MESSAGE_FTS} (rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER {CHAT_MESSAGE_FTS}_delete AFTER DELETE ON chat_message BEGIN "
+    f"INSERT INTO {CHAT_MESSAGE_FTS} ({CHAT_MESSAGE_FTS}, rowid, content) "
+    f"VALUES ('delete', old.id, old.content); END",
+):
+    event.listen(
+        ChatMessage.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    ChatMessage.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {CHAT_MESSAGE_FTS}").execute_if(dialect="sqlite")
+)
+
+
+class ChatMessageArchive(SQLModel, table=True):  # type: ignore
+    """Messages of an idle chat, moved out of ``chat_message`` as compressed JSON."""
+
+    __tablename__ = "chat_message_archive"
+
+    chat_id: int = SQLField(
+        primary_key=True,
+        sa_type=BigInteger,
+        sa_column_args=[ForeignKey("chat.id", ondelete="CASCADE")]
+    )
+    message_count: int = SQLField(nullable=False, sa_type=Integer)
+    last_message_id: int = SQLField(nullable=False, sa_type=BigInteger)
+    archived_at: datetime = SQLField(nullable=False, sa_type=DateTime)
+    data: bytes = SQLField(nullable=False, sa_type=LargeBinary)
+
+
 class ChatMessageCreate(BaseModel):
     role: Role
     content: str
 
 
 class ChatMessageRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     role: Role
     content: str
@@ -0,0 +1,131 @@
+"""Full-text search over the messages of a user's chats.
+
+On Postgres, messages are matched by the generated ``chat_message.content_tsv`` column and
+its GIN index, ranked by ``ts_rank_cd`` and highlighted by ``ts_headline``. On SQLite, the
+FTS5 table ``chat_message_fts`` stands in, ranked by ``bm25``. Hits are ordered by
+relevance and paginated by (score, id) cursors, where the score is the negated rank.
+Highlights are HTML-escaped, only the ``<mark>`` tags around the matches are markup.
+
+Messages of archived chats are stored outside ``chat_message`` (see ``chats_archive``)
+and are not searched.
+"""
+import html
+from datetime import datetime
+from typing import Any, List, Sequence, Tuple
+
+from fastapi import Response
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Float, cast, column, func, literal_column, table
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, REGCONFIG, TSVECTOR
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.chats.chats_schema import CHAT_MESSAGE_FTS, Chat, ChatMessage, Role
+from app.api.pagination import PageParams, fetch_page
+
+# Has to match the configuration of the generated column, or the index is not used.
+SEARCH_CONFIG = "english"
+MAX_QUERY_LENGTH = 256
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+# The database marks matches with private use characters, replaced by the tags once the
+# content is escaped.
+MATCH_START = "\ue000"
+MATCH_STOP = "\ue001"
+FRAGMENT_DELIMITER = " … "
+HEADLINE_OPTIONS = (
+    f'StartSel="{MATCH_START}", StopSel="{MATCH_STOP}", '
+    f'FragmentDelimiter="{FRAGMENT_DELIMITER}", MaxFragments=3, MinWords=5, MaxWords=20'
+)
+SNIPPET_TOKENS = 20
+
+
+class ChatMessageSearchHit(BaseModel):
+    """A message matching a search.
+
+    ``highlight`` holds HTML-escaped fragments of the content with the matches wrapped in
+    ``<mark>`` tags.
+    """
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    chat_id: int
+    role: Role
+    created_at: datetime
+    rank: float
+    highlight: str
+
+
+def to_fts5_query(query: str) -> str:
+    """Quote every term, so FTS5 matches all of them instead of parsing its query syntax."""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+def render_highlight(highlight: str) -> str:
+    """Escape a highlight from the database and mark its matches with ``<mark>`` tags."""
+    return (
+        html.escape(highlight, quote=False)
+        .replace(MATCH_START, HIGHLIGHT_START)
+        .replace(MATCH_STOP, HIGHLIGHT_STOP)
+    )
+
+
+def search_statement(dialect: str, user_id: int, query: str) -> Tuple[Any, Sequence[Any]]:
+    """Build the statement selecting the hits of a search and its keyset pagination keys."""
+    if dialect == "postgresql":
+        document = literal_column("chat_message.content_tsv", type_=TSVECTOR)
+        ts_query = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), query)
+        # ts_rank_cd returns a real, which does not round trip exactly through the cursor's
+        # double. Cast once here, so the pages compare the same values they returned.
+        score = -cast(func.ts_rank_cd(document, ts_query), DOUBLE_PRECISION)
+        # Postgres evaluates the headlines, the expensive part, only for the returned page.
+        highlight = func.ts_headline(
+            cast(SEARCH_CONFIG, REGCONFIG), ChatMessage.content, ts_query, HEADLINE_OPTIONS
+        )
+        match = document.bool_op("@@")(ts_query)
+    else:
+        fts = table(CHAT_MESSAGE_FTS, column("rowid"))
+        fts_table = literal_column(CHAT_MESSAGE_FTS)
+        # bm25 is lower for better matches already.
+        score = func.bm25(fts_table, type_=Float)
+        highlight = func.snippet(
+            fts_table, 0, MATCH_START, MATCH_STOP, FRAGMENT_DELIMITER.strip(),
+            SNIPPET_TOKENS
+        )
+        match = fts_table.op("MATCH")(to_fts5_query(query)) & (fts.c.rowid == ChatMessage.id)
+    hits = (
+        select(
+            ChatMessage.id,
+            ChatMessage.chat_id,
+            ChatMessage.role,
+            ChatMessage.created_at,
+            score.label("score"),
+            highlight.label("highlight")
+        )
+        .join(Chat, col(Chat.id) == ChatMessage.chat_id)
+        .where(Chat.user_id == user_id, match)
+        .subquery()
+    )
+    return (
+        select(hits, (-hits.c.score).label("rank")),
+        [hits.c.score, hits.c.id]
+    )
+
+
+async def search_messages(
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        page: PageParams,
+        response: Response
+) -> List[Any]:
+    """Fetch one page of the messages of a user's chats matching ``query``, best first."""
+    if not query.split():
+        return []
+    connection = await db.connection()
+    statement, keys = search_statement(connection.dialect.name, user_id, query)
+    hits = await fetch_page(db, statement, keys, page, response)
+    return [
+        dict(hit._mapping, highlight=render_highlight(hit.highlight)) for hit in hits
+    ]
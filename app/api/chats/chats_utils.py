@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+from typing import List, Sequence
+
+from sqlalchemy import (
+    DateTime, Interval, String, Update, column, func, insert, true, update, values
+)
+from sqlalchemy.orm import aliased
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.chats.chats_events import ChatMessageBroadcaster
+from app.api.chats.chats_schema import Chat, ChatMessage, ChatMessageCreate
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+async def append_chat_messages(
+        db: AsyncSession,
+        user_id: int,
+        chat_id: int,
+        messages_data: Sequence[ChatMessageCreate],
+        broadcaster: ChatMessageBroadcaster
+) -> List[ChatMessage] | None:
+    """Append messages with alternating roles to a chat of the user and publish them.
+
+    The chat's summary is updated first, by an ``UPDATE`` only matching if the chat belongs
+    to the user and its last role differs from the first new one. Its row lock serializes
+    appends to the chat, and a waiting append re-checks the last role once the other one
+    committed. On Postgres, the update, the insert and the notification of subscribers
+    are a single statement. Returns ``None`` if nothing was appended, as the chat was not
+    found or the roles do not alternate.
+    """
+    claim = (
+        update(Chat)
+        .where(
+            col(Chat.id) == chat_id,
+            col(Chat.user_id) == user_id,
+            col(Chat.last_role).is_distinct_from(messages_data[0].role)
+        )
+        .values(
+            message_count=col(Chat.message_count) + len(messages_data),
+            last_role=messages_data[-1].role
+        )
+    )
+    connection = await db.connection()
+    if connection.dialect.name == "postgresql":
+        messages = await _insert_claimed(db, claim, messages_data, broadcaster)
+    else:
+        # SQLite serializes writers, so the rest runs under the lock taken by the update.
+        if not (await db.exec(claim.returning(col(Chat.id)))).first():  # type: ignore
+            return None
+        now = datetime.utcnow()
+        messages = list((await db.exec(
+            insert(ChatMessage).returning(ChatMessage, sort_by_parameter_order=True),
+            params=[
+                dict(
+                    role=message_data.role,
+                    content=message_data.content,
+                    chat_id=chat_id,
+                    created_at=now + i * MICROSECOND
+                )
+                for i, message_data in enumerate(messages_data)
+            ]
+        )).scalars().all())
+        await db.exec(  # type: ignore[call-overload]
+            update(Chat)
+            .where(col(Chat.id) == chat_id)
+            .values(last_message_at=messages[-1].created_at)
+        )
+        await broadcaster.publish(db, chat_id, messages)
+    if not messages:
+        return None
+    return sorted(messages, key=lambda message: (message.created_at, message.id or 0))
+
+
+async def _insert_claimed(
+        db: AsyncSession,
+        claim: Update,
+        messages_data: Sequence[ChatMessageCreate],
+        broadcaster: ChatMessageBroadcaster
+) -> List[ChatMessage]:
+    """Insert and publish the messages in the statement claiming the chat.
+
+    Nothing is inserted or published if the claim matches no row. The timestamps are
+    taken while holding the lock, from the claimed chat, and are spaced by a microsecond.
+    They are after the chat's last message even if another append waited for the lock
+    with a later clock, so (created_at, id) keeps the append order.
+    """
+    n = len(messages_data)
+    claimed = claim.values(
+        last_message_at=func.greatest(
+            datetime.utcnow() + (n - 1) * MICROSECOND,
+            col(Chat.last_message_at) + n * MICROSECOND
+        )
+    ).returning(col(Chat.id), col(Chat.last_message_at)).cte("claimed")
+    new_messages = values(
+        column("role", col(ChatMessage.role).type),
+        column("content", String),
+        column("offset", Interval),
+        name="new_messages"
+    ).data([
+        (message_data.role, message_data.content, (n - 1 - i) * MICROSECOND)
+        for i, message_data in enumerate(messages_data)
+    ])
+    inserted = (
+        insert(ChatMessage)
+        .from_select(
+            ["chat_id", "role", "content", "created_at"],
+            select(
+                claimed.c.id,
+                new_messages.c.role.cast(col(ChatMessage.role).type),
+                new_messages.c.content,
+                (claimed.c.last_message_at - new_messages.c.offset).cast(DateTime)
+            ).select_from(claimed.join(new_messages, true()))
+        )
+        .returning(*ChatMessage.__table__.columns)  # type: ignore[attr-defined]
+        .cte("inserted")
+    )
+    statement = select(aliased(ChatMessage, inserted))
+    notification = broadcaster.notification(inserted)
+    if notification is not None:
+        # An aggregate without rows to aggregate returns none, so only appends notify.
+        notified = (
+            select(notification.label("notified"))
+            .select_from(inserted)
+            .having(func.count() > 0)
+            .subquery("notified")
+        )
+        statement = statement.join(notified, true())
+    messages = list((await db.exec(statement)).all())
+    if notification is None and messages:
+        await broadcaster.publish(db, messages[0].chat_id, messages)
+    return messages
@@ -0,0 +1,77 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any
+
+from fastapi import Request, Response
+
+from app import __version__
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from the values a representation is derived from.
+
+    The values are cheap stand-ins for the content, e.g. row counts, maximum ids and
+    timestamps, so the ETag is known before rows are loaded. The API version is included,
+    as a new version may render the same rows differently.
+    """
+    digest = hashlib.blake2b(repr((__version__, *parts)).encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def format_http_date(value: datetime) -> str:
+    """Format a naive UTC datetime as HTTP date."""
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an ``If-None-Match`` header with an ETag, as required for GET."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None = None) -> bool:
+    """Whether the client's copy, as described by its conditional headers, is current.
+
+    ``If-Modified-Since`` is only evaluated without ``If-None-Match``. As HTTP dates have a
+    precision of seconds, a copy is only current once ``last_modified`` is before the second
+    in ``If-Modified-Since``, else a change later in that second would be missed.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.replace(tzinfo=timezone.utc) < since
+
+
+def check_not_modified(
+        request: Request,
+        response: Response,
+        etag: str,
+        last_modified: datetime | None = None
+) -> Response | None:
+    """Set the validators on ``response`` and answer 304 if the client's copy is current.
+
+    Responses are marked to be revalidated on every use, so clients never show stale
+    content from their cache.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_http_date(last_modified)
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    headers = {
+        name: value for name, value in response.headers.items() if name != "content-length"
+    }
+    return Response(status_code=304, headers=headers)
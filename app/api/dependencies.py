@@ -1,41 +1,80 @@
+import functools
+from typing import Any, AsyncIterator, Dict
+
 from fastapi import Security, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlmodel import Session
-from sqlmodel import select
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.api.auth.password_hasher import PasswordHasher
 from app.api.users.users_schema import User
-from app.config import settings
-from app.database import engine
+from app.config import get_settings
+from app.database import open_session
+from app.utils.cache import FileInvalidationChannel, TTLCache
 
 auth_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def get_pwd_context() -> CryptContext:
-    return pwd_context
+@functools.cache
+def get_pwd_context() -> PasswordHasher:
+    settings = get_settings()
+    return PasswordHasher(
+        workers=settings.auth.password_hash_workers,
+        max_concurrency=settings.auth.password_hash_max_concurrency,
+        max_queue=settings.auth.password_hash_max_queue,
+        retry_after=settings.auth.password_hash_retry_after
+    )
+
+
+@functools.cache
+def get_principal_cache() -> TTLCache[Dict[str, Any]]:
+    settings = get_settings()
+    observer = None
+    if settings.metrics.enabled:
+        from app.utils.metrics import cache_observer
+
+        observer = cache_observer("principal")
+    return TTLCache(
+        maxsize=settings.auth.principal_cache_size,
+        ttl=settings.auth.principal_cache_ttl,
+        channel=FileInvalidationChannel(
+            path=settings.auth.principal_cache_invalidation_path,
+            poll_interval=settings.auth.principal_cache_poll_interval
+        ),
+        observer=observer
+    )
 
 
-def get_db_session() -> Session:
+async def get_db_session() -> AsyncIterator[AsyncSession]:
     """Dependency for getting a database session."""
-    with Session(engine) as session:
+    async with open_session() as session:
         yield session
 
 
-def get_current_user(
-        db: Session = Depends(get_db_session),
+async def get_current_user(
+        db: AsyncSession = Depends(get_db_session),
         token: str = Security(auth_scheme)
 ) -> User:
-    """Dependency for getting the current user."""
+    """Dependency for getting the current user.
+
+    Users are cached by token subject, so most requests skip the lookup query. Handlers
+    changing or deleting a user must invalidate its entry in the principal cache.
+    """
     token_data = decode_token(token)
-    user = db.exec(select(User).where(User.email == token_data["sub"])).first()
+    principal_cache = get_principal_cache()
+    cached_user = await principal_cache.aget(token_data["sub"])
+    if cached_user is not None:
+        return User(**cached_user)
+    user = (await db.exec(
+        select(User).where(User.email == token_data["sub"], col(User.deleted_at).is_(None))
+    )).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    principal_cache.set(token_data["sub"], user.model_dump())
     return user
 
 
@@ -45,6 +84,10 @@ def decode_token(token: str) -> dict:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Imported on first use, it is one of the slower imports of the app.
+    from jose import JWTError, jwt
+
+    settings = get_settings()
     try:
         payload = jwt.decode(
             token,
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from app.utils.metrics import generate_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    content, media_type = generate_metrics()
+    return Response(content=content, media_type=media_type)
@@ -1,8 +1,12 @@
-from .chats.chats_schema import Chat, ChatMessage
-from .users.users_schema import User
+from .auth.auth_schema import RefreshToken
+from .chats.chats_schema import Chat, ChatMessage, ChatMessageArchive
+from .users.users_schema import PurgeJob, User
 
 __all__ = [
     "User",
     "Chat",
-    "ChatMessage"
+    "ChatMessage",
+    "ChatMessageArchive",
+    "PurgeJob",
+    "RefreshToken"
 ]
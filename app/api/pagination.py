@@ -0,0 +1,137 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, List, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+
+
+@dataclass(frozen=True)
+class PageParams:
+    limit: int
+    before: str | None = None
+    after: str | None = None
+
+
+def get_page_params(
+        limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+        before: str | None = Query(None, description="Return items before this cursor."),
+        after: str | None = Query(None, description="Return items after this cursor.")
+) -> PageParams:
+    """Dependency for getting keyset pagination parameters."""
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Only one of before and after is allowed")
+    return PageParams(limit=limit, before=before, after=after)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of an item as an opaque cursor."""
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[Any]) -> Tuple[Any, ...]:
+    """Decode a cursor into values for the given sort keys."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("Cursor does not match sort keys")
+        return tuple(_parse_value(key, value) for key, value in zip(keys, values))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_value(key: Any, value: Any) -> Any:
+    python_type = key.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is int and not isinstance(value, int):
+        raise TypeError("Expected an integer")
+    return value
+
+
+async def fetch_page(
+        db: AsyncSession,
+        statement: SelectOfScalar,
+        keys: Sequence[Any],
+        page: PageParams,
+        response: Response
+) -> List[Any]:
+    """Fetch one page of a statement using keyset pagination over unique sort keys.
+
+    Items are always returned in ascending key order. Cursors for the adjacent pages are
+    set as ``X-Next-Cursor`` / ``X-Prev-Cursor`` response headers when such pages exist.
+    """
+    key = tuple_(*keys)
+    backwards = page.before is not None
+    if page.before is not None:
+        statement = statement.where(key < decode_cursor(page.before, keys))
+    elif page.after is not None:
+        statement = statement.where(key > decode_cursor(page.after, keys))
+    statement = statement.order_by(*(k.desc() if backwards else k.asc() for k in keys))
+    items = list((await db.exec(statement.limit(page.limit + 1))).all())
+    return _finish_page(items, keys, page, response)
+
+
+def page_items(
+        items: Sequence[Any],
+        keys: Sequence[Any],
+        page: PageParams,
+        response: Response
+) -> List[Any]:
+    """Select one page of items already loaded in ascending key order, like ``fetch_page``."""
+    names = [k.key for k in keys]
+
+    def sort_key(item: Any) -> Tuple[Any, ...]:
+        return tuple(getattr(item, name) for name in names)
+
+    if page.before is not None:
+        before = decode_cursor(page.before, keys)
+        selected = [item for item in items if sort_key(item) < before][-(page.limit + 1):]
+        selected.reverse()
+    else:
+        after = decode_cursor(page.after, keys) if page.after is not None else None
+        selected = [item for item in items if after is None or sort_key(item) > after]
+        selected = selected[:page.limit + 1]
+    return _finish_page(selected, keys, page, response)
+
+
+def _finish_page(
+        items: List[Any],
+        keys: Sequence[Any],
+        page: PageParams,
+        response: Response
+) -> List[Any]:
+    """Trim items fetched in page order to the page and set the cursor headers."""
+    backwards = page.before is not None
+    has_more = len(items) > page.limit
+    items = items[:page.limit]
+    if backwards:
+        items.reverse()
+    if not items:
+        return items
+    has_next = page.before is not None or (not backwards and has_more)
+    has_prev = page.after is not None or (backwards and has_more)
+    if has_next:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            [getattr(items[-1], k.key) for k in keys]
+        )
+    if has_prev:
+        response.headers[PREV_CURSOR_HEADER] = encode_cursor(
+            [getattr(items[0], k.key) for k in keys]
+        )
+    return items
@@ -0,0 +1,92 @@
+import functools
+import math
+from typing import Awaitable, Callable
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.concurrency import run_in_threadpool
+
+from app.api.dependencies import decode_token
+from app.config import get_settings
+from app.utils.rate_limiting import BucketStore, MemoryBucketStore, SqliteBucketStore
+
+
+@functools.cache
+def get_bucket_store() -> BucketStore:
+    settings = get_settings()
+    if settings.rate_limit.store == "memory":
+        return MemoryBucketStore()
+    return SqliteBucketStore(
+        settings.rate_limit.store_path, timeout=settings.rate_limit.store_timeout
+    )
+
+
+def client_address(request: Request) -> str:
+    """The address of the client, rather than of the proxy in front of the app.
+
+    Uvicorn takes it from ``X-Forwarded-For`` for requests from the trusted proxies, see
+    ``ServerSettings.forwarded_allow_ips``.
+    """
+    return request.client.host if request.client else "unknown"
+
+
+async def client_key(request: Request) -> str:
+    """Identify the client by the subject of its access token, else by its address.
+
+    The token is only decoded, not looked up, so this works before authentication.
+    """
+    scheme, token = get_authorization_scheme_param(request.headers.get("authorization"))
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{decode_token(token)['sub']}"
+        except HTTPException:
+            pass
+    return f"ip:{client_address(request)}"
+
+
+async def login_key(request: Request) -> str:
+    """Identify login attempts by the submitted username and the client's address.
+
+    Clients sharing an address, e.g. behind a NAT, only share a bucket for the same account,
+    and nobody can exhaust the attempts of an account from elsewhere.
+    """
+    username = (await request.form()).get("username")
+    username = username.lower() if isinstance(username, str) else ""
+    return f"ip:{client_address(request)}:username:{username}"
+
+
+class RateLimit:
+    """Dependency limiting the requests of every client by the named policy.
+
+    Policies are configured in ``RateLimitSettings.policies``, routes without a configured
+    policy are not limited. Clients are told apart by ``key``. Rejected requests get a 429
+    with ``Retry-After``.
+    """
+
+    def __init__(
+            self,
+            policy: str,
+            key: Callable[[Request], Awaitable[str]] = client_key
+    ) -> None:
+        self.policy = policy
+        self.key = key
+
+    async def __call__(
+            self,
+            request: Request,
+            store: BucketStore = Depends(get_bucket_store)
+    ) -> None:
+        settings = get_settings().rate_limit
+        policy = settings.policies.get(self.policy)
+        if not settings.enabled or policy is None:
+            return
+        # The SQLite store does file I/O and may wait for other processes, off the event loop.
+        wait = await run_in_threadpool(
+            store.take, f"{self.policy}:{await self.key(request)}", policy.rate, policy.burst
+        )
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(math.ceil(wait), 1))},
+            )
@@ -0,0 +1,48 @@
+import functools
+from typing import Any
+
+import pydantic_core
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by pydantic-core instead of the standard library.
+
+    Already encoded ``bytes`` are sent as they are.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return pydantic_core.to_json(content)
+
+
+@functools.lru_cache(maxsize=None)
+def get_type_adapter(type_: Any) -> TypeAdapter:
+    return TypeAdapter(type_)
+
+
+def dump_json(type_: Any, content: Any) -> bytes:
+    """Serialize ORM rows (or anything with matching attributes) as ``type_`` to JSON."""
+    adapter = get_type_adapter(type_)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def serialize(
+        type_: Any,
+        content: Any,
+        response: Response | None = None,
+        status_code: int = 200
+) -> FastJSONResponse:
+    """Build a response for ``content`` without FastAPI's response model round trip.
+
+    Returning a response from a handler skips FastAPI's validation and encoding of the
+    return value, so rows are validated and dumped once, by a cached ``TypeAdapter``.
+    Headers set on the handler's ``response`` parameter are carried over.
+    """
+    json_response = FastJSONResponse(dump_json(type_, content), status_code=status_code)
+    if response is not None:
+        json_response.headers.raw.extend(response.headers.raw)
+    return json_response
@@ -0,0 +1,51 @@
+from typing import Any, AsyncIterator, Dict, Sequence, Type
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.api.serialization import dump_json
+from app.database import open_session
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_YIELD_PER = 1000
+
+NDJSON_RESPONSES: Dict[int | str, Dict[str, Any]] = {
+    200: {"content": {NDJSON_MEDIA_TYPE: {}}, "description": "Streamed as NDJSON if accepted."}
+}
+
+
+def accepts_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def stream_ndjson(
+        statement: SelectOfScalar,
+        model: Type[BaseModel],
+        response: Response | None = None,
+        head: Sequence[Any] = ()
+) -> StreamingResponse:
+    """Stream all rows of a statement as newline-delimited JSON.
+
+    Rows are read through a server-side cursor in batches of ``STREAM_YIELD_PER`` and
+    serialized batch by batch, so memory stays flat regardless of the result size. The
+    response opens its own session, because the request's session is closed before the
+    body is sent. Headers set on the handler's ``response`` parameter are carried over.
+    Rows already loaded are passed as ``head`` and sent first.
+    """
+    async def content() -> AsyncIterator[bytes]:
+        if head:
+            yield b"".join(dump_json(model, row) + b"\n" for row in head)
+        async with open_session() as session:
+            result = await session.stream_scalars(
+                statement.execution_options(yield_per=STREAM_YIELD_PER)
+            )
+            async for rows in result.partitions():
+                yield b"".join(dump_json(model, row) + b"\n" for row in rows)
+
+    streaming_response = StreamingResponse(content(), media_type=NDJSON_MEDIA_TYPE)
+    if response is not None:
+        streaming_response.headers.raw.extend(response.headers.raw)
+    return streaming_response
+
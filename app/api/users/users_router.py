@@ -1,130 +1,249 @@
 import logging
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException
-from passlib.context import CryptContext
-from sqlmodel import Session, select
-
-from app.api.dependencies import get_pwd_context, get_db_session, get_current_user
-from app.api.users.users_schema import User, UserRead, UserCreate, UserUpdate
+from datetime import datetime
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import func
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.auth.auth_schema import RefreshToken
+from app.api.auth.auth_utils import revoke_refresh_tokens
+from app.api.auth.password_hasher import PasswordHasher
+from app.api.chats.chats_schema import Chat
+from app.api.conditional import check_not_modified, make_etag
+from app.api.pagination import PageParams, fetch_page, get_page_params
+from app.api.rate_limits import RateLimit
+from app.api.serialization import serialize
+from app.api.streaming import NDJSON_RESPONSES, accepts_ndjson, stream_ndjson
+from app.api.dependencies import (
+    get_pwd_context, get_db_session, get_current_user, get_principal_cache
+)
+from app.api.users.users_schema import (
+    PurgeJob, PurgeJobRead, User, UserRead, UserCreate, UserUpdate
+)
+from app.config import get_settings
+from app.utils.cache import TTLCache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 logger = logging.getLogger(__name__)
 
 
-@router.post("", response_model=UserRead)
-def create_user(
+def user_etag(user: User) -> str:
+    """ETag of a user, derived from the fields of ``UserRead``."""
+    return make_etag("user", user.id, user.email, user.name, user.is_admin)
+
+
+@router.post("", response_model=UserRead, dependencies=[Depends(RateLimit("signup"))])
+async def create_user(
         user_data: UserCreate,
-        db: Session = Depends(get_db_session),
-        pwd_context: CryptContext = Depends(get_pwd_context)
-) -> UserRead:
+        db: AsyncSession = Depends(get_db_session),
+        pwd_context: PasswordHasher = Depends(get_pwd_context)
+) -> Response:
     """Create a user."""
-    user = User(
-        **user_data.model_dump(),
-        password_hash=pwd_context.hash(user_data.password.get_secret_value())
-    )
-
-    existing_user = db.exec(select(User).where(User.email == user.email)).first()
+    existing_user = (await db.exec(select(User).where(User.email == user_data.email))).first()
     if existing_user:
         logger.error("Failed to create user: Email already exists")
         raise HTTPException(status_code=400, detail="Email already exists")
 
+    user = User(
+        **user_data.model_dump(),
+        password_hash=await pwd_context.hash(user_data.password.get_secret_value())
+    )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     logger.info("Created user with id: %s", user.id)
-    return UserRead(**user.model_dump())
+    return serialize(UserRead, user)
 
 
-@router.get("", response_model=List[UserRead])
-def get_users(
-        db: Session = Depends(get_db_session),
+@router.get("", response_model=List[UserRead], responses=NDJSON_RESPONSES)
+async def get_users(
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(get_page_params),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> List[UserRead]:
+) -> Response:
     """Get users."""
     if not current_user.is_admin:
         logger.error("User not authorized to list all users")
         raise HTTPException(status_code=403, detail="Not authorized to access users")
-    results = db.exec(select(User)).all()
-    logger.info(f"Users retrieved. Count: {len(results)}")
-    return [UserRead(**user.model_dump()) for user in results]
+    if accepts_ndjson(request):
+        logger.info("Streaming users")
+        return stream_ndjson(
+            select(User).where(col(User.deleted_at).is_(None)).order_by(col(User.id)), UserRead
+        )
+    results = await fetch_page(
+        db, select(User).where(col(User.deleted_at).is_(None)), [User.id], page, response
+    )
+    logger.info("Users retrieved. Count: %s", len(results))
+    return serialize(List[UserRead], results, response)
 
 
 @router.get("/current", response_model=UserRead)
-def get_current(
+async def get_current(
+        request: Request,
+        response: Response,
         current_user: User = Depends(get_current_user)
-) -> UserRead:
+) -> Response:
     """Get the current user."""
-    return UserRead(**current_user.model_dump())
+    not_modified = check_not_modified(request, response, user_etag(current_user))
+    if not_modified is not None:
+        return not_modified
+    return serialize(UserRead, current_user, response)
 
 
 @router.get("/{user_id}", response_model=UserRead)
-def get_user(
+async def get_user(
         user_id: int,
-        db: Session = Depends(get_db_session),
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user)
-) -> UserRead:
+) -> Response:
     """Get a user by id."""
     if not current_user.is_admin and current_user.id != user_id:
         logger.error("User not authorized to access user: %s", user_id)
         raise HTTPException(status_code=403, detail="Not authorized to access user")
-    user = db.exec(select(User).where(User.id == user_id)).first()
+    user = (await db.exec(
+        select(User).where(User.id == user_id, col(User.deleted_at).is_(None))
+    )).first()
     if not user:
         logger.error("User not found: %s", user_id)
         raise HTTPException(status_code=404, detail="User not found")
-    logger.info(f"Retrieved User with id: {user_id}")
-    return UserRead(**user.model_dump())
+    not_modified = check_not_modified(request, response, user_etag(user))
+    if not_modified is not None:
+        return not_modified
+    logger.info("Retrieved User with id: %s", user_id)
+    return serialize(UserRead, user, response)
 
 
 @router.put("/{user_id}", response_model=UserRead)
-def update_user(
+async def update_user(
         user_id: int,
         user_data: UserUpdate,
-        db: Session = Depends(get_db_session),
+        db: AsyncSession = Depends(get_db_session),
         current_user: User = Depends(get_current_user),
-        pwd_context: CryptContext = Depends(get_pwd_context)
-) -> UserRead:
+        pwd_context: PasswordHasher = Depends(get_pwd_context),
+        principal_cache: TTLCache[Dict[str, Any]] = Depends(get_principal_cache)
+) -> Response:
     """Update a user by id."""
     if not current_user.is_admin and current_user.id != user_id:
         logger.error("User not authorized to update user: %s", user_id)
         raise HTTPException(status_code=403, detail="Not authorized to update user")
-    user = db.exec(select(User).where(User.id == user_id)).first()
+    user = (await db.exec(
+        select(User).where(User.id == user_id, col(User.deleted_at).is_(None))
+    )).first()
     if not user:
         logger.error("User not found: %s", user_id)
         raise HTTPException(status_code=404, detail="User not found")
 
     user_data_dict = user_data.model_dump(exclude_unset=True)
-    if user_data.password:
-        user_data_dict["password_hash"] = pwd_context.hash(user_data.password.get_secret_value())
     if user_data.email:
-        existing_user = db.exec(select(User).where(User.email == user_data.email)).first()
+        existing_user = (await db.exec(select(User).where(User.email == user_data.email))).first()
         if existing_user and existing_user.id != user_id:
             logger.error("Failed to update user: Email already exists")
             raise HTTPException(status_code=400, detail="Email already exists")
+    if user_data.password:
+        user_data_dict["password_hash"] = await pwd_context.hash(
+            user_data.password.get_secret_value()
+        )
+        # Sessions started with the old password end with their access tokens.
+        await revoke_refresh_tokens(db, RefreshToken.user_id == user_id)
+    previous_email = user.email
     user.sqlmodel_update(user_data_dict)
     db.add(user)
-    db.commit()
-    db.refresh(user)
-    logger.info(f"Updated user with id: {user.id}")
-    return UserRead(**user.model_dump())
-
-
-@router.delete("/{user_id}", response_model=UserRead)
-def delete_user(
+    await db.commit()
+    await db.refresh(user)
+    await principal_cache.ainvalidate(previous_email, user.email)
+    logger.info("Updated user with id: %s", user.id)
+    return serialize(UserRead, user)
+
+
+@router.delete(
+    "/{user_id}",
+    response_model=UserRead,
+    responses={202: {"model": PurgeJobRead, "description": "User deleted, data being purged."}}
+)
+async def delete_user(
         user_id: int,
-        db: Session = Depends(get_db_session),
-        current_user: User = Depends(get_current_user)
-) -> UserRead:
-    """Delete a user by id."""
+        db: AsyncSession = Depends(get_db_session),
+        current_user: User = Depends(get_current_user),
+        principal_cache: TTLCache[Dict[str, Any]] = Depends(get_principal_cache)
+) -> Response:
+    """Delete a user by id.
+
+    Chats and messages are deleted by the database. Users with more messages than
+    ``PURGE_SYNC_MAX_MESSAGES`` are marked deleted right away instead, and their data is
+    purged in the background, see ``GET /users/{user_id}/purge``.
+    """
     if not current_user.is_admin and current_user.id != user_id:
         logger.error("User not authorized to delete user: %s", user_id)
         raise HTTPException(status_code=403, detail="Not authorized to delete user")
-    user = db.exec(select(User).where(User.id == user_id)).first()
+    user = (await db.exec(
+        select(User).where(User.id == user_id, col(User.deleted_at).is_(None))
+    )).first()
     if not user:
         logger.error("User not found: %s", user_id)
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
-    db.commit()
+    message_count = (await db.exec(
+        select(func.coalesce(func.sum(Chat.message_count), 0)).where(Chat.user_id == user_id)
+    )).one()
+    if message_count > get_settings().purge.sync_max_messages:
+        user.deleted_at = datetime.utcnow()
+        job = PurgeJob(user_id=user_id)
+        db.add(user)
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        await principal_cache.ainvalidate(user.email)
+        logger.info("Marked user with id %s deleted, purging %s messages", user_id, message_count)
+        response = serialize(PurgeJobRead, job, status_code=202)
+        response.headers["Location"] = f"{router.prefix}/{user_id}/purge"
+        return response
+    await db.delete(user)
+    await db.commit()
+    await principal_cache.ainvalidate(user.email)
     logger.info("Deleted user with id: %s", user_id)
-    return UserRead(**user.model_dump())
+    return serialize(UserRead, user)
+
+
+@router.delete(
+    "/{user_id}/refresh-tokens",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response
+)
+async def revoke_user_refresh_tokens(
+        user_id: int,
+        db: AsyncSession = Depends(get_db_session),
+        current_user: User = Depends(get_current_user)
+) -> Response:
+    """Revoke all refresh tokens of a user, ending their sessions on every device."""
+    if not current_user.is_admin and current_user.id != user_id:
+        logger.error("User not authorized to revoke refresh tokens of user: %s", user_id)
+        raise HTTPException(status_code=403, detail="Not authorized to revoke refresh tokens")
+    await revoke_refresh_tokens(db, RefreshToken.user_id == user_id)
+    await db.commit()
+    logger.info("Revoked refresh tokens of user with id: %s", user_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/{user_id}/purge", response_model=PurgeJobRead)
+async def get_purge_job(
+        user_id: int,
+        db: AsyncSession = Depends(get_db_session),
+        current_user: User = Depends(get_current_user)
+) -> Response:
+    """Get the latest purge job of a deleted user."""
+    if not current_user.is_admin and current_user.id != user_id:
+        logger.error("User not authorized to access purge job of user: %s", user_id)
+        raise HTTPException(status_code=403, detail="Not authorized to access purge job")
+    job = (await db.exec(
+        select(PurgeJob).where(PurgeJob.user_id == user_id).order_by(col(PurgeJob.id).desc())
+    )).first()
+    if not job:
+        logger.error("Purge job not found for user: %s", user_id)
+        raise HTTPException(status_code=404, detail="Purge job not found")
+    return serialize(PurgeJobRead, job)
@@ -1,23 +1,36 @@
+import enum
+from datetime import datetime
 from typing import List
 
-from pydantic import BaseModel, SecretStr, EmailStr
-from sqlalchemy.types import String, BigInteger, Boolean
+from pydantic import BaseModel, ConfigDict, SecretStr, EmailStr
+from sqlalchemy import Index
+from sqlalchemy.types import String, BigInteger, Boolean, DateTime, Enum, Integer
 from sqlmodel import SQLModel, Field as SQLField, Relationship
 
 
 class User(SQLModel, table=True):  # type: ignore
     __tablename__ = "users"
 
-    id: int | None = SQLField(default=None, primary_key=True, sa_type=BigInteger)
+    id: int | None = SQLField(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger().with_variant(Integer, "sqlite")
+    )
     email: EmailStr = SQLField(index=True, unique=True, sa_type=String)
     name: str = SQLField(nullable=False, sa_type=String)
     password_hash: str = SQLField(nullable=False, sa_type=String)
     is_admin: bool = SQLField(default=False, sa_type=Boolean)
+    deleted_at: datetime | None = SQLField(default=None, nullable=True, sa_type=DateTime)
 
-    chats: List["Chat"] = Relationship(sa_relationship_kwargs=dict(cascade="all, delete"))  # type: ignore # noqa: F821
+    # Chats are deleted by the database, see the ``ON DELETE CASCADE`` foreign keys.
+    chats: List["Chat"] = Relationship(  # type: ignore # noqa: F821
+        sa_relationship_kwargs=dict(cascade="all, delete", passive_deletes=True)
+    )
 
 
 class UserRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     email: EmailStr
     name: str
@@ -34,3 +47,67 @@ class UserUpdate(BaseModel):
     email: EmailStr | None = None
     name: str | None = None
     password: SecretStr | None = None
+
+
+class PurgeStatus(str, enum.Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+
+
+class PurgeJob(SQLModel, table=True):  # type: ignore
+    """Removal of the data of a deleted user in batches, see ``app.jobs.purge``.
+
+    Jobs outlive their user, so ``user_id`` is no foreign key.
+    """
+
+    __tablename__ = "purge_job"
+    __table_args__ = (Index("ix_purge_job_status_updated_at", "status", "updated_at"),)
+
+    id: int | None = SQLField(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger().with_variant(Integer, "sqlite")
+    )
+    user_id: int = SQLField(index=True, nullable=False, sa_type=BigInteger)
+    status: PurgeStatus = SQLField(
+        default=PurgeStatus.pending,
+        nullable=False,
+        sa_type=Enum(PurgeStatus)  # type: ignore
+    )
+    created_at: datetime = SQLField(
+        default_factory=datetime.utcnow,
+        nullable=False,
+        sa_type=DateTime
+    )
+    updated_at: datetime = SQLField(
+        default_factory=datetime.utcnow,
+        nullable=False,
+        sa_type=DateTime
+    )
+    finished_at: datetime | None = SQLField(default=None, nullable=True, sa_type=DateTime)
+    chats_deleted: int = SQLField(
+        default=0,
+        nullable=False,
+        sa_type=Integer,
+        sa_column_kwargs=dict(server_default="0")
+    )
+    messages_deleted: int = SQLField(
+        default=0,
+        nullable=False,
+        sa_type=BigInteger,
+        sa_column_kwargs=dict(server_default="0")
+    )
+
+
+class PurgeJobRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    status: PurgeStatus
+    created_at: datetime
+    updated_at: datetime
+    finished_at: datetime | None
+    chats_deleted: int
+    messages_deleted: int
@@ -1,9 +1,11 @@
-from sqlmodel import Session
-from sqlmodel import select
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.api.users.users_schema import User
 
 
-def get_user_by_email(db: Session, email: str) -> User | None:
-    """Get a user."""
-    return db.exec(select(User).where(User.email == email)).first()
+async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
+    """Get a user, unless deleted."""
+    return (await db.exec(
+        select(User).where(User.email == email, col(User.deleted_at).is_(None))
+    )).first()
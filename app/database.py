@@ -1,5 +1,314 @@
-from sqlalchemy import create_engine
+"""Module for database engines and sessions."""
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, cast
 
-from app.config import settings
+from sqlalchemy import Engine, create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-engine = create_engine(settings.database.url)
+from app.config import DatabaseSettings, get_settings
+from app.utils.replicas import (
+    Replica,
+    choose_replica,
+    get_request_routing,
+    track_health,
+    track_writes
+)
+from app.utils.pool_statistics import (
+    PoolSnapshot,
+    TimedAsyncAdaptedQueuePool,
+    TimedNullPool,
+    TimedQueuePool,
+    instrument_pool
+)
+
+
+def get_engine_options(database: DatabaseSettings, is_async: bool) -> Dict[str, Any]:
+    """Get keyword arguments for creating an engine from the database settings."""
+    options: Dict[str, Any] = dict(pool_pre_ping=database.pool_pre_ping)
+    connect_args: Dict[str, Any] = {}
+    if database.statement_timeout_ms is not None and database.protocol == "postgresql":
+        connect_args["options"] = f"-c statement_timeout={database.statement_timeout_ms}"
+    if database.external_pooler:
+        # Connections are pooled by e.g. PgBouncer in transaction mode, so every checkout
+        # opens a fresh connection and server-side prepared statements must be disabled.
+        options["poolclass"] = TimedNullPool
+        if database.driver == "psycopg":
+            connect_args["prepare_threshold"] = None
+    else:
+        options.update(
+            poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+            pool_size=database.pool_size,
+            max_overflow=database.max_overflow,
+            pool_timeout=database.pool_timeout,
+            pool_recycle=database.pool_recycle,
+            pool_use_lifo=database.pool_use_lifo,
+        )
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+# The engines are created on first use (or in the app's lifespan), not at import, so that
+# importing the models or the app (e.g. by alembic, tests, or a preloading gunicorn master)
+# neither needs the settings nor loads the database driver. ``engine``, ``async_engine``
+# and ``replicas`` stay available as module attributes and can be replaced, e.g. by tests.
+_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "replicas":
+        return get_replicas()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_engine() -> Engine:
+    """Get the synchronous engine, used for requests unless ``async_mode`` is enabled."""
+    module = globals()
+    if "engine" not in module:
+        with _lock:
+            if "engine" not in module:
+                database = get_settings().database
+                engine = create_engine(
+                    database.url, **get_engine_options(database, is_async=False)
+                )
+                instrument_pool(engine.pool)
+                if not database.async_mode:
+                    _instrument_primary_engine(engine)
+                module["engine"] = engine
+    return module["engine"]
+
+
+def get_async_engine() -> AsyncEngine | None:
+    """Get the asynchronous engine if ``async_mode`` is enabled."""
+    module = globals()
+    if "async_engine" not in module:
+        with _lock:
+            if "async_engine" not in module:
+                database = get_settings().database
+                async_engine = None
+                if database.async_mode:
+                    async_engine = create_async_engine(
+                        database.url, **get_engine_options(database, is_async=True)
+                    )
+                    instrument_pool(async_engine.sync_engine.pool)
+                    _instrument_primary_engine(async_engine.sync_engine)
+                module["async_engine"] = async_engine
+    return module["async_engine"]
+
+
+def get_replicas() -> List[Replica]:
+    """Get the read replicas, if any are configured."""
+    module = globals()
+    if "replicas" not in module:
+        with _lock:
+            if "replicas" not in module:
+                database = get_settings().database
+                weights = database.replica_weights or [1.0] * len(database.replica_urls)
+                module["replicas"] = [
+                    _create_replica(database, url.get_secret_value(), weight, f"replica{i}")
+                    for i, (url, weight) in enumerate(zip(database.replica_urls, weights))
+                ]
+    return module["replicas"]
+
+
+def _create_replica(
+        database: DatabaseSettings,
+        url: str,
+        weight: float,
+        name: str
+) -> Replica:
+    async_engine = None
+    if database.async_mode:
+        async_engine = create_async_engine(url, **get_engine_options(database, is_async=True))
+        engine = async_engine.sync_engine
+    else:
+        engine = create_engine(url, **get_engine_options(database, is_async=False))
+    instrument_pool(engine.pool)
+    _instrument_serving_engine(engine, name)
+    replica = Replica(engine, async_engine, weight, cooldown=database.replica_cooldown)
+    track_health(replica)
+    return replica
+
+
+def get_serving_engine() -> Engine:
+    """Get the (synchronous view of the) engine serving requests, creating it if needed."""
+    async_engine = get_async_engine()
+    return async_engine.sync_engine if async_engine is not None else get_engine()
+
+
+async def dispose_engines() -> None:
+    """Dispose the pools of the engines created so far."""
+    async_engine = globals().get("async_engine")
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine = globals().get("engine")
+    if engine is not None:
+        engine.dispose()
+    for replica in globals().get("replicas", ()):
+        if replica.async_engine is not None:
+            await replica.async_engine.dispose()
+        else:
+            replica.engine.dispose()
+
+
+def dispose_inherited_engines() -> None:
+    """Drop the pooled connections inherited from the parent process, without closing them.
+
+    Called in forked worker processes, so connections opened before the fork (e.g. by a
+    preloading gunicorn master) are never shared between processes.
+    """
+    engine = globals().get("engine")
+    if engine is not None:
+        engine.dispose(close=False)
+    async_engine = globals().get("async_engine")
+    if async_engine is not None:
+        # Without closing connections, disposing does no IO and needs no event loop.
+        async_engine.sync_engine.dispose(close=False)
+    for replica in globals().get("replicas", ()):
+        replica.engine.dispose(close=False)
+
+
+def _instrument_primary_engine(engine: Engine) -> None:
+    _instrument_serving_engine(engine, "primary")
+    if get_settings().database.replica_urls:
+        track_writes(engine)
+
+
+def _instrument_serving_engine(engine: Engine, name: str) -> None:
+    settings = get_settings()
+    if settings.metrics.enabled:
+        from app.utils import metrics
+
+        metrics.instrument_engine(engine, name)
+    if settings.query_tracing.enabled:
+        from app.utils import query_tracing
+
+        query_tracing.instrument_engine(
+            engine, slow_query_threshold_ms=settings.query_tracing.slow_query_threshold_ms
+        )
+
+
+def get_pool_statistics() -> PoolSnapshot:
+    """Get statistics for the pool serving requests."""
+    pool = get_serving_engine().pool
+    return pool.statistics.snapshot(pool)  # type: ignore[attr-defined]
+
+
+class ThreadedScalarResult:
+    """Async iteration over a synchronous, server-side cursor backed scalar result."""
+
+    def __init__(self, result: Any) -> None:
+        self._result = result
+
+    async def partitions(self, size: int | None = None) -> AsyncIterator[List[Any]]:
+        partitions: Iterator[List[Any]] = self._result.partitions(size)
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                break
+            yield partition
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        async for partition in self.partitions():
+            for item in partition:
+                yield item
+
+
+class ThreadedSession:
+    """Awaitable facade over a synchronous session.
+
+    Mirrors the subset of the ``AsyncSession`` interface used by the routers, so handlers
+    are written once against ``AsyncSession`` and run unchanged when ``async_mode`` is
+    disabled. Blocking calls are executed in the AnyIO threadpool.
+    """
+
+    def __init__(self, session: Session) -> None:
+        self.sync_session = session
+
+    def add(self, instance: Any) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances: Any) -> None:
+        self.sync_session.add_all(instances)
+
+    async def exec(self, statement: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.exec, statement, **kwargs)
+
+    async def execute(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs)
+
+    async def stream_scalars(self, statement: Any, **kwargs: Any) -> ThreadedScalarResult:
+        result = await run_in_threadpool(self.sync_session.scalars, statement, **kwargs)
+        return ThreadedScalarResult(result)
+
+    async def scalar(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity: Any, ident: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance: Any) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance: Any, **kwargs: Any) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, **kwargs)
+
+    async def connection(self) -> Any:
+        return await run_in_threadpool(self.sync_session.connection)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+def _create_session(async_engine: AsyncEngine | None, engine: Engine | None) -> AsyncSession:
+    if async_engine is not None:
+        return AsyncSession(async_engine, expire_on_commit=False)
+    return cast(AsyncSession, ThreadedSession(Session(engine, expire_on_commit=False)))
+
+
+@asynccontextmanager
+async def open_session(replica: bool | None = None) -> AsyncIterator[AsyncSession]:
+    """Open a database session for the configured mode.
+
+    The session reads from a replica if ``replica`` is true or, by default, if the current
+    request is routed to one (see ``ReplicaRoutingMiddleware``). Without a healthy
+    replica, or if connecting to the chosen one fails, the primary is used.
+    """
+    if replica is None:
+        routing = get_request_routing()
+        replica = routing is not None and routing.use_replica
+    chosen = choose_replica(get_replicas()) if replica else None
+    session = None
+    if chosen is not None:
+        session = _create_session(chosen.async_engine, chosen.engine)
+        try:
+            # Connect up front, so a failing replica falls back to the primary instead of
+            # failing the request. It is avoided from then on, see ``track_health``.
+            await session.connection()
+        except exc.OperationalError:
+            await session.close()
+            session = None
+    if session is None:
+        async_engine = get_async_engine()
+        session = _create_session(async_engine, None if async_engine else get_engine())
+    try:
+        yield session
+    finally:
+        await session.close()
@@ -0,0 +1,214 @@
+"""Maintenance of the chat message storage.
+
+``partitions`` creates the monthly partitions of ``chat_message`` for the coming months
+and drops empty partitions older than the archive window. ``archive`` moves the messages
+of chats idle for longer than the archive window into ``chat_message_archive``. Both are
+idempotent and meant to run regularly, e.g. daily from cron; ``partitions`` also runs
+before startup.
+
+Usage:
+    python -m app.jobs.chat_storage partitions
+    python -m app.jobs.chat_storage archive
+"""
+import argparse
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import Connection, Engine, delete, or_, text
+from sqlmodel import Session, col, select
+
+from app.api.chats.chats_archive import decode_messages, encode_messages
+from app.api.models import Chat, ChatMessage, ChatMessageArchive
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = "chat_message"
+# The table partitioned by migration c5d8f1a3b7e2, which its downgrade restores.
+LEGACY_PARTITION = "chat_message_legacy"
+# Partition DDL waits at most this long for its lock instead of queueing all queries
+# behind it.
+LOCK_TIMEOUT = "5s"
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    years, month = divmod(value.month - 1 + months, 12)
+    return value.replace(year=value.year + years, month=month + 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARTITIONED_TABLE}_p{start:%Y%m}"
+
+
+def parse_upper_bound(bound: str) -> datetime | None:
+    """Parse the upper bound of a partition bound expression, ``None`` for ``MAXVALUE``."""
+    match = _UPPER_BOUND.search(bound)
+    return datetime.fromisoformat(match.group(1)) if match else None
+
+
+def list_partitions(connection: Connection) -> List[Tuple[str, datetime | None]]:
+    """Names and upper bounds of the partitions, empty if the table is not partitioned."""
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass)"
+    ), dict(table=PARTITIONED_TABLE)).all()
+    return [(name, parse_upper_bound(bound)) for name, bound in rows]
+
+
+def ensure_partitions(connection: Connection, now: datetime, months_ahead: int) -> List[str]:
+    """Create the missing monthly partitions up to ``months_ahead`` months after ``now``.
+
+    Partitions continue from the newest one, so a gap left by a missed run is filled.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    partitions = list_partitions(connection)
+    if not partitions:
+        logger.warning("%s is not partitioned, run the migrations first", PARTITIONED_TABLE)
+        return []
+    bounds = [bound for _, bound in partitions]
+    if None in bounds:
+        return []
+    start = max(bound for bound in bounds if bound is not None)
+    end = add_months(month_start(now), months_ahead + 1)
+    created = []
+    connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    while start < end:
+        name = partition_name(start)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARTITIONED_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{add_months(start, 1).isoformat()}')"
+        ))
+        created.append(name)
+        start = add_months(start, 1)
+    return created
+
+
+def drop_empty_partitions(connection: Connection, before: datetime) -> List[str]:
+    """Drop partitions ending before ``before`` whose messages were all archived.
+
+    The legacy partition is kept even if empty, as downgrading the migrations needs it.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    dropped = []
+    connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    for name, bound in list_partitions(connection):
+        if bound is None or bound > before or name == LEGACY_PARTITION:
+            continue
+        # Names come from the catalog, messages are never inserted into past partitions.
+        if not connection.execute(text(f"SELECT EXISTS (SELECT FROM {name})")).scalar():
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def archive_chat(session: Session, chat_id: int, idle_before: datetime, now: datetime) -> int:
+    """Move the messages of an idle chat into its archive, return how many were moved."""
+    chat = session.exec(
+        select(Chat)
+        .where(Chat.id == chat_id, col(Chat.last_message_at) < idle_before)
+        .with_for_update()
+    ).first()
+    if chat is None:
+        # A message was appended since the chat was selected.
+        return 0
+    messages = session.exec(
+        select(ChatMessage)
+        .where(ChatMessage.chat_id == chat_id)
+        .order_by(col(ChatMessage.created_at), col(ChatMessage.id))
+    ).all()
+    archive = session.get(ChatMessageArchive, chat_id)
+    if messages:
+        archived = decode_messages(chat_id, archive.data) if archive is not None else []
+        if archive is None:
+            archive = ChatMessageArchive(chat_id=chat_id, archived_at=now)
+        archive.data = encode_messages([*archived, *messages])
+        archive.message_count = len(archived) + len(messages)
+        archive.last_message_id = max(message.id or 0 for message in messages)
+        archive.archived_at = now
+        session.add(archive)
+        session.exec(  # type: ignore[call-overload]
+            delete(ChatMessage).where(
+                col(ChatMessage.chat_id) == chat_id,
+                col(ChatMessage.id) <= archive.last_message_id,
+                # Lets Postgres skip the partitions of newer messages.
+                col(ChatMessage.created_at) <= max(message.created_at for message in messages)
+            )
+        )
+    chat.archived_at = now
+    session.add(chat)
+    session.commit()
+    return len(messages)
+
+
+def archive_idle_chats(
+        engine: Engine,
+        idle_before: datetime,
+        batch_size: int,
+        now: datetime | None = None
+) -> int:
+    """Archive the chats without messages since ``idle_before``, one transaction per chat.
+
+    Chats archived before are archived again once messages appended since are idle.
+    """
+    now = now or datetime.utcnow()
+    archived = 0
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            chat_ids = session.exec(
+                select(Chat.id)
+                .where(
+                    col(Chat.id) > last_id,
+                    col(Chat.last_message_at) < idle_before,
+                    or_(
+                        col(Chat.archived_at).is_(None),
+                        col(Chat.last_message_at) > col(Chat.archived_at)
+                    )
+                )
+                .order_by(col(Chat.id))
+                .limit(batch_size)
+            ).all()
+            for chat_id in chat_ids:
+                archived += archive_chat(session, chat_id, idle_before, now)  # type: ignore
+        if len(chat_ids) < batch_size:
+            return archived
+        last_id = chat_ids[-1]  # type: ignore
+
+
+def run(command: str) -> None:
+    from app.database import get_engine
+
+    settings = get_settings()
+    now = datetime.utcnow()
+    idle_before = now - timedelta(days=settings.chat.archive_after_days)
+    engine = get_engine()
+    if command == "partitions":
+        with engine.begin() as connection:
+            created = ensure_partitions(connection, now, settings.chat.partition_months_ahead)
+            dropped = drop_empty_partitions(connection, month_start(idle_before))
+        logger.info("Ensured partitions %s, dropped empty partitions %s", created, dropped)
+    elif command == "archive":
+        count = archive_idle_chats(engine, idle_before, settings.chat.archive_batch_size, now)
+        logger.info("Archived %s messages of chats idle since %s", count, idle_before)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("partitions", "archive"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    run(args.command)
+
+
+if __name__ == "__main__":
+    main()
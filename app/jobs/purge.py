@@ -0,0 +1,142 @@
+"""Background purge of the data of deleted users.
+
+``DELETE /users/{user_id}`` marks users with many messages deleted and queues a
+``PurgeJob`` instead of deleting all their data within the request. The worker removes
+their messages, chats and finally the user in batches, one short transaction each, and
+records the progress on the job.
+
+A job is leased to a worker while it makes progress. A job whose worker stopped is taken
+over once the lease expires, which is safe as purging is idempotent.
+
+Usage:
+    python -m app.jobs.purge         # runs until stopped, polling for jobs
+    python -m app.jobs.purge --once  # purges the queued jobs, then exits
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Engine, and_, delete, or_, update
+from sqlmodel import Session, col, select
+
+from app.api.models import Chat, ChatMessage, PurgeJob, User
+from app.api.users.users_schema import PurgeStatus
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def claim_job(engine: Engine, now: datetime, lease: timedelta) -> PurgeJob | None:
+    """Take the oldest pending job, or a running job whose lease expired."""
+    with Session(engine, expire_on_commit=False) as session:
+        job = session.exec(
+            select(PurgeJob)
+            .where(or_(
+                PurgeJob.status == PurgeStatus.pending,
+                and_(
+                    PurgeJob.status == PurgeStatus.running,
+                    col(PurgeJob.updated_at) < now - lease
+                )
+            ))
+            .order_by(col(PurgeJob.id))
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if job is None:
+            return None
+        job.status = PurgeStatus.running
+        job.updated_at = now
+        session.add(job)
+        session.commit()
+        return job
+
+
+def _record_progress(session: Session, job_id: int, **counts: int) -> None:
+    session.exec(  # type: ignore[call-overload]
+        update(PurgeJob)
+        .where(col(PurgeJob.id) == job_id)
+        .values(
+            updated_at=datetime.utcnow(),
+            **{name: getattr(PurgeJob, name) + count for name, count in counts.items()}
+        )
+    )
+
+
+def purge_batch(session: Session, job: PurgeJob, batch_size: int) -> bool:
+    """Delete the next batch of the user's data, return whether the user is purged."""
+    message_ids = session.exec(
+        select(ChatMessage.id)
+        .join(Chat, col(Chat.id) == ChatMessage.chat_id)
+        .where(Chat.user_id == job.user_id)
+        .limit(batch_size)
+    ).all()
+    if message_ids:
+        result = session.exec(  # type: ignore[call-overload]
+            delete(ChatMessage).where(col(ChatMessage.id).in_(message_ids))
+        )
+        _record_progress(session, job.id or 0, messages_deleted=result.rowcount)
+        return False
+    chat_ids = session.exec(
+        select(Chat.id).where(Chat.user_id == job.user_id).limit(batch_size)
+    ).all()
+    if chat_ids:
+        # Archived messages are deleted with their chat.
+        result = session.exec(  # type: ignore[call-overload]
+            delete(Chat).where(col(Chat.id).in_(chat_ids))
+        )
+        _record_progress(session, job.id or 0, chats_deleted=result.rowcount)
+        return False
+    session.exec(delete(User).where(col(User.id) == job.user_id))  # type: ignore[call-overload]
+    now = datetime.utcnow()
+    session.exec(  # type: ignore[call-overload]
+        update(PurgeJob)
+        .where(col(PurgeJob.id) == job.id)
+        .values(status=PurgeStatus.done, updated_at=now, finished_at=now)
+    )
+    return True
+
+
+def purge_user(engine: Engine, job: PurgeJob, batch_size: int) -> None:
+    """Purge the data of the job's user, one transaction per batch."""
+    done = False
+    while not done:
+        with Session(engine) as session:
+            done = purge_batch(session, job, batch_size)
+            session.commit()
+
+
+def run(once: bool = False) -> None:
+    from app.database import get_engine
+
+    settings = get_settings().purge
+    engine = get_engine()
+    lease = timedelta(seconds=settings.lease_seconds)
+    while True:
+        try:
+            job = claim_job(engine, datetime.utcnow(), lease)
+            if job is not None:
+                logger.info("Purging user with id: %s", job.user_id)
+                purge_user(engine, job, settings.batch_size)
+                logger.info("Purged user with id: %s", job.user_id)
+                continue
+        except Exception:
+            if once:
+                raise
+            # The job is taken over again once its lease expires.
+            logger.exception("Failed to purge user")
+        if once:
+            return
+        time.sleep(settings.poll_interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="Exit when no job is queued.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
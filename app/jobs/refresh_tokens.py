@@ -0,0 +1,56 @@
+"""Deletion of expired refresh tokens.
+
+Used and revoked tokens are kept until they expire, so reuse of a rotated token is still
+detected. Meant to run regularly, e.g. daily from cron.
+
+Usage:
+    python -m app.jobs.refresh_tokens
+"""
+import argparse
+import logging
+from datetime import datetime
+
+from sqlalchemy import Engine, delete
+from sqlmodel import Session, col, select
+
+from app.api.models import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def delete_expired_refresh_tokens(
+        engine: Engine,
+        now: datetime,
+        batch_size: int = BATCH_SIZE
+) -> int:
+    """Delete the tokens expired before ``now`` in batches, return how many were deleted."""
+    deleted = 0
+    while True:
+        with Session(engine) as session:
+            token_ids = session.exec(
+                select(RefreshToken.id)
+                .where(col(RefreshToken.expires_at) < now)
+                .limit(batch_size)
+            ).all()
+            if not token_ids:
+                return deleted
+            session.exec(  # type: ignore[call-overload]
+                delete(RefreshToken).where(col(RefreshToken.id).in_(token_ids))
+            )
+            session.commit()
+            deleted += len(token_ids)
+
+
+def main() -> None:
+    from app.database import get_engine
+
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    count = delete_expired_refresh_tokens(get_engine(), datetime.utcnow())
+    logger.info("Deleted %s expired refresh tokens", count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 """Main module for creating and starting FastAPI app."""
+import functools
 import os
 from contextlib import asynccontextmanager
 from typing import Any, Dict
@@ -9,9 +10,22 @@ from gunicorn import glogging
 from app import __api_title__, __description__, __version__
 from app.api.auth import auth_router
 from app.api.chats import chats_router
+from app.api.chats.chats_events import close_broadcaster
+from app.api.dependencies import get_pwd_context
+from app.api.serialization import FastJSONResponse
 from app.api.users import users_router
-from app.config import settings
-from app.utils.logging import get_logging_config, setup_logging, shutdown_logging
+from app.config import get_settings
+from app.database import dispose_engines, get_replicas, get_serving_engine
+from app.utils.compression import CompressionMiddleware
+from app.utils.load_shedding import AdaptiveConcurrencyLimiter, LoadSheddingMiddleware
+from app.utils.logging import (
+    RequestIdMiddleware,
+    get_logging_config,
+    setup_logging,
+    shutdown_logging
+)
+from app.utils.query_tracing import QueryTracingMiddleware
+from app.utils.replicas import ReplicaRoutingMiddleware
 
 
 class CustomGunicornLogger(glogging.Logger):
@@ -19,27 +33,113 @@ class CustomGunicornLogger(glogging.Logger):
 
     def setup(self, cfg: Dict[str, Any]) -> None:
         """Setup logger."""
-        setup_logging(config_path=settings.logger.config_path)
+        settings = get_settings()
+        setup_logging(
+            config_path=settings.logger.config_path,
+            queued=settings.logger.queued,
+            queue_size=settings.logger.queue_size
+        )
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):  # type: ignore
     """Context manager for app startup and shutdown."""
-    setup_logging(config_path=settings.logger.config_path)
+    settings = get_settings()
+    setup_logging(
+        config_path=settings.logger.config_path,
+        queued=settings.logger.queued,
+        queue_size=settings.logger.queue_size
+    )
+    # Created here rather than at import, so every worker creates its own engine and the
+    # first request does not pay for it.
+    get_serving_engine()
+    get_replicas()
     yield
+    await close_broadcaster()
+    get_pwd_context().shutdown()
+    await dispose_engines()
     shutdown_logging()
 
 
-root = FastAPI(
-    title=__api_title__,
-    description=__description__,
-    version=__version__,
-    lifespan=lifespan
-)
+def create_app() -> FastAPI:
+    """Create the app, with the routers and the middleware enabled in the settings."""
+    settings = get_settings()
+    app = FastAPI(
+        title=__api_title__,
+        description=__description__,
+        version=__version__,
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse
+    )
+
+    app.include_router(auth_router.router)
+    app.include_router(users_router.router)
+    app.include_router(chats_router.router)
+    if settings.database.replica_urls:
+        app.add_middleware(
+            ReplicaRoutingMiddleware,
+            read_your_writes_window=settings.database.read_your_writes_window
+        )
+    if settings.query_tracing.enabled:
+        app.add_middleware(
+            QueryTracingMiddleware,
+            n_plus_one_threshold=settings.query_tracing.n_plus_one_threshold
+        )
+    if settings.metrics.enabled:
+        from app.api.metrics import metrics_router
+        from app.utils.metrics import MetricsMiddleware, observe_compression
+
+        app.include_router(metrics_router.router)
+    if settings.compression.enabled:
+        # Inside the metrics middleware, so request durations include compression.
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression.minimum_size,
+            gzip_level=settings.compression.gzip_level,
+            brotli_quality=settings.compression.brotli_quality,
+            zstd_level=settings.compression.zstd_level,
+            observer=observe_compression if settings.metrics.enabled else None
+        )
+    if settings.load_shedding.enabled:
+        load_shedding = settings.load_shedding
+
+        def create_limiter(target_latency_ms: float) -> AdaptiveConcurrencyLimiter:
+            return AdaptiveConcurrencyLimiter(
+                initial_limit=load_shedding.initial_limit,
+                min_limit=load_shedding.min_limit,
+                max_limit=load_shedding.max_limit,
+                target_latency=target_latency_ms / 1000,
+                max_queue=load_shedding.max_queue,
+                max_queue_wait=load_shedding.max_queue_wait_ms / 1000
+            )
+
+        hashing_limiter = create_limiter(load_shedding.hashing_target_latency_ms)
+        # Outside compression, so shed requests cost as little as possible.
+        app.add_middleware(
+            LoadSheddingMiddleware,
+            limiter=create_limiter(load_shedding.target_latency_ms),
+            retry_after=load_shedding.retry_after,
+            exempt_paths=load_shedding.exempt_paths,
+            route_limiters=[(route, hashing_limiter) for route in load_shedding.hashing_routes]
+        )
+    if settings.metrics.enabled:
+        app.add_middleware(MetricsMiddleware)
+    app.add_middleware(RequestIdMiddleware)
+    return app
+
+
+@functools.cache
+def get_app() -> FastAPI:
+    return create_app()
+
+
+def __getattr__(name: str) -> Any:
+    # ``app.main:root`` is created on first access, so importing the module reads no
+    # settings.
+    if name == "root":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-root.include_router(auth_router.router)
-root.include_router(users_router.router)
-root.include_router(chats_router.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -48,6 +148,6 @@ if __name__ == "__main__":
         app="app.main:root",
         host=os.environ.get("HOST", "127.0.0.1"),
         port=os.environ.get("PORT", 8080),
-        log_config=get_logging_config(config_path=settings.logger.config_path),
+        log_config=get_logging_config(config_path=get_settings().logger.config_path),
         reload=True
     )
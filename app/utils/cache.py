@@ -0,0 +1,178 @@
+"""Module for in-process caching utilities."""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Iterable, List, Tuple, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+V = TypeVar("V")
+
+CacheObserver = Callable[[bool], None]
+
+
+class FileInvalidationChannel:
+    """Cross-process invalidation log backed by an append-only file.
+
+    Every process sharing the file appends invalidated keys and reads the keys appended by
+    the others, at most once per ``poll_interval`` seconds. Once the file exceeds
+    ``max_bytes`` it is replaced by an empty one. Readers detect the new file, or a file
+    shorter than what they read, and treat it as "invalidate all", as they may have missed
+    keys. All methods but ``due`` do blocking file I/O.
+    """
+
+    def __init__(self, path: str, poll_interval: float, max_bytes: int = 1024 * 1024) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._inode, self._offset = self._stat()
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def publish(self, keys: Iterable[str]) -> None:
+        data = "".join(f"{key}\n" for key in keys).encode()
+        if not data:
+            return
+        if self._stat()[1] > self.max_bytes:
+            # Replaced rather than truncated, so readers cannot mistake the file growing
+            # again for keys appended after the ones they read.
+            fd, new_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or None)
+            os.close(fd)
+            os.replace(new_path, self.path)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def due(self) -> bool:
+        """Whether ``poll`` would read the file."""
+        return time.monotonic() >= self._next_poll
+
+    def poll(self) -> Tuple[bool, List[str]]:
+        """Return ``(reset, keys)`` published since the last poll."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_poll:
+                return False, []
+            self._next_poll = now + self.poll_interval
+            try:
+                file = open(self.path, "rb")
+            except FileNotFoundError:
+                return False, []
+            with file:
+                stat = os.fstat(file.fileno())
+                replaced = stat.st_ino != self._inode
+                reset = (replaced and self._inode is not None) or stat.st_size < self._offset
+                if replaced or reset:
+                    # Read the new file from the start.
+                    self._inode, self._offset = stat.st_ino, 0
+                if stat.st_size == self._offset:
+                    return reset, []
+                file.seek(self._offset)
+                data = file.read(stat.st_size - self._offset)
+            # Only consume complete lines, a concurrent writer may still be appending.
+            data = data[:data.rfind(b"\n") + 1]
+            self._offset += len(data)
+            return reset, data.decode().splitlines()
+
+    def _stat(self) -> Tuple[int | None, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    If a ``channel`` is given, invalidations are published to it and invalidations from
+    other processes are applied before every lookup. On the event loop, ``aget`` and
+    ``ainvalidate`` do so in the threadpool. ``observer`` is called with whether each lookup
+    was a hit, e.g. to export the hit ratio.
+    """
+
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float,
+            channel: FileInvalidationChannel | None = None,
+            clock: Callable[[], float] = time.monotonic,
+            observer: CacheObserver | None = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.channel = channel
+        self.clock = clock
+        self.observer = observer
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> V | None:
+        self._apply_remote_invalidations()
+        return self._lookup(key)
+
+    async def aget(self, key: str) -> V | None:
+        if self.channel is not None and self.channel.due():
+            await run_in_threadpool(self._apply_remote_invalidations)
+        return self._lookup(key)
+
+    def _lookup(self, key: str) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] > self.clock()
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+        if self.observer is not None:
+            self.observer(hit)
+        return entry[1] if hit and entry is not None else None
+
+    def set(self, key: str, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: str) -> None:
+        self._discard(keys)
+        if self.channel is not None:
+            self.channel.publish(keys)
+
+    async def ainvalidate(self, *keys: str) -> None:
+        self._discard(keys)
+        if self.channel is not None:
+            await run_in_threadpool(self.channel.publish, keys)
+
+    def _discard(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _apply_remote_invalidations(self) -> None:
+        if self.channel is None:
+            return
+        reset, keys = self.channel.poll()
+        if reset:
+            self.clear()
+            return
+        self._discard(keys)
@@ -0,0 +1,117 @@
+"""Module for notification channels between worker processes.
+
+A channel carries short text payloads published within a database transaction to every
+listening process, once the transaction committed. ``PostgresChannel`` uses
+``LISTEN``/``NOTIFY``, and can also publish from within another statement.
+``MemoryChannel`` only reaches the current process and stands in for it with other
+databases, e.g. in tests.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Protocol, Set
+
+from sqlalchemy import URL, ColumnElement, Engine, event, func, literal, make_url, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class Channel(Protocol):
+    async def publish(self, db: AsyncSession, payload: str) -> None:
+        """Publish ``payload`` when the transaction of ``db`` commits."""
+
+    def notification(self, payload: ColumnElement[str]) -> ColumnElement[Any] | None:
+        """An expression publishing ``payload`` when evaluated in a statement.
+
+        It is published when the statement's transaction commits. ``None`` if the channel
+        cannot publish from SQL.
+        """
+
+    def listen(self, ready: asyncio.Event) -> AsyncIterator[str]:
+        """Iterate over the published payloads until the channel fails.
+
+        ``ready`` is set once payloads published from then on are received.
+        """
+
+
+class MemoryChannel:
+    """In-process channel, delivering payloads after the publishing session committed."""
+
+    def __init__(self) -> None:
+        self._queues: Set[asyncio.Queue] = set()
+
+    async def publish(self, db: AsyncSession, payload: str) -> None:
+        loop = asyncio.get_running_loop()
+
+        def after_commit(session: Any) -> None:
+            # Synchronous sessions commit in a worker thread.
+            loop.call_soon_threadsafe(self._deliver, payload)
+
+        event.listen(db.sync_session, "after_commit", after_commit, once=True)
+
+    def notification(self, payload: ColumnElement[str]) -> ColumnElement[Any] | None:
+        return None
+
+    def _deliver(self, payload: str) -> None:
+        for queue in self._queues:
+            queue.put_nowait(payload)
+
+    async def listen(self, ready: asyncio.Event) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues.add(queue)
+        ready.set()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues.discard(queue)
+
+
+class PostgresChannel:
+    """Channel using Postgres ``LISTEN``/``NOTIFY``.
+
+    Payloads are limited to 8000 bytes. Listening takes a dedicated connection to ``url``,
+    opened on first use. It has to be a direct connection, as ``LISTEN`` does not work
+    through poolers in transaction mode. All of its parameters are passed on to libpq,
+    including query parameters such as ``sslmode`` or a socket ``host``.
+    """
+
+    def __init__(self, name: str, url: URL) -> None:
+        self.name = name
+        self.url = url
+
+    async def publish(self, db: AsyncSession, payload: str) -> None:
+        await db.exec(select(self.notification(literal(payload))))
+
+    def notification(self, payload: ColumnElement[str]) -> ColumnElement[Any]:
+        # Postgres delivers notifications on commit and drops them on rollback.
+        return func.pg_notify(self.name, payload)
+
+    async def listen(self, ready: asyncio.Event) -> AsyncIterator[str]:
+        import psycopg
+        from psycopg import sql
+
+        connection = await psycopg.AsyncConnection.connect(
+            conninfo_from_url(self.url), autocommit=True
+        )
+        async with connection:
+            await connection.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.name)))
+            ready.set()
+            async for notify in connection.notifies():
+                yield notify.payload
+
+
+def conninfo_from_url(url: URL) -> str:
+    """Render a SQLAlchemy URL as a libpq connection URI."""
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def create_channel(name: str, engine: Engine, listen_url: str | URL | None = None) -> Channel:
+    """Create a channel suitable for the database of ``engine``.
+
+    Postgres channels listen on ``listen_url`` if given, else on the engine's URL.
+    """
+    if engine.dialect.name == "postgresql":
+        return PostgresChannel(name, make_url(listen_url) if listen_url else engine.url)
+    logger.warning("Notifications use an in-process channel and do not reach other workers")
+    return MemoryChannel()
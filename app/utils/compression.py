@@ -0,0 +1,248 @@
+"""Module for compressing responses.
+
+Codecs are negotiated by ``Accept-Encoding``: zstd and brotli if their packages
+(``zstandard``, ``brotli``) are installed, gzip and deflate always. Streaming responses are
+compressed chunk by chunk, and every chunk is flushed, so clients receive data as soon as
+it is produced.
+"""
+import importlib.util
+import time
+import zlib
+from typing import Callable, Dict, List, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSIBLE_MEDIA_TYPES = frozenset((
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+))
+# Events are small and need to reach the client immediately.
+UNCOMPRESSED_MEDIA_TYPES = frozenset(("text/event-stream",))
+
+CompressionObserver = Callable[[str, int, int, float], None]
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        """Return all data compressed so far, keeping the stream open."""
+
+    def finish(self) -> bytes:
+        ...
+
+
+class ZlibCompressor:
+    def __init__(self, level: int, wbits: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int) -> None:
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        import zstandard
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type in UNCOMPRESSED_MEDIA_TYPES:
+        return False
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_MEDIA_TYPES
+        or media_type.endswith(("+json", "+xml"))
+    )
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+def negotiate_encoding(accept_encoding: str, encodings: List[str]) -> str | None:
+    """Choose the encoding with the highest quality value among the given ones.
+
+    Ties are resolved by the order of ``encodings``. ``None`` means no compression.
+    """
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with a negotiated encoding.
+
+    Buffered responses below ``minimum_size`` bytes, responses that are already encoded
+    and media types that do not compress well are sent as they are. A compressed response
+    has its ETag weakened, as the encoding changes its bytes. So does a 304 if an encoding
+    was negotiated, to match the response it revalidates. ``observer`` is called with
+    the encoding, the uncompressed and compressed sizes and the CPU time spent for every
+    compressed response.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            minimum_size: int = 1024,
+            gzip_level: int = 6,
+            brotli_quality: int = 4,
+            zstd_level: int = 3,
+            observer: CompressionObserver | None = None
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.observer = observer
+        self.codecs: Dict[str, Callable[[], Compressor]] = {}
+        if importlib.util.find_spec("zstandard"):
+            self.codecs["zstd"] = lambda: ZstdCompressor(zstd_level)
+        if importlib.util.find_spec("brotli"):
+            self.codecs["br"] = lambda: BrotliCompressor(brotli_quality)
+        self.codecs["gzip"] = lambda: ZlibCompressor(gzip_level, zlib.MAX_WBITS | 16)
+        self.codecs["deflate"] = lambda: ZlibCompressor(gzip_level, zlib.MAX_WBITS)
+        self.encodings = list(self.codecs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.encodings)
+        factory = self.codecs[encoding] if encoding is not None else None
+        start: Message | None = None
+        compressor: Compressor | None = None
+        sizes = [0, 0]
+        cpu_time = 0.0
+
+        def compress(data: bytes, final: bool) -> bytes:
+            nonlocal cpu_time
+            assert compressor is not None  # nosec
+            started = time.thread_time()
+            compressed = compressor.compress(data) + (
+                compressor.finish() if final else compressor.flush()
+            )
+            cpu_time += time.thread_time() - started
+            sizes[0] += len(data)
+            sizes[1] += len(compressed)
+            if final and self.observer is not None and encoding is not None:
+                self.observer(encoding, sizes[0], sizes[1], cpu_time)
+            return compressed
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # Sent with the first body chunk, whose size decides about compression.
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                response_start, start = start, None
+                headers = MutableHeaders(scope=response_start)
+                if response_start["status"] == 304:
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None:
+                        weaken_etag(headers)
+                compressible = self._is_compressible(response_start, headers, body, more_body)
+                if not compressible or factory is None or encoding is None:
+                    await send(response_start)
+                    await send(message)
+                    return
+                compressor = factory()
+                headers["Content-Encoding"] = encoding
+                weaken_etag(headers)
+                data = compress(body, final=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(data))
+                await send(response_start)
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+            if compressor is None:
+                await send(message)
+                return
+            data = compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _is_compressible(
+            self,
+            start: Message,
+            headers: MutableHeaders,
+            body: bytes,
+            more_body: bool
+    ) -> bool:
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+            return False
+        # Caches need to know the response depends on the header, compressed or not.
+        headers.add_vary_header("Accept-Encoding")
+        # The size of a streaming response is unknown, it is compressed regardless.
+        return more_body or len(body) >= self.minimum_size
+
@@ -0,0 +1,184 @@
+"""Module for shedding load with an adaptive concurrency limit.
+
+Requests beyond the concurrency limit of a worker wait in a bounded queue. Requests that
+would wait longer than ``max_queue_wait`` are rejected with 503 and ``Retry-After`` instead of
+queueing until they time out. The limit adapts to the latency of admitted requests: when
+even the fastest request of an interval took longer than the target, requests queue
+somewhere in the worker (event loop, threadpool, connection pool), and the limit is
+decreased; while requests are fast and the limit is reached, it is increased. Routes far
+slower than the target, e.g. hashing passwords, are admitted by limiters of their own, so
+they do not lower the limit of the others.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from typing import Callable, Deque, Iterable, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdaptiveConcurrencyLimiter:
+    """Concurrency limit adapted by additive increase and multiplicative decrease.
+
+    Latency samples exclude the time waiting for admission, so a queue in front of the
+    limit does not lower the limit further.
+    """
+
+    def __init__(
+            self,
+            initial_limit: int,
+            min_limit: int,
+            max_limit: int,
+            target_latency: float,
+            max_queue: int,
+            max_queue_wait: float,
+            interval: float = 1.0,
+            backoff: float = 0.9,
+            clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.interval = interval
+        self.backoff = backoff
+        self.clock = clock
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._interval_end = clock() + interval
+        self._min_latency: float | None = None
+        self._saturated = False
+
+    async def acquire(self) -> None:
+        """Wait for admission, raise ``Overloaded`` if the request is shed."""
+        if self.in_flight < self.limit and not self._waiters:
+            self._admit()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_queue_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                raise Overloaded()
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release(None)
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: float | None) -> None:
+        """Release an admitted request, with its latency if it completed."""
+        self.in_flight -= 1
+        if latency is not None:
+            self._observe(latency)
+        while self._waiters and self.in_flight < self.limit:
+            self._admit()
+            self._waiters.popleft().set_result(None)
+
+    def _admit(self) -> None:
+        self.in_flight += 1
+        if self.in_flight >= self.limit:
+            self._saturated = True
+
+    def _observe(self, latency: float) -> None:
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        now = self.clock()
+        if now < self._interval_end:
+            return
+        if self._min_latency > self.target_latency:
+            self.limit = max(self.min_limit, int(self.limit * self.backoff))
+            logger.warning(
+                "Requests take at least %.0f ms, lowering concurrency limit to %d",
+                self._min_latency * 1000, self.limit
+            )
+        elif self._saturated:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self._interval_end = now + self.interval
+        self._min_latency = None
+        self._saturated = self.in_flight >= self.limit
+
+
+class LoadSheddingMiddleware:
+    """ASGI middleware admitting requests through an ``AdaptiveConcurrencyLimiter``.
+
+    A request holds its slot until the response starts, so long-lived streams do not
+    occupy slots. Requests to ``exempt_paths``, e.g. metrics, are always admitted. Requests
+    matching a route of ``route_limiters``, a regular expression over ``"METHOD path"``, are
+    admitted by its limiter instead of ``limiter``.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            limiter: AdaptiveConcurrencyLimiter,
+            retry_after: int,
+            exempt_paths: Iterable[str] = (),
+            route_limiters: Iterable[Tuple[str, AdaptiveConcurrencyLimiter]] = ()
+    ) -> None:
+        self.app = app
+        self.limiter = limiter
+        self.retry_after = retry_after
+        self.exempt_paths = frozenset(exempt_paths)
+        self.route_limiters = [
+            (re.compile(route), route_limiter) for route, route_limiter in route_limiters
+        ]
+
+    def get_limiter(self, scope: Scope) -> AdaptiveConcurrencyLimiter:
+        route = f"{scope['method']} {scope['path']}"
+        for pattern, limiter in self.route_limiters:
+            if pattern.fullmatch(route):
+                return limiter
+        return self.limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.get_limiter(scope)
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            response = JSONResponse(
+                {"detail": "Service busy, please retry later"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        admitted = time.perf_counter()
+        released = False
+
+        def release(latency: float | None) -> None:
+            nonlocal released
+            if not released:
+                released = True
+                limiter.release(latency)
+
+        async def send_releasing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                release(time.perf_counter() - admitted)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_releasing)
+        finally:
+            release(None)
@@ -1,27 +1,270 @@
 """Module for logging utilities."""
+import atexit
+import copy
 import functools
+import json
 import logging
 import logging.config
-from typing import Any, Dict
+import os
+import queue
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Sequence, Tuple
 
-import yaml
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+_base_record_factory = logging.getLogRecordFactory()
+_listeners: List[Tuple["DroppingQueueHandler", QueueListener]] = []
 
 
 @functools.cache
 def get_logging_config(config_path: str) -> Dict[str, Any]:
     """Get logging configuration."""
+    import yaml
+
     with open(config_path, "r") as file:
         return yaml.safe_load(file)
 
 
-def setup_logging(config_path: str) -> None:
-    """Setup logging."""
+def setup_logging(config_path: str, queued: bool = False, queue_size: int = 10_000) -> None:
+    """Setup logging.
+
+    With ``queued``, every configured handler is fed through a bounded queue by a
+    background listener thread, so logging never blocks on slow output. Records are
+    dropped when the queue is full.
+    """
+    _stop_listeners()
+    logging.setLogRecordFactory(_record_factory)
     log_config = get_logging_config(config_path=config_path)
     logging.config.dictConfig(log_config)
+    if queued:
+        _install_queue_handlers(queue_size)
 
 
 def shutdown_logging() -> None:
     """Shutdown logging."""
     logger = logging.getLogger()
     logger.info("Shutting down...")
+    _stop_listeners()
     logging.shutdown(logger.handlers)
+
+
+def get_request_id() -> str | None:
+    return _request_id.get()
+
+
+def _record_factory(*args: Any, **kwargs: Any) -> logging.LogRecord:
+    record = _base_record_factory(*args, **kwargs)
+    record.request_id = _request_id.get()
+    return record
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full.
+
+    The number of dropped records is reported with the next record that fits.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called with the handler's lock held, so the counter needs no extra lock.
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped_record = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "Dropped %d log records, the logging queue was full", (self.dropped,), None
+            )
+            try:
+                self.queue.put_nowait(self.prepare(dropped_record))
+                self.dropped = 0
+            except queue.Full:
+                pass
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the default, keep the message and traceback separate so the handlers'
+        # formatters can place them, e.g. as JSON fields.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _QueueListener(QueueListener):
+    def stop(self) -> None:
+        # Waits for room for the sentinel instead of failing on a full queue. A thread
+        # inherited through a fork is not alive and is not waited for.
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(self._sentinel)
+            self._thread.join()
+        self._thread = None
+
+
+def _get_loggers() -> List[logging.Logger]:
+    return [logging.getLogger()] + [
+        logger for logger in logging.root.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]
+
+
+def _install_queue_handlers(queue_size: int) -> None:
+    """Replace every handler of the configured loggers with a queue handler feeding it."""
+    loggers = _get_loggers()
+    queue_handlers: Dict[logging.Handler, DroppingQueueHandler] = {}
+    for logger in loggers:
+        for index, handler in enumerate(logger.handlers):
+            queue_handler = queue_handlers.get(handler)
+            if queue_handler is None:
+                queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+                # Filters run before enqueueing, so sampled out records never use the queue.
+                for log_filter in list(handler.filters):
+                    queue_handler.addFilter(log_filter)
+                    handler.removeFilter(log_filter)
+                queue_handler.setLevel(handler.level)
+                listener = _QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+                listener.start()
+                queue_handlers[handler] = queue_handler
+                _listeners.append((queue_handler, listener))
+            logger.handlers[index] = queue_handler
+
+
+def _stop_listeners() -> None:
+    """Stop the queue listeners after they handled all queued records.
+
+    The original handlers are put back in place of the queue handlers, so records logged
+    afterwards, e.g. while the process exits, are still written.
+    """
+    if not _listeners:
+        return
+    replacements: Dict[logging.Handler, logging.Handler] = {}
+    while _listeners:
+        queue_handler, listener = _listeners.pop()
+        listener.stop()
+        handler = listener.handlers[0]
+        for log_filter in list(queue_handler.filters):
+            handler.addFilter(log_filter)
+            queue_handler.removeFilter(log_filter)
+        replacements[queue_handler] = handler
+    for logger in _get_loggers():
+        logger.handlers = [replacements.get(handler, handler) for handler in logger.handlers]
+
+
+def _restart_listeners_after_fork() -> None:
+    # Threads do not survive a fork, so a forked worker (e.g. of gunicorn) needs its own
+    # listener threads. Fresh queues avoid inheriting locks held by the parent's threads;
+    # records still queued in them are the parent's to write.
+    for queue_handler, listener in _listeners:
+        queue_handler.queue = listener.queue = queue.Queue(maxsize=listener.queue.maxsize)
+        listener._thread = None
+        listener.start()
+
+
+# Registered after the logging module's own exit handler, so queued records are written
+# before logging shuts down.
+atexit.register(_stop_listeners)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects, including the request id if any."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "timestamp": "%s.%03dZ" % (
+                time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)), record.msecs
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes only a ``rate`` fraction of the records at or below ``level``.
+
+    Sampling applies to the loggers starting with one of ``loggers``, or to all loggers if
+    none are given. Records above ``level`` always pass.
+    """
+
+    def __init__(
+            self,
+            rate: float = 1.0,
+            level: int | str = logging.INFO,
+            loggers: Sequence[str] = ()
+    ) -> None:
+        super().__init__()
+        self.rate = rate
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.loggers = tuple(loggers)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        if self.loggers and not record.name.startswith(self.loggers):
+            return True
+        return random.random() < self.rate  # nosec
+
+
+class RequestIdMiddleware:
+    """ASGI middleware making a request id available to log records and the client.
+
+    The id is taken from the ``X-Request-ID`` request header if present, or generated, and
+    returned in the same response header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, request_id)
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _request_id.reset(token)
@@ -0,0 +1,230 @@
+"""Module for Prometheus metrics.
+
+When the ``PROMETHEUS_MULTIPROC_DIR`` environment variable is set (as done by
+``scripts/startup.sh``), every worker process writes its samples to memory-mapped files in
+that directory and ``/metrics`` aggregates the files of all workers.
+"""
+import os
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+UNMATCHED_ROUTE = "<unmatched>"
+DB_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"))
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests, including sending the response body.",
+    ["method", "route"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being processed.",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+RESPONSES = Counter(
+    "http_responses",
+    "HTTP responses by status code.",
+    ["method", "route", "status"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duration of database queries.",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured size of the database connection pools in use.",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Database connections currently checked out of the pools.",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_CONNECTIONS = Counter(
+    "db_pool_connections_created",
+    "Database connections opened by the pools.",
+    ["engine"]
+)
+DB_POOL_INVALIDATIONS = Counter(
+    "db_pool_connections_invalidated",
+    "Database connections invalidated by the pools.",
+    ["engine"]
+)
+COMPRESSION_RATIO = Histogram(
+    "http_response_compression_ratio",
+    "Ratio of uncompressed to compressed size of compressed responses.",
+    ["encoding"],
+    buckets=(1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0, 16.0, 32.0)
+)
+COMPRESSION_CPU = Histogram(
+    "http_response_compression_cpu_seconds",
+    "CPU time spent compressing a response.",
+    ["encoding"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+COMPRESSION_BYTES = Counter(
+    "http_response_compression_bytes",
+    "Bytes of compressed responses, before and after compression.",
+    ["encoding", "stage"]
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups",
+    "Lookups of in-process caches by result.",
+    ["cache", "result"]
+)
+
+
+def generate_metrics() -> Tuple[bytes, str]:
+    """Render all metrics, aggregated over worker processes in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Remove the live gauges of an exited worker process."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request durations, in-flight requests and responses.
+
+    Requests are labelled with the route template rather than the path, so path
+    parameters do not create new series. Label children are cached per label values.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._children: Dict[Tuple[Any, ...], Any] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = self._child(REQUESTS_IN_PROGRESS, method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            self._child(REQUEST_DURATION, method, route).observe(duration)
+            self._child(RESPONSES, method, route, str(status_code)).inc()
+
+    def _child(self, metric: Any, *labels: str) -> Any:
+        key = (id(metric), *labels)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = metric.labels(*labels)
+        return child
+
+
+def observe_compression(
+        encoding: str,
+        uncompressed_size: int,
+        compressed_size: int,
+        cpu_time: float
+) -> None:
+    """Record a compressed response, as observer of ``CompressionMiddleware``."""
+    COMPRESSION_RATIO.labels(encoding).observe(uncompressed_size / max(compressed_size, 1))
+    COMPRESSION_CPU.labels(encoding).observe(cpu_time)
+    COMPRESSION_BYTES.labels(encoding, "uncompressed").inc(uncompressed_size)
+    COMPRESSION_BYTES.labels(encoding, "compressed").inc(compressed_size)
+
+
+def cache_observer(cache: str) -> Callable[[bool], None]:
+    """Return an observer of ``TTLCache`` lookups, counting hits and misses of the cache."""
+    hits = CACHE_LOOKUPS.labels(cache, "hit")
+    misses = CACHE_LOOKUPS.labels(cache, "miss")
+
+    def observe(hit: bool) -> None:
+        (hits if hit else misses).inc()
+
+    return observe
+
+
+def _operation(statement: str) -> str:
+    words = statement[:16].split(None, 1)
+    return words[0].upper() if words else ""
+
+
+def instrument_engine(engine: Engine, name: str = "primary") -> None:
+    """Record query durations and pool usage of an engine.
+
+    Pool metrics are labeled with the ``name`` of the engine, e.g. ``primary`` or
+    ``replica0``, as the pools of the primary and the replicas are sized separately.
+    """
+    durations = {operation: DB_QUERY_DURATION.labels(operation) for operation in DB_OPERATIONS}
+    other_duration = DB_QUERY_DURATION.labels("OTHER")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        conn.info["metrics_query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        start = conn.info.pop("metrics_query_start", None)
+        if start is None:
+            return
+        durations.get(_operation(statement), other_duration).observe(time.perf_counter() - start)
+
+    pool = engine.pool
+    pool_size = pool.size() if isinstance(pool, QueuePool) else 0
+    size = DB_POOL_SIZE.labels(name)
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    connections = DB_POOL_CONNECTIONS.labels(name)
+    invalidations = DB_POOL_INVALIDATIONS.labels(name)
+
+    @event.listens_for(pool, "connect")
+    def on_connect(*_: Any) -> None:
+        # Set on connect rather than here, so the gauge is owned by the worker processes
+        # using the pool and not by a master process that merely imported the app.
+        size.set(pool_size)
+        connections.inc()
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(*_: Any) -> None:
+        checked_out.inc()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(*_: Any) -> None:
+        checked_out.dec()
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(*_: Any) -> None:
+        invalidations.inc()
@@ -0,0 +1,149 @@
+"""Module for connection pool instrumentation."""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PoolSnapshot:
+    """Point-in-time view of a connection pool."""
+
+    pool_class: str
+    pool_size: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    checkout_timeouts: int
+    connections_created: int
+    connections_invalidated: int
+    wait_time_total: float
+    wait_time_max: float
+
+
+class PoolStatistics:
+    """Thread-safe counters collected from pool events."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connections_created = 0
+        self.connections_invalidated = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def record_checkout(self) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+
+    def record_checkin(self) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def record_invalidate(self) -> None:
+        with self._lock:
+            self.connections_invalidated += 1
+
+    def snapshot(self, pool: Pool) -> PoolSnapshot:
+        """Return the current counters together with the pool's sizing."""
+        is_queue_pool = isinstance(pool, QueuePool)
+        with self._lock:
+            return PoolSnapshot(
+                pool_class=type(pool).__name__,
+                pool_size=pool.size() if is_queue_pool else 0,
+                checked_out=self.checked_out,
+                overflow=max(pool.overflow(), 0) if is_queue_pool else 0,
+                checkouts=self.checkouts,
+                checkout_timeouts=self.checkout_timeouts,
+                connections_created=self.connections_created,
+                connections_invalidated=self.connections_invalidated,
+                wait_time_total=self.wait_time_total,
+                wait_time_max=self.wait_time_max,
+            )
+
+
+class _TimedPoolMixin:
+    """Measures how long callers wait to obtain a connection from the pool."""
+
+    statistics: PoolStatistics
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.statistics = PoolStatistics()
+
+    def recreate(self) -> Any:
+        pool = super().recreate()  # type: ignore[misc]
+        pool.statistics = self.statistics
+        return pool
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()  # type: ignore[misc]
+        except exc.TimeoutError:
+            self.statistics.record_wait(time.perf_counter() - start, timed_out=True)
+            logger.error(
+                "Timed out waiting for a database connection: %s",
+                self.statistics.snapshot(self)  # type: ignore[arg-type]
+            )
+            raise
+        self.statistics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """QueuePool with wait-time statistics."""
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool with wait-time statistics."""
+
+
+class TimedNullPool(_TimedPoolMixin, NullPool):
+    """NullPool with connect-time statistics, for use behind an external pooler."""
+
+
+def instrument_pool(pool: Pool) -> PoolStatistics:
+    """Attach event listeners that keep the pool's statistics up to date."""
+    statistics = getattr(pool, "statistics", None)
+    if statistics is None:
+        statistics = PoolStatistics()
+        setattr(pool, "statistics", statistics)
+
+    @event.listens_for(pool, "connect")
+    def on_connect(*_: Any) -> None:
+        statistics.record_connect()
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(*_: Any) -> None:
+        statistics.record_checkout()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(*_: Any) -> None:
+        statistics.record_checkin()
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(*_: Any) -> None:
+        statistics.record_invalidate()
+
+    return statistics
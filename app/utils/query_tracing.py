@@ -0,0 +1,132 @@
+"""Module for request-scoped SQL query tracing.
+
+Queries executed while handling a request are counted and timed in a ``QueryTrace`` held in
+a context variable, which also reaches the threadpool running synchronous sessions. The
+totals are sent as a ``Server-Timing`` header, and statements repeated within one request
+are logged as probable N+1 queries.
+"""
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(
+    r"'(?:[^']|'')*'"  # string literals
+    r"|\b\d+(?:\.\d+)?\b"  # numbers
+    r"|%\(\w+\)s|%s|\$\d+|\?|(?<!:):\w+"  # bind parameters of the supported drivers
+)
+_PLACEHOLDER_LISTS = re.compile(r"\(\?(?:, \?)+\)")
+_VALUES_LISTS = re.compile(r"\(\?\)(?:, \(\?\))+")
+
+
+@dataclass
+class QueryTrace:
+    """Queries executed while handling one request."""
+
+    count: int = 0
+    duration: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Normalized statements executed at least ``threshold`` times."""
+        shapes: Counter = Counter()
+        for statement, count in self.statements.items():
+            shapes[normalize_sql(statement)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+_trace: ContextVar[QueryTrace | None] = ContextVar("query_trace", default=None)
+
+
+def get_query_trace() -> QueryTrace | None:
+    return _trace.get()
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    """Reduce a statement to its shape by replacing literals and bind parameters."""
+    shape = _LITERALS.sub("?", _WHITESPACE.sub(" ", statement).strip())
+    return _VALUES_LISTS.sub("(?)", _PLACEHOLDER_LISTS.sub("(?)", shape))
+
+
+def instrument_engine(engine: Engine, slow_query_threshold_ms: float) -> None:
+    """Trace the queries of an engine and log those slower than the threshold."""
+    slow_query_threshold = slow_query_threshold_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        conn.info["tracing_query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        start = conn.info.pop("tracing_query_start", None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        trace = _trace.get()
+        if trace is not None:
+            trace.record(statement, duration)
+        if duration >= slow_query_threshold:
+            logger.warning(
+                "Slow query (%.1f ms): %s", duration * 1000, normalize_sql(statement)
+            )
+
+
+class QueryTracingMiddleware:
+    """ASGI middleware tracing the queries of every request.
+
+    The ``Server-Timing`` header covers the queries executed before the response starts,
+    which excludes queries made while streaming a response body. N+1 detection runs when
+    the request is complete.
+    """
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int) -> None:
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = QueryTrace()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and trace.count:
+                queries = "query" if trace.count == 1 else "queries"
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'db;dur={trace.duration * 1000:.2f};desc="{trace.count} {queries}"'
+                )
+            await send(message)
+
+        token = _trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _trace.reset(token)
+            for statement, count in trace.repeated(self.n_plus_one_threshold):
+                logger.warning(
+                    "Probable N+1 query in %s %s, executed %d times: %s",
+                    scope["method"],
+                    getattr(scope.get("route"), "path", scope["path"]),
+                    count,
+                    statement
+                )
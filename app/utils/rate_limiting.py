@@ -0,0 +1,156 @@
+"""Module for token bucket rate limiting.
+
+A bucket holds up to ``burst`` tokens and is refilled with ``rate`` tokens per second. A
+request takes a token and is rejected while the bucket is empty. ``SqliteBucketStore``
+keeps the buckets in a SQLite file shared by the worker processes of a host, ideally on a
+memory-backed file system such as ``/dev/shm``. ``MemoryBucketStore`` keeps them per
+process.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BucketStore(Protocol):
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens from the bucket of ``key``.
+
+        Returns 0 if the tokens were taken, else the seconds until they are available.
+        """
+
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: int) -> float:
+    return min(float(burst), tokens + max(now - updated, 0.0) * rate)
+
+
+def wait_time(tokens: float, rate: float, cost: float) -> float:
+    return (cost - tokens) / rate if rate > 0 else float("inf")
+
+
+class MemoryBucketStore:
+    """Buckets of the current process, pruned once full again."""
+
+    def __init__(
+            self,
+            prune_interval: float = 60.0,
+            clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.prune_interval = prune_interval
+        self.clock = clock
+        # key -> (tokens, updated, time the bucket is full again)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._next_prune = clock() + prune_interval
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        now = self.clock()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            bucket = self._buckets.get(key)
+            tokens = refill(*bucket[:2], now, rate, burst) if bucket else float(burst)
+            if tokens < cost:
+                return wait_time(tokens, rate, cost)
+            tokens -= cost
+            self._buckets[key] = (tokens, now, now + wait_time(tokens, rate, burst))
+            return 0.0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _prune(self, now: float) -> None:
+        self._next_prune = now + self.prune_interval
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+
+class SqliteBucketStore:
+    """Buckets shared by all processes using the same SQLite file.
+
+    Every take is a single upsert, atomic across processes. Buckets are pruned once full
+    again, as a full bucket is the same as none. The data is disposable, so the file is
+    written without syncing. Each process opens its own connection on first use. If the
+    file cannot be used, or is locked by other processes for longer than ``timeout``
+    seconds, requests are let through rather than failed. Takes block, so async callers
+    run them in a thread. ``rate`` must be positive.
+    """
+
+    _UPSERT = """
+        INSERT INTO buckets (key, tokens, updated, full_at)
+        VALUES (:key, :burst - :cost, :now, :now + :cost / :rate)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = min(:burst, tokens + max(:now - updated, 0) * :rate) - :cost,
+            updated = :now,
+            full_at = :now + (:burst - min(:burst, tokens + max(:now - updated, 0) * :rate)
+                              + :cost) / :rate
+        WHERE min(:burst, tokens + max(:now - updated, 0) * :rate) >= :cost
+        RETURNING tokens
+    """
+
+    def __init__(self, path: str, prune_interval: float = 60.0, timeout: float = 0.05) -> None:
+        self.path = path
+        self.prune_interval = prune_interval
+        self.timeout = timeout
+        self._connection: sqlite3.Connection | None = None
+        self._connection_pid: int | None = None
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        if cost > burst:
+            return float("inf")
+        # Wall clock time, the same in every process.
+        now = time.time()
+        try:
+            row = self._take(key, rate, burst, cost, now)
+        except sqlite3.Error:
+            logger.warning("Rate limiting with %s failed", self.path, exc_info=True)
+            return 0.0
+        if row is None:
+            return 0.0
+        return max(wait_time(refill(*row, now, rate, burst), rate, cost), 0.0)
+
+    def _take(
+            self,
+            key: str,
+            rate: float,
+            burst: int,
+            cost: float,
+            now: float
+    ) -> Tuple[float, float] | None:
+        """Return ``None`` if the tokens were taken, else the bucket's tokens and update time."""
+        with self._lock:
+            connection = self._connect()
+            if now >= self._next_prune:
+                self._next_prune = now + self.prune_interval
+                connection.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            parameters = dict(key=key, rate=rate, burst=burst, cost=cost, now=now)
+            if connection.execute(self._UPSERT, parameters).fetchone() is not None:
+                return None
+            # The upsert inserts missing buckets, so only existing buckets are short of tokens.
+            return connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A forked worker must not use the connection of the process it was forked from.
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                "full_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
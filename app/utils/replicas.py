@@ -0,0 +1,133 @@
+"""Module for routing reads to database replicas.
+
+``ReplicaRoutingMiddleware`` decides per request whether its sessions read from a replica:
+safe (``GET`` and ``HEAD``) requests do, unless the client wrote within the read-your-writes
+window. A request committing on the primary gets a cookie pinning the client to the
+primary for that window, so it reads its own writes despite replication lag. The decision
+is held in a context variable read by ``app.database.open_session``.
+"""
+import math
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PIN_COOKIE = "db_primary_until"
+SAFE_METHODS = frozenset(("GET", "HEAD"))
+
+
+@dataclass(eq=False)
+class Replica:
+    """A read replica, avoided for ``cooldown`` seconds after a connection failure."""
+
+    engine: Engine
+    async_engine: AsyncEngine | None
+    weight: float
+    cooldown: float
+    unhealthy_until: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.unhealthy_until <= time.monotonic()
+
+    def mark_unhealthy(self) -> None:
+        self.unhealthy_until = time.monotonic() + self.cooldown
+
+
+@dataclass
+class RequestRouting:
+    """Routing of the sessions of one request."""
+
+    use_replica: bool
+    wrote: bool = False
+
+
+_routing: ContextVar[RequestRouting | None] = ContextVar("request_routing", default=None)
+
+
+def get_request_routing() -> RequestRouting | None:
+    return _routing.get()
+
+
+def choose_replica(replicas: Sequence[Replica]) -> Replica | None:
+    """Pick a healthy replica at random by weight, or none if all are unhealthy."""
+    healthy = [replica for replica in replicas if replica.healthy and replica.weight > 0]
+    if not healthy:
+        return None
+    return random.choices(healthy, [replica.weight for replica in healthy])[0]  # nosec
+
+
+def track_health(replica: Replica) -> None:
+    """Mark a replica unhealthy when connecting to it fails or a connection is lost."""
+
+    @event.listens_for(replica.engine, "handle_error")
+    def handle_error(context: Any) -> None:
+        if context.connection is None or context.is_disconnect:
+            replica.mark_unhealthy()
+
+
+def track_writes(engine: Engine) -> None:
+    """Record commits on the primary engine in the routing of the current request."""
+
+    @event.listens_for(engine, "commit")
+    def commit(conn: Any) -> None:
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+
+
+def is_pinned(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            pinned_until = cookie_parser(value.decode("latin-1")).get(PIN_COOKIE)
+            if pinned_until is not None:
+                try:
+                    return float(pinned_until) > time.time()
+                except ValueError:
+                    return False
+    return False
+
+
+class ReplicaRoutingMiddleware:
+    """ASGI middleware routing the reads of safe requests to replicas.
+
+    The pin is a cookie, so it holds across worker processes and instances, for clients
+    keeping cookies.
+    """
+
+    def __init__(self, app: ASGIApp, read_your_writes_window: float) -> None:
+        self.app = app
+        self.read_your_writes_window = read_your_writes_window
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        routing = RequestRouting(
+            use_replica=scope["method"] in SAFE_METHODS and not is_pinned(scope)
+        )
+
+        async def send_with_pin(message: Message) -> None:
+            if message["type"] == "http.response.start" and routing.wrote:
+                until = time.time() + self.read_your_writes_window
+                max_age = math.ceil(self.read_your_writes_window)
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{PIN_COOKIE}={until:.3f}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        token = _routing.set(routing)
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            _routing.reset(token)
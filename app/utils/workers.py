@@ -0,0 +1,58 @@
+"""Module for sizing and selecting gunicorn workers."""
+import importlib.util
+import math
+import os
+from typing import Any
+
+from uvicorn.workers import UvicornWorker
+
+from app.config import ServerSettings
+
+CGROUP_CPU_MAX_PATH = "/sys/fs/cgroup/cpu.max"
+OPTIONAL_IMPLEMENTATIONS = ("uvloop", "httptools")
+
+
+def available_cpus(cpu_max_path: str = CGROUP_CPU_MAX_PATH) -> int:
+    """Number of CPUs this process may use.
+
+    Takes the CPU affinity and, in a container, the cgroup (v2) CPU quota into account, as
+    ``os.cpu_count()`` reports the CPUs of the host.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open(cpu_max_path) as file:
+            quota, period = file.read().split()
+    except (OSError, ValueError):
+        return cpus
+    if quota == "max":
+        return cpus
+    return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+
+
+def check_implementations(loop: str, http: str) -> None:
+    """Fail early, e.g. in the gunicorn master, if uvloop or httptools is selected but not
+    installed."""
+    for implementation in (loop, http):
+        if implementation in OPTIONAL_IMPLEMENTATIONS and not importlib.util.find_spec(
+                implementation
+        ):
+            raise RuntimeError(f"{implementation} is selected, but not installed")
+
+
+class ConfiguredUvicornWorker(UvicornWorker):
+    """Uvicorn worker using the event loop and HTTP implementation of the server settings.
+
+    ``auto`` uses uvloop and httptools if they are installed.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        settings = ServerSettings()
+        self.CONFIG_KWARGS = {
+            **UvicornWorker.CONFIG_KWARGS,
+            "loop": settings.event_loop,
+            "http": settings.http_protocol
+        }
+        super().__init__(*args, **kwargs)
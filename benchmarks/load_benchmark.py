@@ -0,0 +1,460 @@
+"""HTTP load benchmark for the API.
+
+Boots ``app.main:root`` in-process, seeds a database at a configurable scale and drives a
+weighted mix of logins, chat listings, message appends and history reads from concurrent
+virtual users. Latency percentiles, throughput and SQL queries per request are written
+as a JSON report, which can be compared against a baseline report.
+
+By default a SQLite file serves as a stand-in database. With ``--database postgres`` the
+database configured through the ``DATABASE_*`` environment variables is used; its schema
+must be migrated (``alembic upgrade head``) and seeded rows are left in place.
+
+Usage:
+    python -m benchmarks.load_benchmark run [--output report.json] [--baseline base.json]
+    python -m benchmarks.load_benchmark compare base.json report.json [--threshold 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence, Tuple, cast
+
+SCENARIOS = ("login", "list_chats", "append_message", "read_history")
+DEFAULT_MIX = "login=5,list_chats=30,append_message=20,read_history=45"
+LATENCY_METRICS = ("p50", "p95", "p99")
+PASSWORD = "load-benchmark-password"  # nosec
+
+# Placeholders for the database settings; no connection is made to this database, the
+# engine is swapped for a SQLite one before the first request.
+SQLITE_ENV = dict(
+    AUTH_SECRET_KEY="load-benchmark-secret",  # nosec
+    DATABASE_PROTOCOL="postgresql",
+    DATABASE_DRIVER="psycopg",
+    DATABASE_HOST="localhost",
+    DATABASE_PORT="0",
+    DATABASE_USER="benchmark",
+    DATABASE_PASSWORD="benchmark",  # nosec
+    DATABASE_NAME="benchmark",
+    DATABASE_ASYNC_MODE="false",
+)
+
+_query_count: ContextVar[List[int] | None] = ContextVar("query_count", default=None)
+
+
+@dataclass
+class SeededUser:
+    id: int
+    email: str
+    next_roles: Dict[int, str]
+
+
+@dataclass
+class Sample:
+    scenario: str
+    latency: float
+    queries: int
+    ok: bool
+
+
+@dataclass
+class VirtualUser:
+    """A client session of one seeded user. Users are never shared between workers, so
+    message roles stay in alternation without conflicting appends."""
+
+    user: SeededUser
+    rng: random.Random
+    headers: Dict[str, str] = field(default_factory=dict)
+    samples: List[Sample] = field(default_factory=list)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Percentile ``q`` (0-100) of ``values`` with linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        weights[name] = float(weight)
+    return weights
+
+
+def summarize(samples: Sequence[Sample], duration: float) -> Dict[str, Any]:
+    latencies = [sample.latency * 1000 for sample in samples]
+    queries = [sample.queries for sample in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(not sample.ok for sample in samples),
+        "throughput_rps": len(samples) / duration if duration else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            **{metric: percentile(latencies, float(metric[1:])) for metric in LATENCY_METRICS},
+            "max": max(latencies, default=0.0),
+        },
+        "queries_per_request": {
+            "mean": sum(queries) / len(queries) if queries else 0.0,
+            "max": max(queries, default=0),
+        },
+    }
+
+
+def build_report(
+        samples: Sequence[Sample],
+        duration: float,
+        config: Dict[str, Any]
+) -> Dict[str, Any]:
+    from app import __version__
+
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "app_version": __version__,
+        },
+        "duration_seconds": duration,
+        "total": summarize(samples, duration),
+        "scenarios": {
+            name: summarize([sample for sample in samples if sample.scenario == name], duration)
+            for name in SCENARIOS
+            if any(sample.scenario == name for sample in samples)
+        },
+    }
+
+
+def compare_reports(
+        baseline: Dict[str, Any],
+        current: Dict[str, Any],
+        threshold: float,
+        metrics: Sequence[str] = ("p95", "p99")
+) -> List[str]:
+    """Return a description of every regression of ``current`` past ``threshold``.
+
+    Latency metrics and queries per request regress when they grow, throughput when it
+    shrinks, by more than ``threshold`` relative to the baseline. Scenarios missing from
+    either report are skipped.
+    """
+    regressions = []
+    sections = [("total", baseline["total"], current["total"])] + [
+        (name, stats, current["scenarios"][name])
+        for name, stats in baseline["scenarios"].items()
+        if name in current["scenarios"]
+    ]
+    for name, base, cur in sections:
+        checks: List[Tuple[str, float, float, bool]] = [
+            (f"latency {metric}", base["latency_ms"][metric], cur["latency_ms"][metric], True)
+            for metric in metrics
+        ]
+        checks.append((
+            "queries per request",
+            base["queries_per_request"]["mean"],
+            cur["queries_per_request"]["mean"],
+            True
+        ))
+        if name == "total":
+            checks.append(("throughput", base["throughput_rps"], cur["throughput_rps"], False))
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {cur['errors']}")
+        for label, before, after, higher_is_worse in checks:
+            if before <= 0:
+                continue
+            change = (after - before) / before
+            if (change if higher_is_worse else -change) > threshold:
+                regressions.append(f"{name}: {label} {before:.2f} -> {after:.2f} ({change:+.1%})")
+    return regressions
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Prepare the environment before the app (and its settings) are imported."""
+    if args.database == "sqlite":
+        for key, value in SQLITE_ENV.items():
+            os.environ[key] = value
+    os.environ.setdefault("AUTH_SECRET_KEY", SQLITE_ENV["AUTH_SECRET_KEY"])
+    os.environ["AUTH_PRINCIPAL_CACHE_INVALIDATION_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="load-benchmark-"), "principal-cache-invalidation.log"
+    )
+
+
+def install_database(args: argparse.Namespace) -> None:
+    """Point the app at a fresh SQLite file and count the queries serving requests."""
+    from sqlalchemy import create_engine, event
+    from sqlmodel import SQLModel
+
+    import app.api.models  # noqa: F401
+    from app import database
+
+    if args.database == "sqlite":
+        path = os.path.join(tempfile.mkdtemp(prefix="load-benchmark-"), "benchmark.db")
+        database.engine = create_engine(
+            f"sqlite:///{path}",
+            pool_size=args.concurrency,
+            connect_args=dict(check_same_thread=False, timeout=30)
+        )
+    SQLModel.metadata.create_all(database.get_engine())
+
+    def count_query(*_: Any) -> None:
+        counter = _query_count.get()
+        if counter is not None:
+            counter[0] += 1
+
+    event.listen(database.get_serving_engine(), "before_cursor_execute", count_query)
+
+
+def seed(args: argparse.Namespace) -> List[SeededUser]:
+    """Insert users with chats and alternating messages, returning the seeded users."""
+    from sqlalchemy import insert
+    from sqlmodel import Session
+
+    from app.api.auth.password_hasher import hash_password
+    from app.api.chats.chats_schema import Chat, ChatMessage, Role
+    from app.api.users.users_schema import User
+    from app.database import get_engine
+
+    token = uuid.uuid4().hex[:8]
+    password_hash = hash_password(PASSWORD)
+    roles = [Role.user, Role.assistant]
+    start = datetime.utcnow() - timedelta(days=1)
+    with Session(get_engine()) as session:
+        users = [
+            User(email=f"load-{token}-{i}@example.com", name=f"Load {i}",
+                 password_hash=password_hash)
+            for i in range(args.users)
+        ]
+        session.add_all(users)
+        session.flush()
+        chats = [
+            Chat(
+                user_id=user.id,
+                name=f"Chat {i}",
+                message_count=args.messages_per_chat,
+                last_message_at=start if args.messages_per_chat else None,
+                last_role=roles[(args.messages_per_chat - 1) % 2]
+                if args.messages_per_chat else None
+            )
+            for user in users
+            for i in range(args.chats_per_user)
+        ]
+        session.add_all(chats)
+        session.flush()
+        messages = [
+            dict(
+                chat_id=chat.id,
+                role=roles[i % 2],
+                content=f"Seeded message {i} of a load benchmark conversation.",
+                created_at=start - timedelta(seconds=args.messages_per_chat - i)
+            )
+            for chat in chats
+            for i in range(args.messages_per_chat)
+        ]
+        for offset in range(0, len(messages), 10_000):
+            session.execute(insert(ChatMessage), messages[offset:offset + 10_000])
+        session.commit()
+        next_role = roles[args.messages_per_chat % 2].value
+        return [
+            SeededUser(
+                id=cast(int, user.id),
+                email=user.email,
+                next_roles={
+                    cast(int, chat.id): next_role for chat in chats if chat.user_id == user.id
+                }
+            )
+            for user in users
+        ]
+
+
+async def request(client: Any, virtual_user: VirtualUser, scenario: str) -> Sample:
+    user = virtual_user.user
+    chat_id = virtual_user.rng.choice(list(user.next_roles))
+    counter = [0]
+    token = _query_count.set(counter)
+    start = time.perf_counter()
+    try:
+        if scenario == "login":
+            response = await client.post(
+                "/auth/token", data=dict(username=user.email, password=PASSWORD)
+            )
+            if response.status_code == 200:
+                virtual_user.headers = {
+                    "Authorization": f"Bearer {response.json()['access_token']}"
+                }
+        elif scenario == "list_chats":
+            response = await client.get(
+                f"/users/{user.id}/chats", params=dict(limit=20), headers=virtual_user.headers
+            )
+        elif scenario == "append_message":
+            role = user.next_roles[chat_id]
+            response = await client.post(
+                f"/users/{user.id}/chats/{chat_id}/messages",
+                json=dict(role=role, content="Appended by the load benchmark."),
+                headers=virtual_user.headers
+            )
+            if response.status_code == 200:
+                user.next_roles[chat_id] = "assistant" if role == "user" else "user"
+        else:
+            response = await client.get(
+                f"/users/{user.id}/chats/{chat_id}/messages",
+                params=dict(limit=50),
+                headers=virtual_user.headers
+            )
+    finally:
+        latency = time.perf_counter() - start
+        _query_count.reset(token)
+    return Sample(scenario, latency, counter[0], response.status_code < 400)
+
+
+async def drive(
+        client: Any,
+        virtual_user: VirtualUser,
+        requests: int,
+        mix: Dict[str, float],
+        record: bool
+) -> None:
+    names, weights = list(mix), list(mix.values())
+    for _ in range(requests):
+        sample = await request(client, virtual_user, virtual_user.rng.choices(names, weights)[0])
+        if record:
+            virtual_user.samples.append(sample)
+
+
+async def run_load(args: argparse.Namespace, users: List[SeededUser]) -> Tuple[List[Sample], float]:
+    import httpx
+
+    from app.main import root
+
+    mix = parse_mix(args.mix)
+    virtual_users = [
+        VirtualUser(user=user, rng=random.Random(args.seed + i))
+        for i, user in enumerate(users[:args.concurrency])
+    ]
+    async with root.router.lifespan_context(root):
+        transport = httpx.ASGITransport(app=root)  # type: ignore[arg-type]
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await asyncio.gather(*(
+                request(client, virtual_user, "login") for virtual_user in virtual_users
+            ))
+            await asyncio.gather(*(
+                drive(client, virtual_user, args.warmup, mix, record=False)
+                for virtual_user in virtual_users
+            ))
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                drive(client, virtual_user, args.requests // args.concurrency, mix, record=True)
+                for virtual_user in virtual_users
+            ))
+            duration = time.perf_counter() - start
+    return [sample for virtual_user in virtual_users for sample in virtual_user.samples], duration
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'scenario':>16} {'requests':>9} {'errors':>7} {'rps':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, stats in [*report["scenarios"].items(), ("total", report["total"])]:
+        latency = stats["latency_ms"]
+        print(f"{name:>16} {stats['requests']:>9} {stats['errors']:>7} "
+              f"{stats['throughput_rps']:>9.1f} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+              f"{latency['p99']:>9.2f} {stats['queries_per_request']['mean']:>8.2f}")
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path) as file:
+        return json.load(file)
+
+
+def check_regressions(
+        baseline: Dict[str, Any],
+        current: Dict[str, Any],
+        args: argparse.Namespace
+) -> int:
+    regressions = compare_reports(baseline, current, args.threshold, args.metrics.split(","))
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions past {args.threshold:.0%} against the baseline.")
+    return 1 if regressions else 0
+
+
+def run(args: argparse.Namespace) -> int:
+    if args.users < args.concurrency:
+        raise SystemExit("--users must be at least --concurrency")
+    configure_environment(args)
+    install_database(args)
+    users = seed(args)
+    samples, duration = asyncio.run(run_load(args, users))
+    config = {
+        key: value for key, value in vars(args).items()
+        if key not in ("command", "func", "output", "baseline", "threshold", "metrics")
+    }
+    from app.config import settings
+
+    config["async_mode"] = settings.database.async_mode
+    report = build_report(samples, duration, config)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print_report(report)
+    print(f"Report written to {args.output}")
+    if args.baseline:
+        return check_regressions(load_report(args.baseline), report, args)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    return check_regressions(load_report(args.baseline), load_report(args.report), args)
+
+
+def add_comparison_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed relative regression, e.g. 0.1 for 10%%.")
+    parser.add_argument("--metrics", default="p95,p99",
+                        help="Latency percentiles to compare, out of p50,p95,p99.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Seed the database and run the load.")
+    run_parser.add_argument("--database", choices=("sqlite", "postgres"), default="sqlite")
+    run_parser.add_argument("--users", type=int, default=20)
+    run_parser.add_argument("--chats-per-user", type=int, default=10)
+    run_parser.add_argument("--messages-per-chat", type=int, default=100)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--requests", type=int, default=2000)
+    run_parser.add_argument("--warmup", type=int, default=5, help="Unrecorded requests per user.")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights per scenario.")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="load-benchmark.json")
+    run_parser.add_argument("--baseline", help="Fail if the run regressed against this report.")
+    add_comparison_arguments(run_parser)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare a report with a baseline.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("report")
+    add_comparison_arguments(compare_parser)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Micro-benchmark for serializing list responses.
+
+Compares the previous handler path (dump each row, re-validate it into a read model and let
+FastAPI validate and encode the response model) with ``app.api.serialization.serialize``.
+
+Usage: python -m benchmarks.serialization_benchmark [--rows 10000] [--repeat 10]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.chats.chats_schema import ChatMessage, ChatMessageRead, Role
+from app.api.serialization import serialize
+
+
+def make_rows(count: int) -> List[ChatMessage]:
+    start = datetime(2024, 1, 1)
+    return [
+        ChatMessage(
+            id=i,
+            chat_id=1,
+            role=Role.user if i % 2 == 0 else Role.assistant,
+            content=f"Message number {i} with some representative chat content.",
+            created_at=start + timedelta(seconds=i)
+        )
+        for i in range(count)
+    ]
+
+
+def previous_path(rows: List[ChatMessage]) -> bytes:
+    field = create_response_field(name="Response", type_=List[ChatMessageRead])
+    models = [ChatMessageRead(**row.model_dump()) for row in rows]
+    content = asyncio.run(
+        serialize_response(field=field, response_content=models, is_coroutine=True)
+    )
+    return JSONResponse(content).body
+
+
+def serialization_path(rows: List[ChatMessage]) -> bytes:
+    return serialize(List[ChatMessageRead], rows).body
+
+
+def measure(
+        func: Callable[[List[ChatMessage]], bytes],
+        rows: List[ChatMessage],
+        repeat: int
+) -> List[float]:
+    func(rows)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    previous, current = previous_path(rows), serialization_path(rows)
+    assert len(previous) > 0 and len(current) > 0
+
+    results = {
+        "previous": measure(previous_path, rows, args.repeat),
+        "serialize": measure(serialization_path, rows, args.repeat),
+    }
+    for name, timings in results.items():
+        print(
+            f"{name:>10}: median {statistics.median(timings) * 1000:8.2f} ms"
+            f"  min {min(timings) * 1000:8.2f} ms  ({args.rows} rows, {args.repeat} runs)"
+        )
+    speedup = statistics.median(results["previous"]) / statistics.median(results["serialize"])
+    print(f"   speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
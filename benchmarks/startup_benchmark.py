@@ -0,0 +1,204 @@
+"""Cold-start benchmark for the API.
+
+Measures, in fresh interpreter processes, the cumulative time of importing ``app.main``
+as reported by ``python -X importtime``, and the time from spawning a uvicorn worker to
+its first response. Each is the median over several runs. The results and the slowest
+imports are written as a JSON report, and the run fails if a measurement exceeds its
+budget or regressed against a baseline report.
+
+No database connection is made; the first request is answered by the authentication
+dependency.
+
+Usage:
+    python -m benchmarks.startup_benchmark [--output report.json] [--baseline base.json]
+        [--import-budget-ms 2000] [--first-response-budget-ms 4000]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEASUREMENTS = ("import_ms", "first_response_ms")
+FIRST_REQUEST_PATH = "/users/current"
+
+# Placeholders for the settings; no connection is made to this database.
+ENV = dict(
+    AUTH_SECRET_KEY="startup-benchmark-secret",  # nosec
+    LOGGER_CONFIG_PATH="logging.yaml",
+    DATABASE_PROTOCOL="postgresql",
+    DATABASE_DRIVER="psycopg",
+    DATABASE_HOST="localhost",
+    DATABASE_PORT="0",
+    DATABASE_USER="benchmark",
+    DATABASE_PASSWORD="benchmark",  # nosec
+    DATABASE_NAME="benchmark",
+)
+
+
+def parse_importtime(output: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds per module from ``-X importtime`` output."""
+    cumulative = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, timings, module = line.split("|", 2)
+        try:
+            cumulative[module.strip()] = int(timings)
+        except ValueError:
+            continue  # the header line
+    return cumulative
+
+
+def slowest_imports(cumulative: Dict[str, int], count: int = 10) -> List[Tuple[str, float]]:
+    """The ``count`` slowest top-level packages, in milliseconds."""
+    packages = {
+        module: micros for module, micros in cumulative.items() if "." not in module
+    }
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+    return [(module, round(micros / 1000, 2)) for module, micros in ranked]
+
+
+def benchmark_environment() -> Dict[str, str]:
+    env = {**os.environ, **ENV}
+    env["AUTH_PRINCIPAL_CACHE_INVALIDATION_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="startup-benchmark-"), "principal-cache-invalidation.log"
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return env
+
+
+def measure_import(env: Dict[str, str]) -> Dict[str, int]:
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=False
+    )
+    cumulative = parse_importtime(result.stderr)
+    if result.returncode != 0 or "app.main" not in cumulative:
+        raise SystemExit(f"Importing app.main failed:\n{result.stderr[-2000:]}")
+    return cumulative
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_response(env: Dict[str, str], timeout: float) -> float:
+    """Seconds from spawning a uvicorn worker until it answered its first request."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(  # nosec
+        [sys.executable, "-m", "uvicorn", "app.main:root", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                stderr = process.stderr.read().decode() if process.stderr else ""
+                raise SystemExit(f"The worker exited during startup:\n{stderr[-2000:]}")
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            try:
+                connection.request("GET", FIRST_REQUEST_PATH)
+                connection.getresponse().read()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+            finally:
+                connection.close()
+        raise SystemExit(f"No response within {timeout} seconds")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def check_budgets(report: Dict[str, Any], budgets: Dict[str, float | None]) -> List[str]:
+    """Return a description of every measurement over its budget."""
+    return [
+        f"{name} {report[name]:.1f} over the budget of {budget:.1f}"
+        for name, budget in budgets.items()
+        if budget is not None and report[name] > budget
+    ]
+
+
+def compare_reports(
+        baseline: Dict[str, Any],
+        current: Dict[str, Any],
+        threshold: float
+) -> List[str]:
+    """Return a description of every measurement grown by more than ``threshold``."""
+    regressions = []
+    for name in MEASUREMENTS:
+        before, after = baseline[name], current[name]
+        if before <= 0:
+            continue
+        change = (after - before) / before
+        if change > threshold:
+            regressions.append(f"{name} {before:.1f} -> {after:.1f} ({change:+.1%})")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> int:
+    env = benchmark_environment()
+    import_times = []
+    cumulative: Dict[str, int] = {}
+    for _ in range(args.runs):
+        cumulative = measure_import(env)
+        import_times.append(cumulative["app.main"] / 1000)
+    first_response_times = [
+        measure_first_response(env, args.timeout) * 1000 for _ in range(args.runs)
+    ]
+    report = {
+        "import_ms": round(statistics.median(import_times), 2),
+        "first_response_ms": round(statistics.median(first_response_times), 2),
+        "slowest_imports": slowest_imports(cumulative),
+        "config": {"runs": args.runs},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"import app.main: {report['import_ms']:.1f} ms")
+    print(f"first response:  {report['first_response_ms']:.1f} ms")
+    for module, millis in report["slowest_imports"]:
+        print(f"  {module:<24} {millis:>9.1f} ms")
+    print(f"Report written to {args.output}")
+
+    failures = check_budgets(report, {
+        "import_ms": args.import_budget_ms,
+        "first_response_ms": args.first_response_budget_ms,
+    })
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures += compare_reports(json.load(file), report, args.threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="Seconds to wait for the first response.")
+    parser.add_argument("--import-budget-ms", type=float)
+    parser.add_argument("--first-response-budget-ms", type=float)
+    parser.add_argument("--output", default="startup-benchmark.json")
+    parser.add_argument("--baseline", help="Fail if the run regressed against this report.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative regression, e.g. 0.2 for 20%%.")
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Gunicorn configuration, picked up by ``scripts/startup.sh``.
+
+The settings are read from the ``APP_*`` environment variables, see ``ServerSettings``.
+"""
+import os
+from typing import Any
+
+from app.config import ServerSettings
+from app.utils.metrics import mark_process_dead
+from app.utils.workers import available_cpus, check_implementations
+
+server_settings = ServerSettings()
+
+bind = f"{server_settings.host}:{server_settings.port}"
+# Workers are asynchronous, so one per usable CPU keeps all of them busy.
+workers = server_settings.workers or available_cpus()
+check_implementations(server_settings.event_loop, server_settings.http_protocol)
+worker_class = "app.utils.workers.ConfiguredUvicornWorker"
+# The app is imported once by the master and shared copy-on-write by the workers. The
+# engines are created per worker in the app's lifespan.
+preload_app = server_settings.preload
+timeout = server_settings.timeout
+graceful_timeout = server_settings.graceful_timeout
+keepalive = server_settings.keepalive
+backlog = server_settings.backlog
+# Uvicorn takes the client address from X-Forwarded-For for requests from these proxies.
+forwarded_allow_ips = server_settings.forwarded_allow_ips
+# Workers are recycled after a number of requests, with jitter so they do not all restart
+# at once.
+max_requests = server_settings.max_requests
+max_requests_jitter = (
+    server_settings.max_requests_jitter
+    if server_settings.max_requests_jitter is not None
+    else server_settings.max_requests // 10
+)
+# Heartbeat files are written to memory rather than a possibly slow disk.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None  # nosec
+accesslog = "-"
+logger_class = "app.main.CustomGunicornLogger"
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    """Never share database connections created before the fork with the worker."""
+    from app.database import dispose_inherited_engines
+
+    dispose_inherited_engines()
+
+
+def child_exit(server: Any, worker: Any) -> None:
+    """Drop the live metrics of a worker that exited."""
+    mark_process_dead(worker.pid)
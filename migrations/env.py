@@ -1,10 +1,14 @@
+import re
 from logging.config import fileConfig
+from typing import Any
 
 from alembic import context
+from sqlalchemy import Connection, create_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import SQLModel
 
 from app.api.models import *  # noqa
-from app.database import engine
+from app.config import get_settings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -19,6 +23,24 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 target_metadata = SQLModel.metadata
 
+# Objects created by migrations and jobs rather than the models: the partitions of
+# chat_message and its full-text search column and index.
+UNMODELED_TABLES = re.compile(r"chat_message_(legacy|p\d{6})$")
+UNMODELED_NAMES = {"content_tsv", "ix_chat_message_content_tsv"}
+
+
+def include_object(
+        object_: Any, name: str | None, type_: str, reflected: bool, compare_to: Any
+) -> bool:
+    """Keep autogenerate from dropping objects missing from the models on purpose."""
+    if reflected and compare_to is None:
+        if type_ == "table" and UNMODELED_TABLES.match(name or ""):
+            return False
+        if name in UNMODELED_NAMES:
+            return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -38,8 +60,9 @@ def run_migrations_offline() -> None:
 
     """
     context.configure(
-        url=engine.url,
+        url=get_settings().database.url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -55,15 +78,27 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine
+    # A connection may be passed in, e.g. by tests migrating their database.
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+        return
+    # A dedicated engine without the app's pool, instrumentation or statement timeout.
+    connectable = create_engine(get_settings().database.url, poolclass=NullPool)
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+        run_migrations(connection)
+
 
-        with context.begin_transaction():
-            context.run_migrations()
+def run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
 
 
 if context.is_offline_mode():
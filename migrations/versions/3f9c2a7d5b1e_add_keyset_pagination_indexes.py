@@ -0,0 +1,32 @@
+"""Add keyset pagination indexes.
+
+Revision ID: 3f9c2a7d5b1e
+Revises: e6a6342ffa74
+Create Date: 2026-10-18 10:12:41.208311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a7d5b1e'
+down_revision: Union[str, None] = 'e6a6342ffa74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_chat_user_id_id', 'chat', ['user_id', 'id'], unique=False)
+    op.create_index(
+        'ix_chat_message_chat_id_created_at_id',
+        'chat_message',
+        ['chat_id', 'created_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_message_chat_id_created_at_id', table_name='chat_message')
+    op.drop_index('ix_chat_user_id_id', table_name='chat')
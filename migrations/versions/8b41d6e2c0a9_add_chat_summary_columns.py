@@ -0,0 +1,73 @@
+"""Add chat summary columns.
+
+Revision ID: 8b41d6e2c0a9
+Revises: 3f9c2a7d5b1e
+Create Date: 2026-10-18 11:02:17.530914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b41d6e2c0a9'
+down_revision: Union[str, None] = '3f9c2a7d5b1e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    op.add_column(
+        'chat',
+        sa.Column('message_count', sa.Integer(), server_default='0', nullable=False)
+    )
+    op.add_column('chat', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    op.add_column(
+        'chat',
+        sa.Column('last_role', sa.Enum('user', 'assistant', name='role'), nullable=True)
+    )
+    # Backfill in batches of chat ids, committing each batch, so large tables are never
+    # locked or rewritten in a single long-running transaction.
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id = 0
+        while True:
+            chat_ids = connection.execute(
+                sa.text("SELECT id FROM chat WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                dict(last_id=last_id, limit=BACKFILL_BATCH_SIZE)
+            ).scalars().all()
+            if not chat_ids:
+                break
+            connection.execute(
+                sa.text(
+                    """
+                    UPDATE chat
+                    SET message_count = summary.message_count,
+                        last_message_at = summary.last_message_at,
+                        last_role = summary.last_role
+                    FROM (
+                        SELECT DISTINCT ON (chat_id)
+                            chat_id,
+                            count(*) OVER (PARTITION BY chat_id) AS message_count,
+                            created_at AS last_message_at,
+                            role AS last_role
+                        FROM chat_message
+                        WHERE chat_id BETWEEN :first_id AND :last_id
+                        ORDER BY chat_id, created_at DESC, id DESC
+                    ) AS summary
+                    WHERE chat.id = summary.chat_id
+                    """
+                ),
+                dict(first_id=chat_ids[0], last_id=chat_ids[-1])
+            )
+            last_id = chat_ids[-1]
+
+
+def downgrade() -> None:
+    op.drop_column('chat', 'last_role')
+    op.drop_column('chat', 'last_message_at')
+    op.drop_column('chat', 'message_count')
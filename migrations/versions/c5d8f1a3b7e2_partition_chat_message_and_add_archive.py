@@ -0,0 +1,160 @@
+"""Partition chat_message by created_at and add chat_message_archive.
+
+The existing table is not copied: it becomes the partition of all messages before the
+next month, and monthly partitions follow. ``python -m app.jobs.chat_storage partitions``
+keeps creating partitions ahead.
+
+Revision ID: c5d8f1a3b7e2
+Revises: 8b41d6e2c0a9
+Create Date: 2026-10-18 19:40:05.118204
+
+"""
+import json
+import re
+import zlib
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8f1a3b7e2'
+down_revision: Union[str, None] = '8b41d6e2c0a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS_AHEAD = 3
+LOWER_BOUND = re.compile(r"FROM \('([^']+)'\)")
+
+
+def month_start(months_from_now: int) -> datetime:
+    now = datetime.utcnow()
+    years, month = divmod(now.month - 1 + months_from_now, 12)
+    return datetime(now.year + years, month + 1, 1)
+
+
+def upgrade() -> None:
+    op.add_column('chat', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.create_table(
+        'chat_message_archive',
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.BigInteger(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ),
+        sa.PrimaryKeyConstraint('chat_id')
+    )
+    # The data is compressed already, so Postgres need not try again.
+    op.execute("ALTER TABLE chat_message_archive ALTER COLUMN data SET STORAGE EXTERNAL")
+
+    cutoff = month_start(1)
+    op.execute("ALTER TABLE chat_message RENAME TO chat_message_legacy")
+    op.execute("ALTER TABLE chat_message_legacy RENAME CONSTRAINT chat_message_chat_id_fkey "
+               "TO chat_message_legacy_chat_id_fkey")
+    op.execute("ALTER INDEX ix_chat_message_chat_id_created_at_id "
+               "RENAME TO chat_message_legacy_chat_id_created_at_id_idx")
+    # The primary key of a partitioned table includes the partition key, and the one of a
+    # partition has to match it. Ids stay unique as they are drawn from one sequence.
+    op.execute("CREATE UNIQUE INDEX chat_message_legacy_pkey_idx "
+               "ON chat_message_legacy (id, created_at)")
+    op.execute("ALTER TABLE chat_message_legacy DROP CONSTRAINT chat_message_pkey, "
+               "ADD CONSTRAINT chat_message_legacy_pkey PRIMARY KEY "
+               "USING INDEX chat_message_legacy_pkey_idx")
+    op.execute(
+        """
+        CREATE TABLE chat_message (
+            id BIGINT NOT NULL DEFAULT nextval('chat_message_id_seq'),
+            chat_id BIGINT NOT NULL,
+            role role NOT NULL,
+            content VARCHAR NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT chat_message_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT chat_message_chat_id_fkey FOREIGN KEY (chat_id) REFERENCES chat (id)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE chat_message_id_seq OWNED BY chat_message.id")
+    op.create_index(
+        'ix_chat_message_chat_id_created_at_id',
+        'chat_message',
+        ['chat_id', 'created_at', 'id'],
+        unique=False
+    )
+    # With a validated check constraint, attaching skips scanning the table for rows
+    # outside the partition bounds.
+    op.execute(f"ALTER TABLE chat_message_legacy ADD CONSTRAINT chat_message_legacy_bounds "
+               f"CHECK (created_at < '{cutoff.isoformat()}') NOT VALID")
+    op.execute("ALTER TABLE chat_message_legacy VALIDATE CONSTRAINT chat_message_legacy_bounds")
+    op.execute(f"ALTER TABLE chat_message ATTACH PARTITION chat_message_legacy "
+               f"FOR VALUES FROM (MINVALUE) TO ('{cutoff.isoformat()}')")
+    for months in range(1, PARTITIONS_AHEAD + 2):
+        start, end = month_start(months), month_start(months + 1)
+        op.execute(f"CREATE TABLE chat_message_p{start:%Y%m} PARTITION OF chat_message "
+                   f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+
+
+def restore_legacy_partition() -> None:
+    """Recreate the legacy partition, if it was dropped once archiving emptied it.
+
+    It is created like the upgrade leaves it, covering the messages before the oldest
+    remaining partition.
+    """
+    connection = op.get_bind()
+    if connection.execute(sa.text("SELECT to_regclass('chat_message_legacy')")).scalar():
+        return
+    bounds = connection.execute(sa.text(
+        "SELECT pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST('chat_message' AS regclass)"
+    )).scalars().all()
+    lower_bounds = [match.group(1) for match in map(LOWER_BOUND.search, bounds) if match]
+    cutoff = min(lower_bounds, default=None)
+    upper = f"'{cutoff}'" if cutoff else "MAXVALUE"
+    op.execute(f"CREATE TABLE chat_message_legacy PARTITION OF chat_message "
+               f"FOR VALUES FROM (MINVALUE) TO ({upper})")
+    op.execute("ALTER TABLE chat_message_legacy RENAME CONSTRAINT chat_message_chat_id_fkey "
+               "TO chat_message_legacy_chat_id_fkey")
+    op.execute("ALTER TABLE chat_message_legacy ADD CONSTRAINT chat_message_legacy_bounds "
+               + (f"CHECK (created_at < {upper})" if cutoff else "CHECK (true)"))
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    restore_legacy_partition()
+    # Restore archived messages first, they are stored in chat_message again. Partitions
+    # emptied by archiving may have been dropped, a default partition takes their messages.
+    op.execute("CREATE TABLE chat_message_restored PARTITION OF chat_message DEFAULT")
+    archives = connection.execute(
+        sa.text("SELECT chat_id, data FROM chat_message_archive")
+    ).all()
+    for chat_id, data in archives:
+        rows = [
+            dict(id=id_, chat_id=chat_id, role=role, content=content, created_at=created_at)
+            for id_, role, content, created_at in json.loads(zlib.decompress(data))
+        ]
+        connection.execute(
+            sa.text(
+                "INSERT INTO chat_message (id, chat_id, role, content, created_at) "
+                "VALUES (:id, :chat_id, CAST(:role AS role), :content, "
+                "CAST(:created_at AS timestamp))"
+            ),
+            rows
+        )
+    op.drop_table('chat_message_archive')
+    op.drop_column('chat', 'archived_at')
+
+    op.execute("ALTER TABLE chat_message DETACH PARTITION chat_message_legacy")
+    op.execute("ALTER TABLE chat_message_legacy DROP CONSTRAINT chat_message_legacy_bounds")
+    op.execute("INSERT INTO chat_message_legacy SELECT * FROM chat_message")
+    op.execute("ALTER SEQUENCE chat_message_id_seq OWNED BY chat_message_legacy.id")
+    op.execute("DROP TABLE chat_message")
+    op.execute("ALTER TABLE chat_message_legacy RENAME TO chat_message")
+    op.execute("ALTER TABLE chat_message DROP CONSTRAINT chat_message_legacy_pkey, "
+               "ADD CONSTRAINT chat_message_pkey PRIMARY KEY (id)")
+    op.execute("ALTER TABLE chat_message RENAME CONSTRAINT chat_message_legacy_chat_id_fkey "
+               "TO chat_message_chat_id_fkey")
+    op.execute("ALTER INDEX chat_message_legacy_chat_id_created_at_id_idx "
+               "RENAME TO ix_chat_message_chat_id_created_at_id")
@@ -0,0 +1,40 @@
+"""Add a full-text search column and GIN index to chat_message.
+
+Adding the stored generated column rewrites chat_message, partition by partition. New
+partitions inherit the column and the index.
+
+Revision ID: d4a1f7c9e2b3
+Revises: c5d8f1a3b7e2
+Create Date: 2026-10-18 21:05:37.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a1f7c9e2b3'
+down_revision: Union[str, None] = 'c5d8f1a3b7e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The configuration has to match app.api.chats.chats_search.SEARCH_CONFIG.
+    op.execute(
+        "ALTER TABLE chat_message ADD COLUMN content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english'::regconfig, content)) STORED"
+    )
+    op.create_index(
+        'ix_chat_message_content_tsv',
+        'chat_message',
+        ['content_tsv'],
+        unique=False,
+        postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_message_content_tsv', table_name='chat_message')
+    op.drop_column('chat_message', 'content_tsv')
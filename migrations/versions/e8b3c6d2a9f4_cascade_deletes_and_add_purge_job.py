@@ -0,0 +1,107 @@
+"""Cascade deletes of users and chats in the database and add purge_job.
+
+The foreign keys are replaced by ``ON DELETE CASCADE`` ones without scanning the tables
+while holding locks blocking writes: they are added as ``NOT VALID`` and validated in a
+separate transaction, which only blocks schema changes. Partitioned tables do not support
+``NOT VALID`` foreign keys, so for chat_message they are validated per partition first,
+and adding the foreign key to the partitioned table then adopts them without a scan.
+
+Revision ID: e8b3c6d2a9f4
+Revises: d4a1f7c9e2b3
+Create Date: 2026-10-18 22:14:09.371526
+
+"""
+from typing import List, Sequence, Tuple, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3c6d2a9f4'
+down_revision: Union[str, None] = 'd4a1f7c9e2b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Table, foreign key, column and referenced table of the non-partitioned tables.
+FOREIGN_KEYS: List[Tuple[str, str, str, str]] = [
+    ('chat', 'chat_user_id_fkey', 'user_id', 'users'),
+    ('chat_message_archive', 'chat_message_archive_chat_id_fkey', 'chat_id', 'chat'),
+]
+
+
+def list_partitions() -> List[str]:
+    return list(op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST('chat_message' AS regclass)"
+    )).scalars())
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_table(
+        'purge_job',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column(
+            'status',
+            sa.Enum('pending', 'running', 'done', name='purgestatus'),
+            nullable=False
+        ),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('chats_deleted', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('messages_deleted', sa.BigInteger(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_purge_job_user_id'), 'purge_job', ['user_id'], unique=False)
+    op.create_index(
+        'ix_purge_job_status_updated_at', 'purge_job', ['status', 'updated_at'], unique=False
+    )
+
+    for table, name, column, referenced in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT {name}, ADD CONSTRAINT {name} "
+            f"FOREIGN KEY ({column}) REFERENCES {referenced} (id) ON DELETE CASCADE NOT VALID"
+        )
+    partitions = list_partitions()
+    for partition in partitions:
+        op.execute(
+            f"ALTER TABLE {partition} ADD CONSTRAINT {partition}_chat_id_cascade_fkey "
+            f"FOREIGN KEY (chat_id) REFERENCES chat (id) ON DELETE CASCADE NOT VALID"
+        )
+    with op.get_context().autocommit_block():
+        for table, name, _, _ in FOREIGN_KEYS:
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+        for partition in partitions:
+            op.execute(
+                f"ALTER TABLE {partition} VALIDATE CONSTRAINT {partition}_chat_id_cascade_fkey"
+            )
+    op.execute(
+        "ALTER TABLE chat_message DROP CONSTRAINT chat_message_chat_id_fkey, "
+        "ADD CONSTRAINT chat_message_chat_id_fkey "
+        "FOREIGN KEY (chat_id) REFERENCES chat (id) ON DELETE CASCADE"
+    )
+
+
+def downgrade() -> None:
+    # Dropping the foreign key of the partitioned table drops the adopted ones of the
+    # partitions, adding it again creates them under its name. The legacy partition had
+    # kept its own, see migration c5d8f1a3b7e2, unless it was dropped once archived.
+    op.execute(
+        "ALTER TABLE chat_message DROP CONSTRAINT chat_message_chat_id_fkey, "
+        "ADD CONSTRAINT chat_message_chat_id_fkey FOREIGN KEY (chat_id) REFERENCES chat (id)"
+    )
+    op.execute("ALTER TABLE IF EXISTS chat_message_legacy "
+               "RENAME CONSTRAINT chat_message_chat_id_fkey TO chat_message_legacy_chat_id_fkey")
+    for table, name, column, referenced in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT {name}, ADD CONSTRAINT {name} "
+            f"FOREIGN KEY ({column}) REFERENCES {referenced} (id)"
+        )
+    op.drop_index('ix_purge_job_status_updated_at', table_name='purge_job')
+    op.drop_index(op.f('ix_purge_job_user_id'), table_name='purge_job')
+    op.drop_table('purge_job')
+    op.execute("DROP TYPE purgestatus")
+    op.drop_column('users', 'deleted_at')
@@ -1,3 +1,4 @@
 #!/bin/bash
 echo "Running pre-startup script."
-alembic upgrade head
\ No newline at end of file
+alembic upgrade head
+python -m app.jobs.chat_storage partitions
\ No newline at end of file
@@ -1,9 +1,8 @@
 #!/bin/bash
 echo "Running startup script."
-gunicorn app.main:root \
- --workers ${APP_WORKERS:-1} \
- --worker-class uvicorn.workers.UvicornWorker \
- --bind ${APP_HOST:-0.0.0.0}:${APP_PORT:-8080} \
- --timeout ${APP_TIMEOUT:-0} \
- --access-logfile - \
- --logger-class app.main.CustomGunicornLogger
\ No newline at end of file
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}
+rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+# Workers, timeouts, recycling and the worker class are configured through the APP_*
+# environment variables, see gunicorn.conf.py.
+gunicorn app.main:root --config gunicorn.conf.py
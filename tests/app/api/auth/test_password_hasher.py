@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.auth.password_hasher import PasswordHasher
+
+
+def test_hash_and_verify_in_process_pool() -> None:
+    hasher = PasswordHasher(workers=1, max_concurrency=1, max_queue=1, retry_after=1)
+
+    async def run() -> None:
+        # A fork of the threaded worker could deadlock, see START_METHOD.
+        executor = hasher._get_executor()
+        assert executor._mp_context.get_start_method() != "fork"  # type: ignore[union-attr]
+        password_hash = await hasher.hash("password")
+        assert await hasher.verify_and_update("password", password_hash) == (True, None)
+        assert (await hasher.verify_and_update("wrong", password_hash))[0] is False
+
+    try:
+        asyncio.run(run())
+    finally:
+        hasher.shutdown()
+
+
+def test_rejects_when_queue_is_full() -> None:
+    hasher = PasswordHasher(workers=0, max_concurrency=1, max_queue=1, retry_after=3)
+
+    async def run() -> None:
+        tasks = [asyncio.ensure_future(hasher.hash("password")) for _ in range(3)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        rejected = [result for result in results if isinstance(result, HTTPException)]
+        assert len(rejected) == 1
+        assert rejected[0].status_code == 503
+        assert rejected[0].headers == {"Retry-After": "3"}
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_shutdown_is_idempotent(workers: int) -> None:
+    hasher = PasswordHasher(workers=workers, max_concurrency=1, max_queue=1, retry_after=1)
+    hasher.shutdown()
+    hasher.shutdown()
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine
+from sqlmodel import Session, SQLModel, select
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.auth import auth_router
+from app.api.auth.auth_schema import RefreshToken
+from app.api.auth.auth_utils import hash_refresh_token
+from app.api.auth.password_hasher import PasswordHasher, hash_password
+from app.api.dependencies import get_current_user, get_pwd_context
+from app.api.rate_limits import get_bucket_store
+from app.api.users import users_router
+from app.api.users.users_schema import User
+from app.jobs.refresh_tokens import delete_expired_refresh_tokens
+from app.utils.rate_limiting import MemoryBucketStore
+
+PASSWORD_HASH = hash_password("password")
+
+
+def create_user() -> User:
+    return User(id=1, email="user@email.com", name="User", password_hash=PASSWORD_HASH)
+
+
+@pytest.fixture
+def engine(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'auth.db'}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(create_user())
+        session.commit()
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [])
+    return engine
+
+
+@pytest.fixture
+def client(engine: Engine) -> TestClient:
+    app = FastAPI()
+    app.include_router(auth_router.router)
+    app.include_router(users_router.router)
+    store = MemoryBucketStore()
+    hasher = PasswordHasher(workers=0, max_concurrency=1, max_queue=1, retry_after=1)
+    app.dependency_overrides[get_bucket_store] = lambda: store
+    app.dependency_overrides[get_pwd_context] = lambda: hasher
+    app.dependency_overrides[get_current_user] = create_user
+    return TestClient(app)
+
+
+def login(client: TestClient) -> Dict[str, str]:
+    response = client.post(
+        "/auth/token", data={"username": "user@email.com", "password": "password"}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def refresh(client: TestClient, refresh_token: str) -> int:
+    return client.post("/auth/refresh", json={"refresh_token": refresh_token}).status_code
+
+
+def test_refresh_rotates_tokens(client: TestClient, engine: Engine) -> None:
+    tokens = login(client)
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["access_token"]
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert refresh(client, "unknown") == 401
+
+    with Session(engine) as session:
+        stored = session.exec(select(RefreshToken).order_by(RefreshToken.id)).all()  # type: ignore
+        # Only the keyed hash is stored, and both tokens are of one family.
+        assert [token.token_hash for token in stored] == [
+            hash_refresh_token(tokens["refresh_token"], "secret"),
+            hash_refresh_token(rotated["refresh_token"], "secret")
+        ]
+        assert stored[0].family_id == stored[1].family_id
+        assert stored[0].used_at is not None
+
+
+def test_reuse_revokes_family(client: TestClient) -> None:
+    tokens = login(client)
+    other_session = login(client)
+    rotated = client.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    ).json()
+
+    assert refresh(client, tokens["refresh_token"]) == 401
+    assert refresh(client, rotated["refresh_token"]) == 401
+    # Sessions started by other logins are not affected.
+    assert refresh(client, other_session["refresh_token"]) == 200
+
+
+def test_revoke(client: TestClient) -> None:
+    tokens = login(client)
+    other_session = login(client)
+    assert client.post("/auth/revoke", json={"refresh_token": tokens["refresh_token"]}) \
+        .status_code == 204
+    assert client.post("/auth/revoke", json={"refresh_token": "unknown"}).status_code == 204
+    assert refresh(client, tokens["refresh_token"]) == 401
+    assert refresh(client, other_session["refresh_token"]) == 200
+
+    assert client.delete("/users/1/refresh-tokens").status_code == 204
+    assert client.delete("/users/2/refresh-tokens").status_code == 403
+    assert refresh(client, other_session["refresh_token"]) == 401
+
+
+def test_expired_and_deleted(client: TestClient, engine: Engine) -> None:
+    tokens = login(client)
+    with Session(engine) as session:
+        for token in session.exec(select(RefreshToken)).all():
+            token.expires_at = datetime.utcnow() - timedelta(seconds=1)
+            session.add(token)
+        session.commit()
+    assert refresh(client, tokens["refresh_token"]) == 401
+    assert delete_expired_refresh_tokens(engine, datetime.utcnow(), batch_size=1) == 1
+
+    tokens = login(client)
+    with Session(engine) as session:
+        user = session.get(User, 1)
+        assert user is not None
+        user.deleted_at = datetime.utcnow()
+        session.add(user)
+        session.commit()
+    assert refresh(client, tokens["refresh_token"]) == 401
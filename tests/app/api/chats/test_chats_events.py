@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, List
+
+import pytest
+from sqlalchemy import Engine, create_engine
+from sqlmodel import Session, SQLModel, delete
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.chats import chats_events
+from app.api.chats.chats_archive import encode_messages
+from app.api.chats.chats_events import ChatMessageBroadcaster, stream_chat_events
+from app.api.chats.chats_schema import Chat, ChatMessage, ChatMessageArchive, Role
+from app.api.users.users_schema import User
+from app.config import get_settings
+from app.utils.channels import MemoryChannel
+
+
+@pytest.fixture
+def engine(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'chats.db'}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, email="user@email.com", name="User", password_hash="x"))
+        session.add(Chat(id=1, user_id=1, name="Chat"))
+        session.add(ChatMessage(id=1, chat_id=1, role=Role.user, content="Hello"))
+        session.add(ChatMessage(id=2, chat_id=1, role=Role.assistant, content="Hi"))
+        session.commit()
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [])
+    return engine
+
+
+async def append(broadcaster: ChatMessageBroadcaster, *contents: str, commit: bool = True) -> None:
+    async with database.open_session() as db:
+        messages = [ChatMessage(chat_id=1, role=Role.user, content=content) for content in contents]
+        db.add_all(messages)
+        await db.flush()
+        await broadcaster.publish(db, 1, messages)
+        if commit:
+            await db.commit()
+        else:
+            await db.rollback()
+
+
+def test_broadcasts_committed_messages(engine: Engine) -> None:
+    async def run() -> List[List[int]]:
+        broadcaster = ChatMessageBroadcaster(MemoryChannel(), queue_size=8)
+        subscription = await broadcaster.subscribe(1)
+        other_chat = await broadcaster.subscribe(2)
+        await append(broadcaster, "rolled back", commit=False)
+        await append(broadcaster, "a", "b")
+        await append(broadcaster, "c")
+        batches = [await asyncio.wait_for(subscription.queue.get(), 1) for _ in range(2)]
+        assert other_chat.queue.empty()
+        await broadcaster.close()
+        return [[event_id for event_id, _ in batch or []] for batch in batches]
+
+    # SQLite reuses the id of the rolled back message.
+    assert asyncio.run(run()) == [[3, 4], [5]]
+
+
+def test_slow_subscription_ends(engine: Engine) -> None:
+    async def run() -> None:
+        broadcaster = ChatMessageBroadcaster(MemoryChannel(), queue_size=1)
+        subscription = await broadcaster.subscribe(1)
+        await append(broadcaster, "a")
+        await append(broadcaster, "b")
+        for _ in range(100):
+            if subscription.ended:
+                break
+            await asyncio.sleep(0.01)
+        assert subscription.ended
+        assert subscription.queue.qsize() == 1
+        await broadcaster.close()
+
+    asyncio.run(run())
+
+
+def test_stream_sends_backlog_then_live_messages(
+        engine: Engine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(get_settings().chat, "stream_heartbeat_interval", 0.05)
+
+    async def run() -> List[bytes]:
+        broadcaster = ChatMessageBroadcaster(MemoryChannel(), queue_size=8)
+        monkeypatch.setattr(chats_events, "get_broadcaster", lambda: broadcaster)
+        response = stream_chat_events(1, last_event_id=1)
+        body: AsyncIterator = response.body_iterator  # type: ignore[assignment]
+        chunks = [await anext(body), await anext(body)]
+        await append(broadcaster, "live")
+        chunks.append(await anext(body))
+        chunks.append(await anext(body))
+        await body.aclose()  # type: ignore[attr-defined]
+        await broadcaster.close()
+        return chunks
+
+    retry, backlog, live, heartbeat = asyncio.run(run())
+    assert retry == b"retry: 3000\n\n"
+    assert backlog.startswith(b"id: 2\nevent: message\ndata: {")
+    assert b'"content":"Hi"' in backlog
+    assert live.startswith(b"id: 3\nevent: message\n")
+    assert b'"content":"live"' in live
+    assert heartbeat == b": heartbeat\n\n"
+
+
+def test_stream_reads_backlog_in_batches(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(chats_events, "STREAM_YIELD_PER", 1)
+
+    async def run() -> List[bytes]:
+        broadcaster = ChatMessageBroadcaster(MemoryChannel(), queue_size=8)
+        monkeypatch.setattr(chats_events, "get_broadcaster", lambda: broadcaster)
+        response = stream_chat_events(1, last_event_id=0)
+        body: AsyncIterator = response.body_iterator  # type: ignore[assignment]
+        chunks = [await anext(body)]
+        for _ in range(2):
+            chunks.append(await anext(body))
+            # No connection is held while the client receives a batch.
+            assert engine.pool.checkedout() == 0  # type: ignore[attr-defined]
+        await body.aclose()  # type: ignore[attr-defined]
+        await broadcaster.close()
+        return chunks
+
+    _, first, second = asyncio.run(run())
+    assert first.startswith(b"id: 1\n") and second.startswith(b"id: 2\n")
+
+
+def test_stream_sends_archived_backlog(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    with Session(engine) as session:
+        archived = [session.get(ChatMessage, 1), session.get(ChatMessage, 2)]
+        session.add(ChatMessageArchive(
+            chat_id=1,
+            message_count=2,
+            last_message_id=2,
+            archived_at=datetime.utcnow(),
+            data=encode_messages(archived)  # type: ignore[arg-type]
+        ))
+        session.exec(delete(ChatMessage))  # type: ignore[call-overload]
+        session.add(ChatMessage(id=3, chat_id=1, role=Role.user, content="Again"))
+        session.commit()
+
+    async def run() -> List[bytes]:
+        broadcaster = ChatMessageBroadcaster(MemoryChannel(), queue_size=8)
+        monkeypatch.setattr(chats_events, "get_broadcaster", lambda: broadcaster)
+        response = stream_chat_events(1, last_event_id=1, last_archived_id=2)
+        body: AsyncIterator = response.body_iterator  # type: ignore[assignment]
+        chunks = [await anext(body) for _ in range(3)]
+        await body.aclose()  # type: ignore[attr-defined]
+        await broadcaster.close()
+        return chunks
+
+    _, archived_backlog, backlog = asyncio.run(run())
+    assert archived_backlog.startswith(b"id: 2\n") and b'"content":"Hi"' in archived_backlog
+    assert backlog.startswith(b"id: 3\n") and b'"content":"Again"' in backlog
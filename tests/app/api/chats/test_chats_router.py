@@ -0,0 +1,237 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator, List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine, text
+from sqlmodel import Session, SQLModel, col, select
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.chats import chats_archive
+from app.api.chats.chats_events import CHANNEL_NAME, get_broadcaster
+from app.api.chats.chats_router import router
+from app.api.chats.chats_schema import Chat, ChatMessage, Role
+from app.api.dependencies import get_current_user
+from app.api.pagination import encode_cursor
+from app.api.users.users_schema import User
+from app.config import get_settings
+from app.jobs.chat_storage import archive_idle_chats
+from tests.postgres import create_postgres_engine
+
+
+def create_user() -> User:
+    return User(id=1, email="user@email.com", name="User", password_hash="x")
+
+
+def create_client(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    with Session(engine) as session:
+        session.add(create_user())
+        session.add(User(id=2, email="other@email.com", name="Other", password_hash="x"))
+        session.add(Chat(id=1, user_id=1, name="Chat"))
+        session.add(Chat(id=2, user_id=2, name="Other chat"))
+        session.commit()
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [])
+    monkeypatch.setattr(get_settings().rate_limit, "enabled", False)
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user] = create_user
+    # The broadcaster's channel depends on the database.
+    get_broadcaster.cache_clear()
+    yield TestClient(app)
+    get_broadcaster.cache_clear()
+
+
+@pytest.fixture
+def client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'chats.db'}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    yield from create_client(engine, monkeypatch)
+
+
+@pytest.fixture
+def postgres_client(monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    yield from create_client(create_postgres_engine(), monkeypatch)
+
+
+def load_chat(chat_id: int) -> tuple[Chat, List[ChatMessage]]:
+    with Session(database.engine) as session:
+        chat = session.exec(select(Chat).where(Chat.id == chat_id)).one()
+        messages = session.exec(
+            select(ChatMessage)
+            .where(ChatMessage.chat_id == chat_id)
+            .order_by(col(ChatMessage.created_at), col(ChatMessage.id))
+        ).all()
+        return chat, list(messages)
+
+
+def test_create_chat_messages(client: TestClient) -> None:
+    response = client.post("/users/1/chats/1/messages", json={"role": "user", "content": "Hi"})
+    assert response.status_code == 200
+    assert response.json()["role"] == "user"
+    response = client.post("/users/1/chats/1/messages:batch", json=[
+        {"role": "assistant", "content": "Hello"},
+        {"role": "user", "content": "How are you?"},
+    ])
+    assert response.status_code == 200
+    assert [message["content"] for message in response.json()] == ["Hello", "How are you?"]
+
+    chat, messages = load_chat(1)
+    assert [message.content for message in messages] == ["Hi", "Hello", "How are you?"]
+    assert chat.message_count == 3
+    assert chat.last_role == Role.user
+    assert chat.last_message_at == messages[-1].created_at
+
+
+def test_create_chat_message_rejections(client: TestClient) -> None:
+    message = {"role": "user", "content": "Hi"}
+    assert client.post("/users/1/chats/1/messages", json=message).status_code == 200
+    assert client.post("/users/1/chats/1/messages", json=message).status_code == 400
+    assert client.post("/users/1/chats/2/messages", json=message).status_code == 404
+    assert client.post("/users/1/chats/3/messages", json=message).status_code == 404
+    assert client.post("/users/2/chats/2/messages", json=message).status_code == 403
+
+    chat, messages = load_chat(1)
+    assert len(messages) == chat.message_count == 1
+    assert load_chat(2)[0].message_count == 0
+
+
+def test_create_chat_messages_batch(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    url = "/users/1/chats/1/messages:batch"
+    batch = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": str(i)} for i in range(50)
+    ]
+    response = client.post(url, json=batch)
+    assert response.status_code == 200
+    assert [message["content"] for message in response.json()] == [str(i) for i in range(50)]
+    chat, messages = load_chat(1)
+    assert [message.content for message in messages] == [str(i) for i in range(50)]
+    ids = [message.id or 0 for message in messages]
+    assert ids == sorted(ids)
+    assert chat.message_count == 50
+    assert chat.last_role == Role.assistant
+
+    # The first message has to alternate with the chat's last role, as do the others.
+    assert client.post(url, json=[{"role": "assistant", "content": "x"}]).status_code == 400
+    assert client.post(url, json=[
+        {"role": "user", "content": "x"}, {"role": "user", "content": "y"}
+    ]).status_code == 400
+    assert client.post(url, json=[]).status_code == 400
+
+    chat_settings = get_settings().chat
+    monkeypatch.setattr(chat_settings, "batch_max_messages", 2)
+    monkeypatch.setattr(chat_settings, "batch_max_content_length", 5)
+    assert client.post(url, json=batch[:3]).status_code == 413
+    assert client.post(url, json=[{"role": "user", "content": "too long"}]).status_code == 413
+    assert load_chat(1)[0].message_count == 50
+
+
+def test_get_messages_revalidates_by_etag(client: TestClient) -> None:
+    url = "/users/1/chats/1/messages"
+    assert client.post(url, json={"role": "user", "content": "Hi"}).status_code == 200
+    response = client.get(url)
+    assert "last-modified" not in response.headers
+    etag = response.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    # Appending within the same second changes the ETag.
+    assert client.post(url, json={"role": "assistant", "content": "Hello"}).status_code == 200
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and len(response.json()) == 2
+
+
+def test_get_messages_of_reactivated_chat(
+        client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    url = "/users/1/chats/1/messages"
+    for i in range(6):
+        if i == 3:
+            now = datetime.utcnow()
+            assert archive_idle_chats(database.engine, now + timedelta(seconds=1), 10, now) == 3
+        role = "user" if i % 2 == 0 else "assistant"
+        assert client.post(url, json={"role": role, "content": str(i)}).status_code == 200
+
+    decoded: List[int] = []
+    decode_messages = chats_archive.decode_messages
+
+    def counting_decode_messages(chat_id: int, data: bytes) -> Any:
+        decoded.append(chat_id)
+        return decode_messages(chat_id, data)
+
+    monkeypatch.setattr(chats_archive, "decode_messages", counting_decode_messages)
+
+    def get_page(**params: Any) -> tuple[List[str], dict]:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        return [message["content"] for message in response.json()], response.headers
+
+    contents, headers = get_page(limit=2)
+    assert contents == ["0", "1"] and decoded == [1]
+    contents, headers = get_page(limit=2, after=headers["X-Next-Cursor"])
+    assert contents == ["2", "3"] and decoded == [1, 1]
+    # Pages after the archived messages do not read the archive.
+    contents, headers = get_page(limit=2, after=headers["X-Next-Cursor"])
+    assert contents == ["4", "5"] and decoded == [1, 1]
+    assert "X-Next-Cursor" not in headers
+    last = load_chat(1)[1][-1]
+    contents, headers = get_page(limit=1, before=encode_cursor([last.created_at, last.id]))
+    assert contents == ["4"] and decoded == [1, 1]
+    contents, headers = get_page(limit=2, before=headers["X-Prev-Cursor"])
+    assert contents == ["2", "3"] and decoded == [1, 1, 1]
+    contents, headers = get_page(limit=2, before=headers["X-Prev-Cursor"])
+    assert contents == ["0", "1"] and "X-Prev-Cursor" not in headers
+
+    response = client.get(url, headers={"Accept": "application/x-ndjson"})
+    assert [json.loads(line)["content"] for line in response.text.splitlines()] == [
+        str(i) for i in range(6)
+    ]
+
+
+def hammer(client: TestClient, requests: int) -> List[int]:
+    """Append messages of both roles to one chat concurrently, return the status codes."""
+    def post(i: int) -> int:
+        role = Role.user if i % 2 == 0 else Role.assistant
+        response = client.post(
+            "/users/1/chats/1/messages", json={"role": role.value, "content": str(i)}
+        )
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        status_codes = list(executor.map(post, range(requests)))
+
+    assert set(status_codes) <= {200, 400}
+    chat, messages = load_chat(1)
+    assert len(messages) == status_codes.count(200) == chat.message_count
+    roles = [message.role for message in messages]
+    assert all(role != next_role for role, next_role in zip(roles, roles[1:]))
+    assert chat.last_role == roles[-1]
+    assert chat.last_message_at == messages[-1].created_at
+    return status_codes
+
+
+def test_concurrent_appends_alternate(client: TestClient) -> None:
+    hammer(client, 64)
+
+
+def test_concurrent_appends_alternate_on_postgres(postgres_client: TestClient) -> None:
+    notifications: List[str] = []
+    with database.engine.connect() as listener:
+        listener.connection.dbapi_connection.add_notify_handler(  # type: ignore[union-attr]
+            lambda notify: notifications.append(notify.payload)
+        )
+        listener.execute(text(f"LISTEN {CHANNEL_NAME}"))
+        listener.commit()
+        hammer(postgres_client, 200)
+        # Receives the notifications sent meanwhile.
+        listener.execute(text("SELECT 1"))
+    # Every append notifies once, in the statement appending the message.
+    _, messages = load_chat(1)
+    assert notifications == [f"[1, {message.id}, {message.id}]" for message in messages]
@@ -0,0 +1,143 @@
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine
+from sqlmodel import Session, SQLModel, delete
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.chats.chats_router import router
+from app.api.chats.chats_schema import Chat, ChatMessage, Role
+from app.api.chats.chats_search import to_fts5_query
+from app.api.dependencies import get_current_user
+from app.api.rate_limits import get_bucket_store
+from app.api.users.users_schema import User
+from app.utils.rate_limiting import MemoryBucketStore
+from tests.postgres import create_postgres_engine
+
+
+def create_user() -> User:
+    return User(id=1, email="user@email.com", name="User", password_hash="x")
+
+
+def create_client(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [])
+
+    app = FastAPI()
+    app.include_router(router)
+    store = MemoryBucketStore()
+    app.dependency_overrides[get_bucket_store] = lambda: store
+    app.dependency_overrides[get_current_user] = create_user
+    return TestClient(app)
+
+
+@pytest.fixture
+def client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'chats.db'}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(create_user())
+        session.add(User(id=2, email="other@email.com", name="Other", password_hash="x"))
+        session.add(Chat(id=1, user_id=1, name="Chat"))
+        session.add(Chat(id=2, user_id=2, name="Other chat"))
+        for i, content in enumerate([
+            "How do I bake bread at home in a regular oven?",
+            "Bread needs yeast. Knead the bread dough.",
+            "What about cakes?",
+            "The weather is nice today.",
+            "<script>alert(1)</script> Toast & jam",
+        ], start=1):
+            session.add(ChatMessage(id=i, chat_id=1, role=Role.user, content=content))
+        session.add(ChatMessage(id=6, chat_id=2, role=Role.user, content="My bread burned."))
+        session.commit()
+    return create_client(engine, monkeypatch)
+
+
+def test_to_fts5_query() -> None:
+    assert to_fts5_query('bread OR "cake" NEAR(') == '"bread" "OR" """cake""" "NEAR("'
+
+
+def test_search_ranks_and_highlights(client: TestClient) -> None:
+    response = client.get("/users/1/chats/search", params={"q": "bread"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["id"] for hit in hits] == [2, 1]
+    assert hits[0]["rank"] >= hits[1]["rank"]
+    assert hits[0]["chat_id"] == 1
+    assert "<mark>Bread</mark>" in hits[0]["highlight"]
+
+    # All terms have to match, in any form.
+    hits = client.get("/users/1/chats/search", params={"q": "kneading dough"}).json()
+    assert [hit["id"] for hit in hits] == [2]
+    assert client.get("/users/1/chats/search", params={"q": "bread cakes"}).json() == []
+    assert client.get("/users/1/chats/search", params={"q": " "}).json() == []
+
+
+def test_search_escapes_highlights(client: TestClient) -> None:
+    hits = client.get("/users/1/chats/search", params={"q": "toast"}).json()
+    assert [hit["highlight"] for hit in hits] == [
+        "&lt;script&gt;alert(1)&lt;/script&gt; <mark>Toast</mark> &amp; jam"
+    ]
+
+
+def test_search_pages(client: TestClient) -> None:
+    response = client.get("/users/1/chats/search", params={"q": "bread", "limit": 1})
+    assert [hit["id"] for hit in response.json()] == [2]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(
+        "/users/1/chats/search", params={"q": "bread", "limit": 1, "after": cursor}
+    )
+    assert [hit["id"] for hit in response.json()] == [1]
+    assert "X-Next-Cursor" not in response.headers
+    response = client.get(
+        "/users/1/chats/search",
+        params={"q": "bread", "limit": 1, "before": response.headers["X-Prev-Cursor"]}
+    )
+    assert [hit["id"] for hit in response.json()] == [2]
+
+
+def test_search_is_authorized_and_follows_deletes(client: TestClient) -> None:
+    assert client.get("/users/2/chats/search", params={"q": "bread"}).status_code == 403
+    assert client.get("/users/1/chats/search", params={"q": ""}).status_code == 422
+
+    with Session(database.engine) as session:
+        session.exec(delete(ChatMessage).where(ChatMessage.id == 2))  # type: ignore
+        session.commit()
+    hits = client.get("/users/1/chats/search", params={"q": "bread"}).json()
+    assert [hit["id"] for hit in hits] == [1]
+
+
+def test_search_pages_through_ties_on_postgres(monkeypatch: pytest.MonkeyPatch) -> None:
+    # ts_rank_cd returns a real, tied for equal messages, which the cursors have to match.
+    engine = create_postgres_engine()
+    with Session(engine) as session:
+        session.add(create_user())
+        session.add(Chat(id=1, user_id=1, name="Chat"))
+        for i in range(20):
+            session.add(ChatMessage(chat_id=1, role=Role.user, content=f"Fresh bread {i % 2}"))
+        session.add(ChatMessage(chat_id=1, role=Role.user, content="Bread & butter"))
+        session.commit()
+    client = create_client(engine, monkeypatch)
+
+    ids: List[int] = []
+    params: Dict[str, Any] = {"q": "bread", "limit": 3}
+    while True:
+        response = client.get("/users/1/chats/search", params=params)
+        ids += [hit["id"] for hit in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["after"] = response.headers["X-Next-Cursor"]
+    assert sorted(ids) == list(range(1, 22))
+
+    hits = client.get("/users/1/chats/search", params={"q": "butter"}).json()
+    assert [hit["highlight"] for hit in hits] == [
+        "Bread &amp; <mark>butter</mark>"
+    ]
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from fastapi import Request, Response
+
+from app.api.conditional import (
+    check_not_modified,
+    etag_matches,
+    format_http_date,
+    is_not_modified,
+    make_etag
+)
+
+MODIFIED = datetime(2024, 5, 1, 12, 30, 15, 500000)
+
+
+def make_request(**headers: str) -> Request:
+    return Request({
+        "type": "http",
+        "headers": [
+            (name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()
+        ]
+    })
+
+
+def test_make_etag() -> None:
+    etag = make_etag("chat", 1, 10, MODIFIED)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("chat", 1, 10, MODIFIED)
+    assert etag != make_etag("chat", 1, 11, MODIFIED)
+
+
+def test_etag_matches() -> None:
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('"b", W/"a"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+
+
+def test_is_not_modified() -> None:
+    assert not is_not_modified(make_request(), '"a"', MODIFIED)
+    assert is_not_modified(make_request(if_none_match='"a"'), '"a"', MODIFIED)
+    since = format_http_date(MODIFIED)
+    assert since == "Wed, 01 May 2024 12:30:15 GMT"
+    # A change later in the second of If-Modified-Since may have been missed.
+    assert not is_not_modified(make_request(if_modified_since=since), '"a"', MODIFIED)
+    assert is_not_modified(
+        make_request(if_modified_since="Wed, 01 May 2024 12:30:16 GMT"), '"a"', MODIFIED
+    )
+    assert not is_not_modified(
+        make_request(if_modified_since="Wed, 01 May 2024 12:30:14 GMT"), '"a"', MODIFIED
+    )
+    assert not is_not_modified(make_request(if_modified_since="yesterday"), '"a"', MODIFIED)
+    # If-None-Match takes precedence over If-Modified-Since.
+    assert not is_not_modified(
+        make_request(if_none_match='"b"', if_modified_since=since), '"a"', MODIFIED
+    )
+
+
+def test_check_not_modified() -> None:
+    response = Response()
+    assert check_not_modified(make_request(), response, '"a"', MODIFIED) is None
+    assert response.headers["ETag"] == '"a"'
+    assert response.headers["Last-Modified"] == "Wed, 01 May 2024 12:30:15 GMT"
+
+    not_modified = check_not_modified(make_request(if_none_match='"a"'), Response(), '"a"')
+    assert not_modified is not None
+    assert not_modified.status_code == 304
+    assert not_modified.body == b""
+    assert not_modified.headers["ETag"] == '"a"'
+    assert "content-length" not in not_modified.headers
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, List, Tuple
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, select
+
+import tests.init_main  # noqa: F401
+from app.api.chats.chats_schema import Chat, ChatMessage, Role
+from app.api.pagination import (
+    PageParams, decode_cursor, encode_cursor, fetch_page, get_page_params, page_items
+)
+from app.api.users.users_schema import User
+from app.database import ThreadedSession
+
+KEYS = [ChatMessage.created_at, ChatMessage.id]
+
+
+@pytest.fixture(scope="module")
+def session() -> Session:
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, email="test.user@email.com", name="Test", password_hash="x"))
+        session.add(Chat(id=1, user_id=1, name="Chat"))
+        start = datetime(2024, 1, 1)
+        for i in range(1, 8):
+            # Messages 4 and 5 share a timestamp, so ordering relies on the id tie-breaker.
+            created_at = start + timedelta(minutes=min(i, 4) if i < 6 else i)
+            session.add(ChatMessage(
+                id=i, chat_id=1, role=Role.user, content=str(i), created_at=created_at
+            ))
+        session.commit()
+        yield session
+
+
+def get_page(session: Session, page: PageParams) -> Tuple[List[int], Any]:
+    response = Response()
+    statement = select(ChatMessage).where(ChatMessage.chat_id == 1)
+    items = asyncio.run(fetch_page(ThreadedSession(session), statement, KEYS, page, response))
+    return [item.id for item in items], response.headers
+
+
+def test_pages_forward_and_backward(session: Session) -> None:
+    ids, headers = get_page(session, PageParams(limit=3))
+    assert ids == [1, 2, 3]
+    assert "X-Prev-Cursor" not in headers
+
+    ids, headers = get_page(session, PageParams(limit=3, after=headers["X-Next-Cursor"]))
+    assert ids == [4, 5, 6]
+
+    ids, last_headers = get_page(session, PageParams(limit=3, after=headers["X-Next-Cursor"]))
+    assert ids == [7]
+    assert "X-Next-Cursor" not in last_headers
+
+    ids, headers = get_page(session, PageParams(limit=3, before=last_headers["X-Prev-Cursor"]))
+    assert ids == [4, 5, 6]
+    ids, headers = get_page(session, PageParams(limit=3, before=headers["X-Prev-Cursor"]))
+    assert ids == [1, 2, 3]
+    assert "X-Prev-Cursor" not in headers
+
+
+def test_page_items_matches_fetch_page(session: Session) -> None:
+    items = session.exec(
+        select(ChatMessage).order_by(ChatMessage.created_at, ChatMessage.id)  # type: ignore
+    ).all()
+    pages = [PageParams(limit=3)]
+    while pages:
+        page = pages.pop()
+        response = Response()
+        ids = [item.id for item in page_items(items, KEYS, page, response)]
+        assert (ids, response.headers) == get_page(session, page)
+        if page.before is None and "X-Next-Cursor" in response.headers:
+            pages.append(PageParams(limit=3, after=response.headers["X-Next-Cursor"]))
+        if page.after is not None and "X-Prev-Cursor" in response.headers:
+            pages.append(PageParams(limit=3, before=response.headers["X-Prev-Cursor"]))
+
+
+def test_cursor_round_trip() -> None:
+    values = (datetime(2024, 1, 1, 12, 30), 42)
+    assert decode_cursor(encode_cursor(values), KEYS) == values
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor([1]), encode_cursor(["a", "b"])])
+def test_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(cursor, KEYS)
+    assert exc_info.value.status_code == 400
+
+
+def test_before_and_after_are_exclusive() -> None:
+    with pytest.raises(HTTPException) as exc_info:
+        get_page_params(limit=10, before="a", after="b")
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,118 @@
+import threading
+from typing import Annotated, List
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+import tests.init_main  # noqa: F401
+from app.api.auth.auth_utils import create_access_token
+from app.api.rate_limits import RateLimit, get_bucket_store, login_key
+from app.config import RateLimitPolicy, get_settings
+from app.utils.rate_limiting import MemoryBucketStore
+
+
+def create_client() -> TestClient:
+    app = FastAPI()
+
+    @app.post("/limited", dependencies=[Depends(RateLimit("test"))])
+    def post_limited() -> dict:
+        return {}
+
+    @app.post("/unlimited", dependencies=[Depends(RateLimit("unconfigured"))])
+    def post_unlimited() -> dict:
+        return {}
+
+    store = MemoryBucketStore()
+    app.dependency_overrides[get_bucket_store] = lambda: store
+    return TestClient(app)
+
+
+def test_rate_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(
+        get_settings().rate_limit.policies, "test", RateLimitPolicy(rate=0.01, burst=2)
+    )
+    client = create_client()
+    token = create_access_token(
+        data={"sub": "test.user@email.com"}, secret_key="secret", algorithm="HS256"
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert [client.post("/limited").status_code for _ in range(2)] == [200, 200]
+    response = client.post("/limited")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "100"
+
+    # Authenticated clients have their own bucket, independent of their address.
+    assert [client.post("/limited", headers=headers).status_code for _ in range(3)] == [
+        200, 200, 429
+    ]
+    assert [client.post("/unlimited").status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_login_rate_limit_by_username_and_forwarded_address(
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setitem(
+        get_settings().rate_limit.policies, "test", RateLimitPolicy(rate=0.01, burst=1)
+    )
+    app = FastAPI()
+
+    @app.post("/login", dependencies=[Depends(RateLimit("test", key=login_key))])
+    def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> dict:
+        return {}
+
+    store = MemoryBucketStore()
+    app.dependency_overrides[get_bucket_store] = lambda: store
+    # As uvicorn does for the proxies in ``forwarded_allow_ips``.
+    app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="testclient")
+    client = TestClient(app)
+
+    def login_status(username: str, address: str) -> int:
+        return client.post(
+            "/login",
+            data={"username": username, "password": "x"},
+            headers={"X-Forwarded-For": address}
+        ).status_code
+
+    assert login_status("user@email.com", "203.0.113.1") == 200
+    assert login_status("User@email.com", "203.0.113.1") == 429
+    # Neither other accounts at the address nor the account from elsewhere are limited.
+    assert login_status("other@email.com", "203.0.113.1") == 200
+    assert login_status("user@email.com", "203.0.113.2") == 200
+
+
+def test_rate_limit_disabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(
+        get_settings().rate_limit.policies, "test", RateLimitPolicy(rate=0.01, burst=1)
+    )
+    monkeypatch.setattr(get_settings().rate_limit, "enabled", False)
+    client = create_client()
+    assert [client.post("/limited").status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_rate_limit_takes_tokens_off_the_event_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(
+        get_settings().rate_limit.policies, "test", RateLimitPolicy(rate=1, burst=1)
+    )
+    threads: List[int] = []
+
+    class RecordingStore(MemoryBucketStore):
+        def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+            threads.append(threading.get_ident())
+            return super().take(key, rate, burst, cost)
+
+    app = FastAPI()
+
+    @app.post("/limited", dependencies=[Depends(RateLimit("test"))])
+    async def post_limited() -> dict:
+        threads.append(threading.get_ident())
+        return {}
+
+    store = RecordingStore()
+    app.dependency_overrides[get_bucket_store] = lambda: store
+    assert TestClient(app).post("/limited").status_code == 200
+    store_thread, loop_thread = threads
+    assert store_thread != loop_thread
@@ -0,0 +1,37 @@
+import json
+from datetime import datetime
+from typing import List
+
+from fastapi import Response
+
+from app.api.chats.chats_schema import Chat, ChatRead
+from app.api.serialization import FastJSONResponse, serialize
+
+
+def test_serialize_reads_orm_attributes_and_keeps_headers() -> None:
+    chats = [
+        Chat(id=i, user_id=1, name=f"Chat {i}", created_at=datetime(2024, 1, i), message_count=i)
+        for i in range(1, 3)
+    ]
+    sub_response = Response()
+    del sub_response.headers["content-length"]
+    sub_response.headers["X-Next-Cursor"] = "cursor"
+
+    response = serialize(List[ChatRead], chats, sub_response)
+
+    assert response.headers["X-Next-Cursor"] == "cursor"
+    assert response.headers["content-type"] == "application/json"
+    assert json.loads(response.body)[1] == {
+        "id": 2,
+        "name": "Chat 2",
+        "description": None,
+        "created_at": "2024-01-02T00:00:00",
+        "message_count": 2,
+        "last_message_at": None,
+        "last_role": None,
+    }
+
+
+def test_fast_json_response_renders_python_objects() -> None:
+    response = FastJSONResponse({"at": datetime(2024, 1, 1)})
+    assert response.body == b'{"at":"2024-01-01T00:00:00"}'
@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, col, select
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.streaming import accepts_ndjson, stream_ndjson
+from app.api.users.users_schema import User, UserRead
+
+
+def test_stream_ndjson_streams_all_rows(monkeypatch: pytest.MonkeyPatch) -> None:
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i in range(1, 2501):
+            session.add(User(id=i, email=f"user{i}@email.com", name=f"User {i}", password_hash="x"))
+        session.commit()
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+
+    response = stream_ndjson(select(User).order_by(col(User.id)), UserRead)
+
+    async def read_body() -> list:
+        return [chunk async for chunk in response.body_iterator]
+
+    chunks = asyncio.run(read_body())
+    lines = b"".join(chunks).splitlines()
+    assert response.media_type == "application/x-ndjson"
+    assert len(chunks) == 3
+    assert len(lines) == 2500
+    assert json.loads(lines[-1]) == {
+        "id": 2500, "email": "user2500@email.com", "name": "User 2500", "is_admin": False
+    }
+
+
+def test_accepts_ndjson() -> None:
+    class FakeRequest:
+        def __init__(self, accept: str) -> None:
+            self.headers = {"accept": accept}
+
+    assert accepts_ndjson(FakeRequest("application/x-ndjson"))  # type: ignore[arg-type]
+    assert not accepts_ndjson(FakeRequest("application/json"))  # type: ignore[arg-type]
@@ -0,0 +1,70 @@
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.chats.chats_schema import Chat
+from app.api.dependencies import get_current_user, get_principal_cache
+from app.api.users.users_router import router
+from app.api.users.users_schema import User
+from app.config import get_settings
+from app.utils.cache import TTLCache
+
+
+def create_admin() -> User:
+    return User(id=1, email="admin@email.com", name="Admin", password_hash="x", is_admin=True)
+
+
+@pytest.fixture
+def client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'users.db'}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(create_admin())
+        session.add(User(id=2, email="small@email.com", name="Small", password_hash="x"))
+        session.add(User(id=3, email="large@email.com", name="Large", password_hash="x"))
+        session.add(Chat(user_id=2, name="Chat", message_count=10))
+        session.add(Chat(user_id=3, name="Chat", message_count=10))
+        session.add(Chat(user_id=3, name="Chat", message_count=5))
+        session.commit()
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [])
+    monkeypatch.setattr(get_settings().purge, "sync_max_messages", 10)
+
+    app = FastAPI()
+    app.include_router(router)
+    principal_cache: TTLCache[Dict[str, Any]] = TTLCache(maxsize=10, ttl=60)
+    app.dependency_overrides[get_principal_cache] = lambda: principal_cache
+    app.dependency_overrides[get_current_user] = create_admin
+    return TestClient(app)
+
+
+def test_delete_small_user(client: TestClient) -> None:
+    response = client.delete("/users/2")
+    assert response.status_code == 200
+    assert response.json()["email"] == "small@email.com"
+    assert client.get("/users/2").status_code == 404
+    assert client.get("/users/2/purge").status_code == 404
+
+
+def test_delete_large_user_queues_purge(client: TestClient) -> None:
+    response = client.delete("/users/3")
+    assert response.status_code == 202
+    assert response.headers["location"] == "/users/3/purge"
+    job = response.json()
+    assert (job["user_id"], job["status"]) == (3, "pending")
+
+    # The user is gone for the API right away, its data is left to the purge job.
+    assert client.get("/users/3").status_code == 404
+    assert [user["id"] for user in client.get("/users").json()] == [1, 2]
+    assert client.delete("/users/3").status_code == 404
+    assert client.get("/users/3/purge").json() == job
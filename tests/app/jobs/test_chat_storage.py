@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import pytest
+from sqlalchemy import Engine, create_engine
+from sqlmodel import Session, SQLModel, select
+
+import tests.init_main  # noqa: F401
+from app.api.chats.chats_archive import load_chat_messages
+from app.api.chats.chats_schema import Chat, ChatMessage, ChatMessageArchive, Role
+from app.api.users.users_schema import User
+from app.database import ThreadedSession
+from app.jobs.chat_storage import (
+    add_months,
+    archive_idle_chats,
+    ensure_partitions,
+    month_start,
+    parse_upper_bound
+)
+
+NOW = datetime(2026, 10, 18, 12)
+IDLE_BEFORE = NOW - timedelta(days=90)
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Engine:
+    engine = create_engine(f"sqlite:///{tmp_path / 'chats.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, email="user@email.com", name="User", password_hash="x"))
+        for chat_id, created_at in ((1, NOW - timedelta(days=200)), (2, NOW - timedelta(days=1))):
+            session.add(Chat(id=chat_id, user_id=1, name="Chat", last_message_at=created_at))
+            for i in range(3):
+                session.add(ChatMessage(
+                    id=chat_id * 10 + i,
+                    chat_id=chat_id,
+                    role=Role.user if i % 2 == 0 else Role.assistant,
+                    content=f"{chat_id}.{i}",
+                    created_at=created_at + timedelta(seconds=i)
+                ))
+        session.commit()
+    return engine
+
+
+def contents(engine: Engine, chat_id: int, after_id: int | None = None) -> List[str]:
+    with Session(engine) as session:
+        messages = asyncio.run(load_chat_messages(ThreadedSession(session), chat_id, after_id))
+    return [message.content for message in messages]
+
+
+def test_month_helpers() -> None:
+    assert month_start(NOW) == datetime(2026, 10, 1)
+    assert add_months(datetime(2026, 11, 1), 2) == datetime(2027, 1, 1)
+    assert parse_upper_bound(
+        "FOR VALUES FROM (MINVALUE) TO ('2026-11-01 00:00:00')"
+    ) == datetime(2026, 11, 1)
+    assert parse_upper_bound("FOR VALUES FROM ('2026-11-01 00:00:00') TO (MAXVALUE)") is None
+
+
+def test_partitions_are_postgres_only(engine: Engine) -> None:
+    with engine.begin() as connection:
+        assert ensure_partitions(connection, NOW, months_ahead=3) == []
+
+
+def test_archive_idle_chats(engine: Engine) -> None:
+    assert archive_idle_chats(engine, IDLE_BEFORE, batch_size=1, now=NOW) == 3
+    with Session(engine) as session:
+        remaining = session.exec(select(ChatMessage.chat_id)).all()
+        archive = session.get(ChatMessageArchive, 1)
+        chat = session.get(Chat, 1)
+        assert set(remaining) == {2}
+        assert archive is not None and archive.message_count == 3
+        assert archive.last_message_id == 12
+        assert chat is not None and chat.archived_at == NOW
+    assert contents(engine, 1) == ["1.0", "1.1", "1.2"]
+    assert contents(engine, 1, after_id=10) == ["1.1", "1.2"]
+    # Archived chats are skipped until new messages are idle.
+    assert archive_idle_chats(engine, IDLE_BEFORE, batch_size=10, now=NOW) == 0
+
+
+def test_archive_appends_to_existing_archive(engine: Engine) -> None:
+    archive_idle_chats(engine, IDLE_BEFORE, batch_size=10, now=NOW)
+    later = NOW + timedelta(days=1)
+    with Session(engine) as session:
+        session.add(ChatMessage(id=13, chat_id=1, role=Role.user, content="1.3", created_at=later))
+        chat = session.get(Chat, 1)
+        assert chat is not None
+        chat.last_message_at = later
+        session.add(chat)
+        session.commit()
+    assert contents(engine, 1) == ["1.0", "1.1", "1.2", "1.3"]
+
+    idle_before = later + timedelta(days=1)
+    assert archive_idle_chats(engine, idle_before, 10, idle_before + timedelta(days=90)) == 4
+    with Session(engine) as session:
+        archive = session.get(ChatMessageArchive, 1)
+        assert archive is not None and archive.message_count == 4
+        assert session.exec(select(ChatMessage).where(ChatMessage.chat_id == 1)).all() == []
+    assert contents(engine, 1) == ["1.0", "1.1", "1.2", "1.3"]
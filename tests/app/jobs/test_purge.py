@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import Engine, create_engine, event, func
+from sqlmodel import Session, SQLModel, select
+
+import tests.init_main  # noqa: F401
+from app.api.chats.chats_archive import encode_messages
+from app.api.chats.chats_schema import Chat, ChatMessage, ChatMessageArchive, Role
+from app.api.users.users_schema import PurgeJob, PurgeStatus, User
+from app.jobs.purge import claim_job, purge_user
+
+NOW = datetime(2026, 10, 18, 12)
+LEASE = timedelta(minutes=5)
+
+
+def enable_foreign_keys(dbapi_connection: Any, _: Any) -> None:
+    dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Engine:
+    engine = create_engine(f"sqlite:///{tmp_path / 'purge.db'}")
+    event.listen(engine, "connect", enable_foreign_keys)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for user_id in (1, 2):
+            session.add(User(
+                id=user_id, email=f"{user_id}@email.com", name="User", password_hash="x"
+            ))
+            for chat_id in (user_id * 10, user_id * 10 + 1):
+                session.add(Chat(id=chat_id, user_id=user_id, name="Chat"))
+                session.add_all([
+                    ChatMessage(chat_id=chat_id, role=Role.user, content=str(i))
+                    for i in range(3)
+                ])
+        archived = [ChatMessage(id=0, chat_id=10, role=Role.user, content="old", created_at=NOW)]
+        session.add(ChatMessageArchive(
+            chat_id=10,
+            message_count=1,
+            last_message_id=0,
+            archived_at=NOW,
+            data=encode_messages(archived)
+        ))
+        session.commit()
+    return engine
+
+
+def count(engine: Engine, model: Any) -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(model)).one()
+
+
+def test_purge_user_in_batches(engine: Engine) -> None:
+    with Session(engine) as session:
+        session.add(PurgeJob(id=1, user_id=1))
+        session.commit()
+    job = claim_job(engine, NOW, LEASE)
+    assert job is not None and job.status == PurgeStatus.running
+
+    purge_user(engine, job, batch_size=2)
+    with Session(engine) as session:
+        purged = session.get(PurgeJob, 1)
+        assert purged is not None
+        assert purged.status == PurgeStatus.done
+        assert (purged.chats_deleted, purged.messages_deleted) == (2, 6)
+        assert session.get(User, 1) is None
+        assert session.get(User, 2) is not None
+        assert set(session.exec(select(ChatMessage.chat_id)).all()) == {20, 21}
+    assert count(engine, ChatMessageArchive) == 0
+
+
+def test_claim_job_leases(engine: Engine) -> None:
+    with Session(engine) as session:
+        session.add(PurgeJob(id=1, user_id=1))
+        session.add(PurgeJob(id=2, user_id=2))
+        session.commit()
+    first = claim_job(engine, NOW, LEASE)
+    second = claim_job(engine, NOW, LEASE)
+    assert (first and first.id, second and second.id) == (1, 2)
+    assert claim_job(engine, NOW + LEASE / 2, LEASE) is None
+    # The worker of the first job stopped, the job is taken over.
+    taken_over = claim_job(engine, NOW + LEASE * 2, LEASE)
+    assert taken_over is not None and taken_over.id == 1
+
+
+def test_deleting_user_cascades(engine: Engine) -> None:
+    with Session(engine) as session:
+        user = session.get(User, 1)
+        session.delete(user)
+        session.commit()
+    assert count(engine, Chat) == 2
+    assert count(engine, ChatMessage) == 6
+    assert count(engine, ChatMessageArchive) == 0
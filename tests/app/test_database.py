@@ -0,0 +1,39 @@
+import subprocess  # nosec
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from app import database
+
+
+def test_imports_are_lazy() -> None:
+    # Without any settings in the environment, the app, models and routers can be imported,
+    # and neither the database driver nor the hashing and token libraries are loaded.
+    code = (
+        "import sys\n"
+        "import app.database, app.api.dependencies, app.api.users.users_router, app.main\n"
+        "loaded = [m for m in ('psycopg', 'passlib', 'jose', 'yaml') if m in sys.modules]\n"
+        "assert not loaded, loaded\n"
+    )
+    result = subprocess.run(  # nosec
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parents[2],
+        env={}, capture_output=True, text=True, check=False
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_dispose_inherited_engines(monkeypatch: pytest.MonkeyPatch) -> None:
+    engine = create_engine("sqlite://", poolclass=QueuePool)
+    monkeypatch.setattr(database, "engine", engine, raising=False)
+    monkeypatch.setattr(database, "async_engine", None, raising=False)
+    inherited_pool = engine.pool
+    connection = engine.connect()
+    database.dispose_inherited_engines()
+    assert engine.pool is not inherited_pool
+    # The inherited connection is left open for the parent process.
+    assert connection.exec_driver_sql("SELECT 1").scalar() == 1
+    connection.close()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from app.utils.cache import FileInvalidationChannel, TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_ttl() -> None:
+    clock = FakeClock()
+    cache: TTLCache[int] = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    clock.now = 5
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    cache: TTLCache[int] = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_invalidations_reach_other_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "invalidation.log")
+    worker_1: TTLCache[int] = TTLCache(
+        maxsize=10, ttl=60, channel=FileInvalidationChannel(path, poll_interval=0)
+    )
+    worker_2: TTLCache[int] = TTLCache(
+        maxsize=10, ttl=60, channel=FileInvalidationChannel(path, poll_interval=0)
+    )
+    worker_2.set("a", 1)
+    worker_2.set("b", 2)
+
+    worker_1.invalidate("a")
+    assert worker_2.get("a") is None
+    assert worker_2.get("b") == 2
+
+
+def test_truncated_channel_resets_cache(tmp_path: Path) -> None:
+    path = str(tmp_path / "invalidation.log")
+    publisher = FileInvalidationChannel(path, poll_interval=0, max_bytes=4)
+    cache: TTLCache[int] = TTLCache(
+        maxsize=10, ttl=60, channel=FileInvalidationChannel(path, poll_interval=0)
+    )
+    publisher.publish(["abcdef"])
+    cache.set("b", 2)
+    assert cache.get("b") == 2
+    publisher.publish(["x"])
+    assert cache.get("b") is None
+
+
+def test_replaced_channel_resets_reader_past_new_keys(tmp_path: Path) -> None:
+    path = str(tmp_path / "invalidation.log")
+    publisher = FileInvalidationChannel(path, poll_interval=0, max_bytes=8)
+    reader = FileInvalidationChannel(path, poll_interval=0)
+    publisher.publish(["a", "b", "c", "d", "e"])
+    assert reader.poll() == (False, ["a", "b", "c", "d", "e"])
+    # The log is replaced and grows past the reader's offset before the reader polls again.
+    publisher.publish(["f"])
+    publisher.publish(["g", "h", "i", "j", "k", "l"])
+    assert reader.poll()[0] is True
+    assert reader.poll() == (False, [])
+
+
+def test_truncated_channel_is_read_from_the_start(tmp_path: Path) -> None:
+    path = str(tmp_path / "invalidation.log")
+    channel = FileInvalidationChannel(path, poll_interval=0)
+    channel.publish(["abc", "def"])
+    assert channel.poll() == (False, ["abc", "def"])
+    os.truncate(path, 0)
+    channel.publish(["g"])
+    assert channel.poll() == (True, ["g"])
+
+
+def test_async_methods_use_the_channel_off_the_event_loop(tmp_path: Path) -> None:
+    threads: List[int] = []
+
+    class RecordingChannel(FileInvalidationChannel):
+        def publish(self, keys: Iterable[str]) -> None:
+            threads.append(threading.get_ident())
+            super().publish(keys)
+
+        def poll(self) -> Tuple[bool, List[str]]:
+            threads.append(threading.get_ident())
+            return super().poll()
+
+    path = str(tmp_path / "invalidation.log")
+    cache: TTLCache[int] = TTLCache(
+        maxsize=10, ttl=60, channel=RecordingChannel(path, poll_interval=60)
+    )
+    other: TTLCache[int] = TTLCache(
+        maxsize=10, ttl=60, channel=FileInvalidationChannel(path, poll_interval=0)
+    )
+    other.set("a", 1)
+
+    async def run() -> None:
+        cache.set("a", 1)
+        assert await cache.aget("a") == 1
+        # Polled once per interval only.
+        assert await cache.aget("a") == 1
+        await cache.ainvalidate("a")
+        assert await cache.aget("a") is None
+
+    asyncio.run(run())
+    assert len(threads) == 2 and threading.get_ident() not in threads
+    assert other.get("a") is None
@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import zlib
+from typing import AsyncIterator, List, Tuple
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.types import Message
+
+from app.utils.compression import CompressionMiddleware, is_compressible, negotiate_encoding
+
+BODY = b'{"content": "hello"}' * 100
+
+
+def create_app(observed: List[Tuple[str, int, int, float]]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/buffered")
+    def get_buffered() -> Response:
+        return Response(BODY, media_type="application/json", headers={"ETag": '"abc"'})
+
+    @app.get("/not-modified")
+    def get_not_modified() -> Response:
+        return Response(status_code=304, headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    def get_small() -> Response:
+        return Response(b"{}", media_type="application/json")
+
+    @app.get("/image")
+    def get_image() -> Response:
+        return Response(BODY, media_type="image/png")
+
+    @app.get("/encoded")
+    def get_encoded() -> Response:
+        return Response(
+            gzip.compress(BODY), media_type="application/json", headers={"Content-Encoding": "gzip"}
+        )
+
+    @app.get("/stream")
+    def get_stream() -> StreamingResponse:
+        async def content() -> AsyncIterator[bytes]:
+            for i in range(3):
+                yield b'{"id": %d}\n' % i
+
+        return StreamingResponse(content(), media_type="application/x-ndjson")
+
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=500, observer=lambda *args: observed.append(args)
+    )
+    return app
+
+
+@pytest.mark.parametrize("accept_encoding,expected", [
+    ("gzip, deflate", "gzip"),
+    ("deflate, gzip;q=0.5", "deflate"),
+    ("gzip;q=0, deflate;q=0", None),
+    ("*", "gzip"),
+    ("*;q=0.1, deflate", "deflate"),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_encoding(accept_encoding: str, expected: str | None) -> None:
+    assert negotiate_encoding(accept_encoding, ["gzip", "deflate"]) == expected
+
+
+def test_is_compressible() -> None:
+    assert is_compressible("application/json")
+    assert is_compressible("text/html; charset=utf-8")
+    assert is_compressible("application/problem+json")
+    assert not is_compressible("image/png")
+    assert not is_compressible("text/event-stream")
+
+
+def test_buffered_response() -> None:
+    observed: List[Tuple[str, int, int, float]] = []
+    client = TestClient(create_app(observed))
+
+    response = client.get("/buffered", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert response.content == BODY
+    assert len(observed) == 1
+    encoding, uncompressed_size, compressed_size, cpu_time = observed[0]
+    assert encoding == "gzip"
+    assert uncompressed_size == len(BODY)
+    assert compressed_size == int(response.headers["content-length"]) < len(BODY)
+    assert cpu_time >= 0
+
+    response = client.get("/buffered", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"abc"'
+
+
+def test_not_modified_response_matches_the_response_it_revalidates() -> None:
+    client = TestClient(create_app([]))
+
+    response = client.get("/not-modified", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+
+    response = client.get("/not-modified", headers={"Accept-Encoding": "identity"})
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"abc"'
+
+
+@pytest.mark.parametrize("path", ["/small", "/image", "/encoded"])
+def test_uncompressed_response(path: str) -> None:
+    observed: List[Tuple[str, int, int, float]] = []
+    client = TestClient(create_app(observed))
+
+    response = client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert observed == []
+    if path == "/encoded":
+        assert response.content == BODY
+    else:
+        assert "content-encoding" not in response.headers
+
+
+def test_streaming_response_is_compressed_per_chunk() -> None:
+    observed: List[Tuple[str, int, int, float]] = []
+    app = create_app(observed)
+    messages: List[Message] = []
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive() -> Message:
+        if requests:
+            return requests.pop()
+        # The client stays connected until the response ends.
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/stream",
+        "raw_path": b"/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"accept-encoding", b"deflate")],
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+    }
+    asyncio.run(app(scope, receive, send))
+
+    start, *bodies = messages
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"deflate"
+    assert b"content-length" not in headers
+    # Every chunk decompresses on arrival, without waiting for the end of the stream.
+    decompressor = zlib.decompressobj()
+    lines = [decompressor.decompress(body["body"]) for body in bodies if body["body"]]
+    assert lines[:3] == [b'{"id": 0}\n', b'{"id": 1}\n', b'{"id": 2}\n']
+    assert bodies[-1]["more_body"] is False
+    assert decompressor.eof
+    assert [(encoding, size) for encoding, size, *_ in observed] == [("deflate", 30)]
@@ -0,0 +1,131 @@
+import asyncio
+from typing import List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.load_shedding import (
+    AdaptiveConcurrencyLimiter,
+    LoadSheddingMiddleware,
+    Overloaded
+)
+
+
+def create_limiter(now: List[float], **kwargs: float) -> AdaptiveConcurrencyLimiter:
+    options = dict(
+        initial_limit=2,
+        min_limit=1,
+        max_limit=4,
+        target_latency=0.1,
+        max_queue=1,
+        max_queue_wait=0.05,
+        interval=1.0
+    )
+    options.update(kwargs)
+    return AdaptiveConcurrencyLimiter(clock=lambda: now[0], **options)  # type: ignore
+
+
+def test_limiter_queues_and_sheds() -> None:
+    limiter = create_limiter([0.0])
+
+    async def run() -> None:
+        await limiter.acquire()
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # The queue is full.
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        limiter.release(0.01)
+        await queued
+        assert limiter.in_flight == 2
+        # Waiting longer than allowed.
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        assert limiter.in_flight == 2
+
+    asyncio.run(run())
+
+
+def test_limiter_adapts_to_latency() -> None:
+    now = [0.0]
+    limiter = create_limiter(now, initial_limit=3, max_limit=4)
+
+    async def run() -> None:
+        for _ in range(3):
+            await limiter.acquire()
+        # Fast requests while the limit is reached increase it.
+        limiter.release(0.01)
+        limiter.release(0.01)
+        assert limiter.limit == 3
+        now[0] = 1.0
+        limiter.release(0.01)
+        assert limiter.limit == 4
+
+        # Even the fastest request of an interval was slow, the limit is decreased.
+        for _ in range(2):
+            await limiter.acquire()
+        now[0] = 2.0
+        limiter.release(0.5)
+        limiter.release(0.2)
+        assert limiter.limit == 3
+
+    asyncio.run(run())
+
+
+def test_middleware_sheds_with_retry_after() -> None:
+    app = FastAPI()
+    limiter = create_limiter([0.0], initial_limit=1, max_queue=0)
+
+    @app.get("/")
+    def get_root() -> dict:
+        return {}
+
+    @app.get("/metrics")
+    def get_metrics() -> dict:
+        return {}
+
+    app.add_middleware(
+        LoadSheddingMiddleware, limiter=limiter, retry_after=2, exempt_paths=["/metrics"]
+    )
+    client = TestClient(app)
+
+    assert client.get("/").status_code == 200
+    assert limiter.in_flight == 0
+
+    limiter.in_flight = 1
+    response = client.get("/")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert client.get("/metrics").status_code == 200
+
+
+def test_middleware_admits_routes_by_their_own_limiter() -> None:
+    app = FastAPI()
+
+    @app.get("/users")
+    def get_users() -> dict:
+        return {}
+
+    @app.post("/users")
+    def post_users() -> dict:
+        return {}
+
+    limiter = create_limiter([0.0], initial_limit=1, max_queue=0)
+    hashing_limiter = create_limiter([0.0], initial_limit=1, max_queue=0)
+    app.add_middleware(
+        LoadSheddingMiddleware,
+        limiter=limiter,
+        retry_after=1,
+        route_limiters=[("POST /users", hashing_limiter)]
+    )
+    client = TestClient(app)
+
+    hashing_limiter.in_flight = 1
+    assert client.post("/users").status_code == 503
+    assert client.get("/users").status_code == 200
+    limiter.in_flight = 1
+    hashing_limiter.in_flight = 0
+    assert client.post("/users").status_code == 200
+    assert client.get("/users").status_code == 503
@@ -0,0 +1,103 @@
+import json
+import logging
+import queue
+from pathlib import Path
+
+import yaml
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.logging import (
+    DroppingQueueHandler,
+    JSONFormatter,
+    RequestIdMiddleware,
+    SamplingFilter,
+    get_request_id,
+    setup_logging
+)
+
+
+def make_record(name: str = "app.test", level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "Hello %s", ("world",), None)
+
+
+def test_json_formatter() -> None:
+    record = make_record()
+    record.request_id = "abc"
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry["message"] == "Hello world"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app.test"
+    assert entry["request_id"] == "abc"
+    assert entry["timestamp"].endswith("Z")
+
+
+def test_sampling_filter() -> None:
+    log_filter = SamplingFilter(rate=0.0, level="INFO", loggers=["uvicorn.access"])
+    assert not log_filter.filter(make_record("uvicorn.access"))
+    assert log_filter.filter(make_record("uvicorn.access", logging.WARNING))
+    assert log_filter.filter(make_record("app.test"))
+
+
+def test_queue_handler_drops_and_reports_when_full() -> None:
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for _ in range(4):
+        handler.handle(make_record())
+    assert handler.dropped == 2
+
+    handler.queue.get_nowait()
+    handler.handle(make_record())
+    # The report of the dropped records does not fit yet.
+    assert handler.dropped == 2
+
+    handler.queue.get_nowait()
+    handler.queue.get_nowait()
+    handler.handle(make_record())
+    assert handler.dropped == 0
+    assert handler.queue.get_nowait().getMessage() == "Hello world"
+    assert "Dropped 2 log records" in handler.queue.get_nowait().getMessage()
+
+
+def test_queued_logging_writes_through_listener(tmp_path: Path) -> None:
+    log_file = tmp_path / "app.log"
+    config_path = tmp_path / "logging.yaml"
+    config_path.write_text(yaml.safe_dump({
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {"json": {"()": "app.utils.logging.JSONFormatter"}},
+        "handlers": {
+            "file": {"class": "logging.FileHandler", "filename": str(log_file), "formatter": "json"}
+        },
+        "loggers": {"tests.queued": {"level": "INFO", "handlers": ["file"]}},
+    }))
+    setup_logging(str(config_path), queued=True, queue_size=100)
+    logger = logging.getLogger("tests.queued")
+    assert isinstance(logger.handlers[0], DroppingQueueHandler)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Failed")
+    # Setting up logging again stops the listener after it wrote all queued records.
+    setup_logging(str(config_path))
+
+    entry = json.loads(log_file.read_text())
+    assert entry["message"] == "Failed"
+    assert "ValueError: boom" in entry["exc_info"]
+
+
+def test_request_id_middleware() -> None:
+    app = FastAPI()
+    app.add_middleware(RequestIdMiddleware)
+
+    @app.get("/")
+    async def index() -> str | None:
+        return get_request_id()
+
+    client = TestClient(app)
+    response = client.get("/", headers={"X-Request-ID": "request-1"})
+    assert response.json() == "request-1"
+    assert response.headers["X-Request-ID"] == "request-1"
+
+    response = client.get("/")
+    assert len(response.headers["X-Request-ID"]) == 32
+    assert response.json() == response.headers["X-Request-ID"]
@@ -0,0 +1,71 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from app.utils.cache import TTLCache
+from app.utils.metrics import (
+    MetricsMiddleware, cache_observer, generate_metrics, instrument_engine
+)
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_middleware_labels_requests_by_route_template() -> None:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int) -> dict:
+        return {"id": item_id}
+
+    route = dict(method="GET", route="/items/{item_id}")
+    before = sample("http_request_duration_seconds_count", **route)
+    client = TestClient(app)
+    assert client.get("/items/1").status_code == 200
+    assert client.get("/items/2").status_code == 200
+    assert client.get("/items/x").status_code == 422
+    client.get("/missing")
+
+    assert sample("http_request_duration_seconds_count", **route) == before + 3
+    assert sample("http_responses_total", **route, status="422") >= 1
+    assert sample("http_responses_total", method="GET", route="<unmatched>", status="404") >= 1
+    assert sample("http_requests_in_progress", method="GET") == 0
+
+
+def test_instrument_engine_records_queries_and_pool_usage() -> None:
+    engine = create_engine("sqlite://")
+    replica = create_engine("sqlite://", poolclass=QueuePool, pool_size=3)
+    instrument_engine(engine)
+    instrument_engine(replica, "replica0")
+    before = sample("db_query_duration_seconds_count", operation="SELECT")
+    checked_out = sample("db_pool_checked_out_connections", engine="primary")
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert sample("db_pool_checked_out_connections", engine="primary") == checked_out + 1
+        assert sample("db_pool_checked_out_connections", engine="replica0") == 0
+
+    assert sample("db_query_duration_seconds_count", operation="SELECT") == before + 1
+    assert sample("db_pool_checked_out_connections", engine="primary") == checked_out
+    with replica.connect():
+        # Each pool reports its own size.
+        assert sample("db_pool_size", engine="replica0") == 3
+    content, media_type = generate_metrics()
+    assert b"db_query_duration_seconds_bucket" in content
+    assert media_type.startswith("text/plain")
+
+
+def test_cache_observer_counts_hits_and_misses() -> None:
+    cache: TTLCache[int] = TTLCache(maxsize=10, ttl=60, observer=cache_observer("test"))
+    hits = sample("cache_lookups_total", cache="test", result="hit")
+    misses = sample("cache_lookups_total", cache="test", result="miss")
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    assert sample("cache_lookups_total", cache="test", result="hit") == hits + 2
+    assert sample("cache_lookups_total", cache="test", result="miss") == misses + 1
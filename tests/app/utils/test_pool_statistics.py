@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app.utils.pool_statistics import TimedQueuePool, instrument_pool
+
+
+def test_pool_statistics_track_checkouts_and_timeouts() -> None:
+    engine = create_engine(
+        "sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.01
+    )
+    statistics = instrument_pool(engine.pool)
+
+    connection = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    snapshot = statistics.snapshot(engine.pool)
+    assert snapshot.checked_out == 1
+    assert snapshot.checkout_timeouts == 1
+    assert snapshot.wait_time_max >= 0.01
+
+    connection.close()
+    engine.dispose()
+    with engine.connect():
+        pass
+    snapshot = statistics.snapshot(engine.pool)
+    assert snapshot.checked_out == 0
+    assert snapshot.checkouts == 2
+    assert snapshot.connections_created == 2
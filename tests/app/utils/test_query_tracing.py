@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app.utils.query_tracing import QueryTracingMiddleware, instrument_engine, normalize_sql
+
+
+@pytest.mark.parametrize("statement, shape", [
+    (
+        "SELECT chat.id \n  FROM chat WHERE chat.user_id = %(user_id_1)s LIMIT %(param_1)s",
+        "SELECT chat.id FROM chat WHERE chat.user_id = ? LIMIT ?"
+    ),
+    ("SELECT * FROM users WHERE id IN ($1, $2, $3)", "SELECT * FROM users WHERE id IN (?)"),
+    ("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)", "INSERT INTO t (a, b) VALUES (?)"),
+    ("SELECT 'it''s', 42, x::text FROM t_1", "SELECT ?, ?, x::text FROM t_1"),
+])
+def test_normalize_sql(statement: str, shape: str) -> None:
+    assert normalize_sql(statement) == shape
+
+
+def test_middleware_reports_queries_and_flags_n_plus_one(caplog: pytest.LogCaptureFixture) -> None:
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    instrument_engine(engine, slow_query_threshold_ms=0)
+    app = FastAPI()
+    app.add_middleware(QueryTracingMiddleware, n_plus_one_threshold=3)
+
+    @app.get("/items/{count}")
+    def get_items(count: int) -> int:
+        with engine.connect() as connection:
+            for i in range(count):
+                connection.execute(text("SELECT :i"), dict(i=i))
+        return count
+
+    client = TestClient(app)
+    with caplog.at_level(logging.WARNING, logger="app.utils.query_tracing"):
+        response = client.get("/items/2")
+        assert response.headers["Server-Timing"].startswith("db;dur=")
+        assert response.headers["Server-Timing"].endswith('desc="2 queries"')
+        assert "Probable N+1" not in caplog.text
+        assert "Slow query" in caplog.text
+
+        client.get("/items/3")
+        assert "Probable N+1 query in GET /items/{count}, executed 3 times: SELECT ?" in caplog.text
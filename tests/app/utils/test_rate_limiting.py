@@ -0,0 +1,58 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from app.utils.rate_limiting import MemoryBucketStore, SqliteBucketStore
+
+
+def test_memory_bucket_store() -> None:
+    now: List[float] = [0.0]
+    store = MemoryBucketStore(prune_interval=10.0, clock=lambda: now[0])
+
+    assert [store.take("a", rate=2.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take("a", rate=2.0, burst=3) == pytest.approx(0.5)
+    assert store.take("b", rate=2.0, burst=3) == 0.0
+
+    now[0] = 0.5
+    assert store.take("a", rate=2.0, burst=3) == 0.0
+    assert store.take("a", rate=2.0, burst=3) > 0
+
+    # Buckets are pruned once full again.
+    now[0] = 10.0
+    store.take("c", rate=2.0, burst=3)
+    assert len(store) == 1
+
+
+def test_sqlite_bucket_store_is_shared(tmp_path: Path) -> None:
+    path = str(tmp_path / "buckets.sqlite3")
+    # Stores of different processes share the buckets through the file.
+    first, second = SqliteBucketStore(path), SqliteBucketStore(path)
+
+    assert first.take("a", rate=0.1, burst=2) == 0.0
+    assert second.take("a", rate=0.1, burst=2) == 0.0
+    assert 0 < first.take("a", rate=0.1, burst=2) <= 10.0
+    assert second.take("a", rate=0.1, burst=2) > 0
+    assert second.take("b", rate=0.1, burst=2) == 0.0
+    assert first.take("c", rate=0.1, burst=2, cost=3) == float("inf")
+
+
+def test_sqlite_bucket_store_lets_requests_through_on_errors(tmp_path: Path) -> None:
+    store = SqliteBucketStore(str(tmp_path / "missing" / "buckets.sqlite3"))
+    assert [store.take("a", rate=0.1, burst=1) for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_sqlite_bucket_store_does_not_wait_long_for_locks(tmp_path: Path) -> None:
+    path = str(tmp_path / "buckets.sqlite3")
+    store = SqliteBucketStore(path, timeout=0.05)
+    assert store.take("a", rate=0.1, burst=1) == 0.0
+
+    other_process = sqlite3.connect(path, isolation_level=None)
+    other_process.execute("BEGIN EXCLUSIVE")
+    start = time.monotonic()
+    assert store.take("a", rate=0.1, burst=1) == 0.0
+    assert time.monotonic() - start < 0.5
+    other_process.execute("ROLLBACK")
+    assert store.take("a", rate=0.1, burst=1) > 0
@@ -0,0 +1,111 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import tests.init_main  # noqa: F401
+from app import database
+from app.api.dependencies import get_db_session
+from app.api.users.users_schema import User
+from app.utils.replicas import (
+    PIN_COOKIE,
+    Replica,
+    ReplicaRoutingMiddleware,
+    choose_replica,
+    track_health,
+    track_writes
+)
+
+
+def create_database(path: Path, emails: List[str]) -> Engine:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for email in emails:
+            session.add(User(email=email, name=email, password_hash="x"))
+        session.commit()
+    return engine
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/emails")
+    async def get_emails(db: AsyncSession = Depends(get_db_session)) -> List[str]:
+        return [user.email for user in (await db.exec(select(User))).all()]
+
+    @app.post("/emails/{email}")
+    async def add_email(email: str, db: AsyncSession = Depends(get_db_session)) -> None:
+        db.add(User(email=email, name=email, password_hash="x"))
+        await db.commit()
+
+    app.add_middleware(ReplicaRoutingMiddleware, read_your_writes_window=60)
+    return app
+
+
+def make_replica(engine: Engine, weight: float = 1.0) -> Replica:
+    return Replica(engine, None, weight, cooldown=30)
+
+
+def test_reads_go_to_replica_until_client_writes(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Two SQLite files stand in for the primary and a lagging replica.
+    primary = create_database(tmp_path / "primary.db", ["a@email.com", "b@email.com"])
+    replica = create_database(tmp_path / "replica.db", ["a@email.com"])
+    track_writes(primary)
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [make_replica(replica)])
+    client = TestClient(create_app())
+
+    assert client.get("/emails").json() == ["a@email.com"]
+
+    response = client.post("/emails/c@email.com")
+    assert response.status_code == 200
+    assert PIN_COOKIE in response.cookies
+    # The client now reads its own write from the primary.
+    assert client.get("/emails").json() == ["a@email.com", "b@email.com", "c@email.com"]
+
+    client.cookies.clear()
+    assert client.get("/emails").json() == ["a@email.com"]
+
+
+def test_choose_replica_by_weight_and_health() -> None:
+    engine = create_engine("sqlite://")
+    heavy, light, disabled = (make_replica(engine, weight) for weight in (9, 1, 0))
+    choices = [choose_replica([heavy, light, disabled]) for _ in range(1000)]
+    assert disabled not in choices
+    assert 800 < choices.count(heavy) < 980
+
+    heavy.mark_unhealthy()
+    assert {choose_replica([heavy, light]) for _ in range(100)} == {light}
+    light.mark_unhealthy()
+    assert choose_replica([heavy, light]) is None
+
+
+def test_connection_failure_marks_replica_unhealthy(tmp_path: Path) -> None:
+    replica = make_replica(create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"))
+    track_health(replica)
+    with pytest.raises(Exception):
+        replica.engine.connect()
+    assert not replica.healthy
+
+
+def test_failing_replica_falls_back_to_primary(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    primary = create_database(tmp_path / "primary.db", ["a@email.com"])
+    replica = make_replica(create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"))
+    track_health(replica)
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "replicas", [replica])
+
+    assert TestClient(create_app()).get("/emails").json() == ["a@email.com"]
+    assert not replica.healthy
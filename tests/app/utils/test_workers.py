@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+from app.utils.workers import available_cpus, check_implementations
+
+
+def test_available_cpus_without_quota(tmp_path: Path) -> None:
+    unlimited = available_cpus(str(tmp_path / "missing"))
+    assert unlimited >= 1
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("max 100000\n")
+    assert available_cpus(str(cpu_max)) == unlimited
+
+
+def test_available_cpus_with_quota(tmp_path: Path) -> None:
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("50000 100000\n")
+    assert available_cpus(str(cpu_max)) == 1
+    cpu_max.write_text(f"{1000 * 100000} 100000\n")
+    assert available_cpus(str(cpu_max)) == available_cpus(str(tmp_path / "missing"))
+
+
+def test_check_implementations(monkeypatch: pytest.MonkeyPatch) -> None:
+    check_implementations("asyncio", "h11")
+    check_implementations("auto", "auto")
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+    with pytest.raises(RuntimeError, match="uvloop"):
+        check_implementations("uvloop", "auto")
@@ -0,0 +1,35 @@
+from benchmarks.load_benchmark import Sample, compare_reports, percentile, summarize
+
+
+def make_report(latency: float, queries: int, rps: float) -> dict:
+    samples = [Sample("read_history", latency * (i + 1) / 1000, queries, True) for i in range(100)]
+    stats = summarize(samples, duration=len(samples) / rps)
+    return {"total": stats, "scenarios": {"read_history": stats}}
+
+
+def test_percentile_interpolates() -> None:
+    assert percentile([], 50) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile([1.0, 2.0], 95) == 1.95
+
+
+def test_summarize() -> None:
+    stats = summarize([Sample("login", 0.01, 1, True), Sample("login", 0.03, 3, False)], 2.0)
+    assert stats["requests"] == 2
+    assert stats["errors"] == 1
+    assert stats["throughput_rps"] == 1.0
+    assert stats["latency_ms"]["p50"] == 20.0
+    assert stats["queries_per_request"] == {"mean": 2.0, "max": 3}
+
+
+def test_compare_reports_within_threshold() -> None:
+    baseline = make_report(latency=10, queries=2, rps=100)
+    assert compare_reports(baseline, make_report(latency=10.5, queries=2, rps=96), 0.1) == []
+
+
+def test_compare_reports_detects_regressions() -> None:
+    baseline = make_report(latency=10, queries=2, rps=100)
+    regressions = compare_reports(baseline, make_report(latency=12, queries=3, rps=80), 0.1)
+    assert any(r.startswith("total: throughput") for r in regressions)
+    assert any(r.startswith("read_history: latency p95") for r in regressions)
+    assert any(r.startswith("read_history: queries per request") for r in regressions)
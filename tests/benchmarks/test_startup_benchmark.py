@@ -0,0 +1,38 @@
+from benchmarks.startup_benchmark import (
+    check_budgets,
+    compare_reports,
+    parse_importtime,
+    slowest_imports
+)
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2100 |       5400 |     sqlalchemy.engine
+import time:      3000 |       8400 |   sqlalchemy
+import time:       900 |      12000 | app.main
+"""
+
+
+def test_parse_importtime() -> None:
+    cumulative = parse_importtime(IMPORTTIME_OUTPUT)
+    assert cumulative == {
+        "_io": 120, "sqlalchemy.engine": 5400, "sqlalchemy": 8400, "app.main": 12000
+    }
+    assert slowest_imports(cumulative, count=2) == [("sqlalchemy", 8.4), ("_io", 0.12)]
+
+
+def test_check_budgets() -> None:
+    report = {"import_ms": 900.0, "first_response_ms": 1500.0}
+    assert check_budgets(report, {"import_ms": 1000.0, "first_response_ms": None}) == []
+    failures = check_budgets(report, {"import_ms": 800.0, "first_response_ms": 2000.0})
+    assert len(failures) == 1 and failures[0].startswith("import_ms")
+
+
+def test_compare_reports() -> None:
+    baseline = {"import_ms": 1000.0, "first_response_ms": 2000.0}
+    assert compare_reports(baseline, {"import_ms": 1100.0, "first_response_ms": 2100.0}, 0.2) == []
+    regressions = compare_reports(
+        baseline, {"import_ms": 1300.0, "first_response_ms": 2100.0}, 0.2
+    )
+    assert regressions == ["import_ms 1000.0 -> 1300.0 (+30.0%)"]